@@ -1,4 +1,5 @@
 from mspray.apps.main.models import Location
+from mspray.apps.main.models.location import BBOX_SELECT
 from mspray.apps.main.query import get_location_qs
 
 
@@ -8,12 +9,7 @@ def get_district_summary_data():
     """
     from mspray.apps.main.serializers import DistrictSerializer
     queryset = Location.objects.filter(level='district')
-    queryset = get_location_qs(queryset).extra(select={
-            "xmin": 'ST_xMin("main_location"."geom")',
-            "ymin": 'ST_yMin("main_location"."geom")',
-            "xmax": 'ST_xMax("main_location"."geom")',
-            "ymax": 'ST_yMax("main_location"."geom")'
-        }).values(
+    queryset = get_location_qs(queryset).extra(select=BBOX_SELECT).values(
             'pk', 'code', 'level', 'name', 'parent', 'structures',
             'xmin', 'ymin', 'xmax', 'ymax', 'num_of_spray_areas',
             'num_new_structures', 'total_structures', 'visited', 'sprayed'
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+GeoJSON feature collections built by PostGIS.
+
+The features of a queryset are built with ST_AsGeoJSON and json_build_object
+in the database and streamed to the client in chunks from a server side
+cursor, the records are never loaded into Python.
+"""
+from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.http import StreamingHttpResponse
+
+GEOJSON_CHUNK_SIZE = getattr(settings, "MSPRAY_GEOJSON_CHUNK_SIZE", 1000)
+GEOJSON_MAX_PRECISION = 15
+GEOJSON_PRECISION = getattr(
+    settings, "MSPRAY_GEOJSON_PRECISION", GEOJSON_MAX_PRECISION
+)
+FEATURES_SQL = """
+SELECT json_build_object('id', "{table}"."{pk}", 'type', 'Feature', 'geometry', ST_AsGeoJSON("{table}"."{geom}", %s)::json, 'properties', json_build_object({properties}){members})::text
+FROM "{table}"{lateral}
+WHERE "{table}"."{pk}" IN ({query})
+ORDER BY "{table}"."{pk}"
+"""  # noqa
+FEATURE_COLLECTION_START = '{"type": "FeatureCollection", "features": ['
+FEATURE_COLLECTION_END = "]}"
+
+
+def get_geojson_precision(request):
+    """
+    Returns the number of decimal places of coordinates from the precision
+    query parameter of a request, GEOJSON_PRECISION when it is missing.
+    """
+    try:
+        precision = int(request.query_params.get("precision"))
+    except (TypeError, ValueError):
+        return GEOJSON_PRECISION
+
+    return max(0, min(precision, GEOJSON_MAX_PRECISION))
+
+
+def _json_members(members, params):
+    sql = []
+    for name, expression, expression_params in members:
+        sql.append("'{}', {}".format(name, expression))
+        params.extend(expression_params)
+
+    return ", ".join(sql)
+
+
+def get_features_sql(
+    queryset,
+    geo_field="geom",
+    precision=GEOJSON_PRECISION,
+    properties=(),
+    members=(),
+    lateral=("", []),
+):
+    """
+    Returns the SQL and params of a query that returns a GeoJSON feature per
+    record of queryset, ordered by primary key.
+
+    Every concrete field other than the primary key and geo_field is a
+    feature property. properties and members are (name, sql, params) tuples
+    of extra feature properties and extra members of the feature object,
+    lateral is the (sql, params) of a join that their expressions may use.
+    """
+    opts = queryset.model._meta
+    table = opts.db_table
+    params = [precision]
+    fields = []
+    for field in opts.concrete_fields:
+        if field.primary_key or field.name == geo_field:
+            continue
+        column = '"{}"."{}"'.format(table, field.column)
+        if isinstance(field, GeometryField):
+            column = "ST_AsGeoJSON({}, %s)::json".format(column)
+            fields.append((field.name, column, [precision]))
+        else:
+            fields.append((field.name, column, []))
+    properties_sql = _json_members(fields + list(properties), params)
+    members_sql = _json_members(members, params)
+    params.extend(lateral[1])
+    query, query_params = (
+        queryset.order_by().values("pk").query.sql_with_params()
+    )
+    params.extend(query_params)
+    sql = FEATURES_SQL.format(
+        table=table,
+        pk=opts.pk.column,
+        geom=opts.get_field(geo_field).column,
+        properties=properties_sql,
+        members=", " + members_sql if members_sql else "",
+        lateral=lateral[0],
+        query=query,
+    )
+
+    return sql, params
+
+
+def iter_geojson(queryset, chunk_size=GEOJSON_CHUNK_SIZE, **kwargs):
+    """
+    Yields a GeoJSON FeatureCollection of queryset in chunks of chunk_size
+    features, kwargs are passed to get_features_sql().
+    """
+    try:
+        sql, params = get_features_sql(queryset, **kwargs)
+    except EmptyResultSet:
+        yield FEATURE_COLLECTION_START + FEATURE_COLLECTION_END
+        return
+
+    yield FEATURE_COLLECTION_START
+    with connections[queryset.db].chunked_cursor() as cursor:
+        cursor.execute(sql, params)
+        separator = ""
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield separator + ",".join(row[0] for row in rows)
+            separator = ","
+    yield FEATURE_COLLECTION_END
+
+
+def streaming_geojson_response(queryset, **kwargs):
+    """
+    Returns a StreamingHttpResponse of the GeoJSON FeatureCollection of
+    queryset, kwargs are passed to iter_geojson().
+    """
+    return StreamingHttpResponse(
+        iter_geojson(queryset, **kwargs), content_type="application/json"
+    )
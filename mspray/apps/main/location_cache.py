@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Versioned cache keys of location indicators.
+
+Every location has a version in the cache and the cached values of a location
+are keyed by its version. A submission bumps the versions of its spray area,
+RHC and district which invalidates their cached values at once, the values of
+other locations are left in the cache.
+"""
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+LOCATION_CACHE_TIMEOUT = getattr(
+    settings, "MSPRAY_LOCATION_CACHE_TIMEOUT", DEFAULT_TIMEOUT
+)
+LOCATION_VERSION_KEY = "location-version-{}"
+
+
+def get_location_versions(location_ids):
+    """
+    Returns a dict of the cache version of each location in location_ids,
+    a version is set for locations that do not have one yet.
+    """
+    keys = {LOCATION_VERSION_KEY.format(pk): pk for pk in set(location_ids)}
+    versions = {
+        keys[key]: version for key, version in cache.get_many(keys).items()
+    }
+    for key, pk in keys.items():
+        if pk not in versions:
+            cache.add(key, uuid4().hex, None)
+            versions[pk] = cache.get(key)
+
+    return versions
+
+
+def get_location_version(location_id):
+    """Returns the cache version of a location."""
+    return get_location_versions([location_id])[location_id]
+
+
+def location_cache_key(key, location_id, version=None):
+    """
+    Returns the cache key of a location value, key is formatted with the
+    location id and suffixed with the location version.
+    """
+    if version is None:
+        version = get_location_version(location_id)
+
+    return "{}:{}".format(key.format(location_id), version)
+
+
+def bump_location_versions(location_ids):
+    """Invalidates the cached values of the locations in location_ids."""
+    location_ids = set(pk for pk in location_ids if pk is not None)
+    if location_ids:
+        cache.set_many(
+            {
+                LOCATION_VERSION_KEY.format(pk): uuid4().hex
+                for pk in location_ids
+            },
+            None,
+        )
@@ -0,0 +1,38 @@
+# -*- coding=utf-8 -*-
+"""
+Backfill the SprayDay columns promoted from the submission data.
+"""
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from mspray.apps.main.utils import (
+    SPRAYDAY_DATA_FIELDS_BATCH_SIZE,
+    backfill_sprayday_data_fields,
+)
+
+
+class Command(BaseCommand):
+    """
+    Set the sprayformid, unsprayed reason, submission time and structure key
+    columns of every SprayDay from its data.
+    """
+
+    help = _("Backfill the SprayDay columns promoted from the data field")
+
+    def add_arguments(self, parser):
+        """Command arguments"""
+        parser.add_argument(
+            "-b",
+            "--batch-size",
+            default=SPRAYDAY_DATA_FIELDS_BATCH_SIZE,
+            dest="batch_size",
+            type=int,
+            help=_("The number of submissions updated in one query."),
+        )
+
+    def handle(self, *args, **options):
+        """
+        Actually do the work!
+        """
+        updated = backfill_sprayday_data_fields(options["batch_size"])
+        self.stdout.write(_("Updated %d submissions.") % updated)
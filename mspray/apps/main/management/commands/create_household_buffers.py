@@ -21,15 +21,25 @@ class Command(BaseCommand):
         )
         parser.add_argument("-f", "--force", default=False, dest="recreate")
         parser.add_argument("-t", "--target", default=False, dest="target")
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="is_async",
+            help="Create the buffers of each spray area in a celery task",
+        )
 
     def handle(self, *args, **options):
         distance = options.get("distance")
         recreate = options.get("recreate")
         target = options.get("target")
+        is_async = options.get("is_async")
         count = HouseholdsBuffer.objects.count()
 
         utils.create_households_buffer(
-            distance=distance, recreate=recreate, target=target
+            distance=distance,
+            recreate=recreate,
+            target=target,
+            is_async=is_async,
         )
 
         after_count = HouseholdsBuffer.objects.count()
@@ -6,12 +6,13 @@ from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import gettext as _
 
 from mspray.apps.main.models import Location
-from mspray.apps.main.utils import link_new_structures_to_existing
+from mspray.apps.main.utils import link_new_structures
 
 
 class Command(BaseCommand):
     """
-    Link new structures to existing households within a target area
+    Link new structures to existing households within a target area, or
+    within every target area of a health facility or district
 
     This is done by checking if the new point is close to any existing
     structure and then attaching that new point to that existing structure
@@ -24,6 +25,20 @@ class Command(BaseCommand):
         parser.add_argument(
             "location_id", type=int, help=_("The location_id.")
         )
+        parser.add_argument(
+            "-d",
+            "--distance",
+            default=10,
+            dest="distance",
+            type=float,
+            help=_("The distance, in metres, used to match structures."),
+        )
+        parser.add_argument(
+            "--async",
+            action="store_true",
+            dest="is_async",
+            help=_("Link the structures of each target area in a celery task"),
+        )
 
     def handle(self, *args, **options):
         """
@@ -39,4 +54,12 @@ class Command(BaseCommand):
             except Location.DoesNotExist:
                 raise CommandError(_("Location does not exist."))
             else:
-                link_new_structures_to_existing(target_area=location)
+                linked = link_new_structures(
+                    location,
+                    distance=options["distance"],
+                    is_async=options["is_async"],
+                )
+                if not options["is_async"]:
+                    self.stdout.write(
+                        _("Linked %d new structures.") % linked
+                    )
@@ -12,6 +12,7 @@ from django.db.utils import IntegrityError
 from django.utils.translation import gettext as _
 
 from mspray.apps.main.models import Location
+from mspray.apps.main.models.location import update_location_geometries
 
 
 def get_parent(geom, parent_level, parent_name):
@@ -231,6 +232,8 @@ class Command(BaseCommand):
                         else:
                             updated += 1
 
+                update_location_geometries(
+                    Location.objects.filter(level=level))
                 self.stdout.write(
                     "Created %s locations, %s updated, failed %s, skipped %s, "
                     "error %s" % (count, updated, failed, skipped,
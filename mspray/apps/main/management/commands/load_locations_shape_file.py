@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import gettext as _
 
 from mspray.apps.main.models import Location
+from mspray.apps.main.models.location import update_location_geometries
 
 
 class Command(BaseCommand):
@@ -68,6 +69,7 @@ class Command(BaseCommand):
                 code_is_integer = options['code_is_integer']
                 count = 0
                 failed = 0
+                updated = []
                 srs = SpatialReference('+proj=longlat +datum=WGS84 +no_defs')
                 ds = DataSource(path)
                 layer = ds[0]
@@ -91,8 +93,11 @@ class Command(BaseCommand):
                             geom = feature.geom.transform(srs, True)
                         location.geom = geom.wkt
                         location.save()
+                        updated.append(location.pk)
                         count += 1
 
+                update_location_geometries(
+                    Location.objects.filter(pk__in=updated))
                 self.stdout.write("Updated {} locations, failed {}".format(
                     count, failed
                 ))
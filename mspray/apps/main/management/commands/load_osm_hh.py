@@ -8,11 +8,10 @@ import os
 from django.core.management.base import BaseCommand
 from django.utils.translation import gettext as _
 
-from mspray.apps.main.models import Household
 from mspray.apps.main.tasks import process_osm_file
 
 
-def handle_osm_file(path, is_async, stdout):
+def handle_osm_file(path, is_async, stdout, update=False):
     """Process an OSM file.
 
     Arguments:
@@ -20,19 +19,21 @@ def handle_osm_file(path, is_async, stdout):
     path - file path to an OSM file.
     is_async - boolean of whether to process file asynchronously or not.
     stdout - standard output to print progress to
+    update - boolean of whether to update existing structures or skip them.
     """
-    count = Household.objects.count()
     if is_async:
-        process_osm_file.delay(path)
-    else:
-        process_osm_file(path)
-    after_count = Household.objects.count()
+        process_osm_file.delay(path, update=update)
+        stdout.write("Queued {}.".format(path))
+        return
+
+    counts = process_osm_file(path, update=update)
     stdout.write(
-        "{} structures added from {}.".format((after_count - count), path)
+        "{inserted} structures added, {updated} updated and {skipped} skipped "
+        "from {path}.".format(path=path, **counts)
     )
 
 
-def handle_osm_directory(osm_directory, is_async, stdout):
+def handle_osm_directory(osm_directory, is_async, stdout, update=False):
     """Process OSM directory with OSM files.
 
     Arguments:
@@ -40,12 +41,13 @@ def handle_osm_directory(osm_directory, is_async, stdout):
     osm_directory - path to an OSM directory
     is_async - boolean of whether to process file asynchronously or not.
     stdout - standard output to print progress to
+    update - boolean of whether to update existing structures or skip them.
     """
     if os.path.isdir(osm_directory):
         entries = os.scandir(osm_directory)
         for entry in entries:
             if os.path.isdir(entry.path):
-                handle_osm_directory(entry.path, is_async, stdout)
+                handle_osm_directory(entry.path, is_async, stdout, update)
             else:
                 is_osm_file = entry.name.endswith(
                     ".osm"
@@ -53,7 +55,7 @@ def handle_osm_directory(osm_directory, is_async, stdout):
                 is_file = entry.is_file()
                 if not is_osm_file or (is_osm_file and not is_file):
                     continue
-                handle_osm_file(entry.path, is_async, stdout)
+                handle_osm_file(entry.path, is_async, stdout, update)
 
 
 class Command(BaseCommand):
@@ -69,13 +71,20 @@ class Command(BaseCommand):
             dest="is_async",
             help="Whether to process asynchronously",
         )
+        parser.add_argument(
+            "--update",
+            action="store_true",
+            dest="update",
+            help="Whether to update structures that already exist",
+        )
 
     def handle(self, *args, **options):
         osmfile = options.get("osmfolder")
         is_async = options.get("is_async")
+        update = options.get("update")
         if osmfile:
             if os.path.isdir(osmfile):
-                handle_osm_directory(osmfile, is_async, self.stdout)
+                handle_osm_directory(osmfile, is_async, self.stdout, update)
             else:
                 path = os.path.abspath(osmfile)
-                handle_osm_file(path, is_async, self.stdout)
+                handle_osm_file(path, is_async, self.stdout, update)
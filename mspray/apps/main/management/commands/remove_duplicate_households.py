@@ -1,12 +1,9 @@
 from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import gettext as _
-from django.db.models import Count
-from django.db import transaction, IntegrityError
 
-from mspray.apps.main.models import Household
-from mspray.apps.main.models import SprayDay
 from mspray.apps.main.models import Location
 from mspray.apps.main.tasks import add_unique_record
+from mspray.apps.main.utils import remove_household_duplicates
 
 
 class Command(BaseCommand):
@@ -20,6 +17,8 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--field', dest='field', default='bgeom',
                             help='The field to use to get duplicates.')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+                            help='Report duplicates without removing them.')
 
     def handle(self, *args, **options):
         try:
@@ -30,63 +29,32 @@ class Command(BaseCommand):
             if field not in self.allowed_fields:
                 raise CommandError(_("Only 'geom' or 'bgeom' fields are "
                                      "supported at this time."))
-
-        location_with_duplicates = Household.objects.filter().values(field)\
-            .annotate(k=Count('id'))\
-            .filter(k__gt=1)\
-            .values_list('location', flat=True).distinct()
-        for location_id in location_with_duplicates:
-            try:
-                hh_dupes = Household.objects.filter(location_id=location_id)\
-                    .values(field).annotate(k=Count('id')).filter(k__gt=1)
-
-                to_delete = []
-                total_deleted = 0
-                total = hh_dupes.count()
-                location = Location.objects.get(pk=location_id)
-
-                for household in hh_dupes:
-                    filter_kwargs = {field: household[field]}
-                    matching_hh = Household.objects.filter(**filter_kwargs)
-                    if matching_hh.count() > 1:
-                        osmids = Household.objects.filter(**filter_kwargs)\
-                            .values('hh_id')
-                        submissions = SprayDay.objects.filter(
-                                        osmid__in=osmids).values_list(
-                                        'osmid', flat=True).order_by(
-                                                'spray_date',
-                                                'submission_id')
-                        number_submitted = submissions.count()
-                        if number_submitted == 0:
-                            additonal = [x.id for x in matching_hh.exclude(
-                                pk=matching_hh.first().pk)]
-                        else:
-                            additonal = [x.id for x in matching_hh.exclude(
-                                hh_id=submissions.first())]
-                        to_delete = to_delete + additonal
-                to_delete = list(set(to_delete))
-                total_deleted = len(to_delete)
-                with transaction.atomic():
-                    if total_deleted > total:
-                        raise IntegrityError
-                    else:
-                        Household.objects.filter(id__in=to_delete).delete()
-            except IntegrityError:
-                self.stderr.write(
-                    "Error: %s of %s household duplicates in %s NOT "
-                    "succussfully deleted." % (total_deleted, total, location))
-            else:
-                submissions = location.sprayday_set.all().filter(
-                    osmid__gt=0).order_by('spray_date',
-                                          'submission_id')
-
-                for submission in submissions:
-                    submission.spraypoint_set.all().delete()
-                    add_unique_record(submission.pk, submission.
-                                      location_id)
-
-                location.structures = location.household_set.all().count()
-                location.save()
-                self.stdout.write("%s of %s household duplicates in "
-                                  "%s have been succussfully deleted."
-                                  % (total_deleted, total, location))
+        dry_run = options.get('dry_run')
+
+        report = remove_household_duplicates(match=field, dry_run=dry_run)
+        total = sum(len(dups) for _kept, dups in report['clusters'])
+        if dry_run:
+            for kept, dups in report['clusters']:
+                self.stdout.write("Keep %s, delete %s" % (
+                    kept, ", ".join(str(dup) for dup in dups)))
+            self.stdout.write(
+                "%s household duplicates in %s locations with %s "
+                "submissions would be deleted."
+                % (total, len(report['locations']), report['submissions']))
+            return
+
+        for location in Location.objects.filter(pk__in=report['locations']):
+            submissions = location.sprayday_set.all().filter(
+                osmid__gt=0).order_by('spray_date', 'submission_id')
+
+            for submission in submissions:
+                submission.spraypoint_set.all().delete()
+                add_unique_record(submission.pk, submission.location_id)
+
+            location.structures = location.household_set.all().count()
+            location.save(update_fields=['structures'])
+
+        self.stdout.write("%s of %s household duplicates in %s locations "
+                          "have been succussfully deleted."
+                          % (report['deleted'], total,
+                             len(report['locations'])))
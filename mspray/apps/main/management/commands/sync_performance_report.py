@@ -2,9 +2,8 @@ from django.core.management.base import BaseCommand
 from django.utils.translation import gettext as _
 
 from mspray.apps.main.models import SprayDay
+from mspray.apps.main.utils import build_performance_reports
 from mspray.apps.main.utils import find_missing_performance_report_records
-from mspray.apps.main.utils import performance_report
-from mspray.apps.main.utils import queryset_iterator
 
 
 class Command(BaseCommand):
@@ -13,9 +12,5 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         missing_sprayformids = find_missing_performance_report_records()
 
-        queryset = SprayDay.objects.filter(
-            data__sprayformid__in=missing_sprayformids).distinct(
-            'spray_operator')
-
-        for record in queryset_iterator(queryset):
-            performance_report(record.spray_operator)
+        build_performance_reports(SprayDay.objects.filter(
+            sprayformid__in=missing_sprayformids))
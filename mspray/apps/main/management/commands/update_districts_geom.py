@@ -3,6 +3,7 @@ from django.core.management.base import BaseCommand
 from django.utils.translation import gettext as _
 
 from mspray.apps.main.models import Location
+from mspray.apps.main.models.location import update_location_geometries
 
 
 class Command(BaseCommand):
@@ -26,3 +27,4 @@ class Command(BaseCommand):
                     self.stdout.write("Saved {} with {} items".format(
                         district.name, len(items)
                     ))
+        update_location_geometries(Location.objects.filter(level='district'))
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.3 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0062_performancereport_data'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='rollup_pending',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
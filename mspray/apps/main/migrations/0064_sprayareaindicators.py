@@ -0,0 +1,27 @@
+# Generated by Django 2.1.3 on 2026-10-18 10:05
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0063_location_rollup_pending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SprayAreaIndicators',
+            fields=[
+                ('location', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='spray_area_indicators', serialize=False, to='main.Location')),
+                ('not_sprayable', models.PositiveIntegerField(default=0)),
+                ('new_structures', models.PositiveIntegerField(default=0)),
+                ('duplicates', models.PositiveIntegerField(default=0)),
+                ('visited_sprayed', models.PositiveIntegerField(default=0)),
+                ('structures_on_ground', models.PositiveIntegerField(default=0)),
+                ('visited_found', models.PositiveIntegerField(default=0)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.1.3 on 2026-10-18 12:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0064_sprayareaindicators'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='householdsbuffer',
+            name='checksum',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
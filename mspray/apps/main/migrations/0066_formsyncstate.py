@@ -0,0 +1,25 @@
+# Generated by Django 2.1.3 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0065_householdsbuffer_checksum'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormSyncState',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('formid', models.CharField(max_length=50, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('last_edited', models.CharField(blank=True, default='', max_length=50)),
+                ('last_modified', models.CharField(blank=True, default='', max_length=50)),
+                ('created_on', models.DateTimeField(auto_now_add=True)),
+                ('modified_on', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
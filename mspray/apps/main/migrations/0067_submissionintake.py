@@ -0,0 +1,26 @@
+# Generated by Django 2.1.3 on 2026-10-18 15:20
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0066_formsyncstate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubmissionIntake',
+            fields=[
+                ('submission_id', models.PositiveIntegerField(primary_key=True, serialize=False)),
+                ('data', django.contrib.postgres.fields.jsonb.JSONField(default=dict)),
+                ('edited', models.CharField(blank=True, default='', max_length=50)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('received_on', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,97 @@
+# Generated by Django 2.1.3 on 2026-10-18 16:20
+
+from django.conf import settings
+from django.contrib.postgres.fields.jsonb import KeyTextTransform
+from django.db import migrations, models
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+
+BATCH_SIZE = 5000
+DATA_KEY_FIELDS = {
+    'has_osm_way': 'osmstructure:way:id',
+    'has_osm_node': 'osmstructure:node:id',
+    'has_new_osm_node': 'newstructure/gps_osm_file:node:id',
+    'has_new_structure_gps': 'newstructure/gps',
+}
+
+
+def backfill_data_fields(apps, schema_editor):
+    """
+    Set the new columns from the data of existing submissions, BATCH_SIZE
+    submissions at a time in primary key ranges.
+    """
+    SprayDay = apps.get_model('main', 'SprayDay')
+    expressions = {
+        'sprayformid': KeyTextTransform('sprayformid', 'data'),
+        'unsprayed_reason': KeyTextTransform(
+            settings.MSPRAY_UNSPRAYED_REASON_FIELD, 'data'),
+        'submission_time': Cast(
+            KeyTextTransform('_submission_time', 'data'),
+            models.DateTimeField()),
+    }
+    for field, key in DATA_KEY_FIELDS.items():
+        expressions[field] = Case(
+            When(data__has_key=key, then=Value(True)),
+            default=Value(False),
+            output_field=models.BooleanField())
+
+    start = 0
+    while True:
+        pks = list(
+            SprayDay.objects.filter(pk__gt=start).order_by('pk').values_list(
+                'pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            break
+        SprayDay.objects.filter(
+            pk__gte=pks[0], pk__lte=pks[-1]).update(**expressions)
+        start = pks[-1]
+
+
+class Migration(migrations.Migration):
+
+    # each batch of the backfill is committed on its own
+    atomic = False
+
+    dependencies = [
+        ('main', '0067_submissionintake'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sprayday',
+            name='sprayformid',
+            field=models.CharField(db_index=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='sprayday',
+            name='unsprayed_reason',
+            field=models.CharField(db_index=True, max_length=255, null=True),
+        ),
+        migrations.AddField(
+            model_name='sprayday',
+            name='submission_time',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='sprayday',
+            name='has_osm_way',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='sprayday',
+            name='has_osm_node',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='sprayday',
+            name='has_new_osm_node',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='sprayday',
+            name='has_new_structure_gps',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(
+            backfill_data_fields, migrations.RunPython.noop, atomic=False),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.1.3 on 2026-10-18 18:05
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+# the simplified geometries are generated with the default tolerances, use
+# update_location_geometries() to regenerate them with other tolerances
+UPDATE_LOCATION_GEOMETRIES_SQL = """
+UPDATE "main_location" SET
+"geom_low" = ST_Multi(ST_SimplifyPreserveTopology("geom", 0.01)),
+"geom_medium" = ST_Multi(ST_SimplifyPreserveTopology("geom", 0.001)),
+"geom_high" = ST_Multi(ST_SimplifyPreserveTopology("geom", 0.0001)),
+"bbox_xmin" = ST_XMin("geom"),
+"bbox_ymin" = ST_YMin("geom"),
+"bbox_xmax" = ST_XMax("geom"),
+"bbox_ymax" = ST_YMax("geom");
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0068_sprayday_data_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='geom_low',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(
+                null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geom_medium',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(
+                null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='geom_high',
+            field=django.contrib.gis.db.models.fields.MultiPolygonField(
+                null=True, srid=4326),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='bbox_xmin',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='bbox_ymin',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='bbox_xmax',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='bbox_ymax',
+            field=models.FloatField(null=True),
+        ),
+        migrations.RunSQL(
+            UPDATE_LOCATION_GEOMETRIES_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 2.1.3 on 2026-10-18 21:10
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0069_location_simplified_geoms'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='formsyncstate',
+            name='last_modified',
+        ),
+    ]
@@ -25,3 +25,6 @@ from .weekly_report import WeeklyReport  # noqa
 from .sensitization_visit import SensitizationVisit  # noqa
 from .mobilisation import Mobilisation  # noqa
 from .decision import Decision  # noqa
+from .spray_area_indicators import SprayAreaIndicators  # noqa
+from .form_sync_state import FormSyncState  # noqa
+from .submission_intake import SubmissionIntake  # noqa
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+FormSyncState model module.
+"""
+from django.db import models, transaction
+from django.db.models import Max
+
+WATERMARKS = ("last_id", "last_edited")
+
+
+class FormSyncState(models.Model):
+    """
+    FormSyncState model - the high-water marks of the submissions of an Ona
+    form that have been ingested.
+
+    last_edited keeps the _last_edited value exactly as returned by Ona so
+    that it compares the same way in Ona queries.
+    """
+
+    formid = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    last_edited = models.CharField(max_length=50, blank=True, default="")
+    created_on = models.DateTimeField(auto_now_add=True)
+    modified_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = "main"
+
+    def __str__(self):
+        return self.formid
+
+    @classmethod
+    def for_form(cls, formid, model=None, field="submission_id"):
+        """
+        Return the sync state of formid, creating it if missing. A new state
+        starts from the highest field value of the model records, when model
+        is given, so that submissions that are already stored are not
+        requested again.
+        """
+        state, created = cls.objects.get_or_create(formid=str(formid))
+        if created and model is not None:
+            last_id = model.objects.aggregate(last_id=Max(field))["last_id"]
+            if last_id:
+                state = cls.advance(formid, last_id=last_id)
+
+        return state
+
+    @classmethod
+    def advance(cls, formid, **watermarks):
+        """
+        Move the watermarks of formid forward to the given values, watermarks
+        are never moved back.
+        """
+        with transaction.atomic():
+            state, _created = cls.objects.select_for_update().get_or_create(
+                formid=str(formid)
+            )
+            for field in WATERMARKS:
+                value = watermarks.get(field)
+                if value and value > getattr(state, field):
+                    setattr(state, field, value)
+            state.save()
+
+        return state
@@ -14,6 +14,8 @@ class HouseholdsBuffer(models.Model):
     location = models.ForeignKey("Location", on_delete=models.CASCADE)
     num_households = models.IntegerField(default=0)
     geom = models.PolygonField(srid=4326)
+    # fingerprint of the households and options the buffer was created from
+    checksum = models.CharField(max_length=32, blank=True, default="")
 
     class Meta:
         app_label = "main"
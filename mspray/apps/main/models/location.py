@@ -6,14 +6,55 @@ from django.conf import settings
 from django.contrib.gis.db import models
 from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.core.cache import cache
-from django.db.models import Count, Q, Sum, Value
+from django.db.models import Count, F, FloatField, Func, Q, Sum, Value
 from django.db.models.functions import Cast, Coalesce
+from django.db.models.signals import post_delete, post_save
 from django.utils.functional import cached_property
 
 from mptt.models import MPTTModel, TreeForeignKey
 
+from mspray.apps.main.location_cache import (
+    LOCATION_CACHE_TIMEOUT,
+    get_location_version,
+    location_cache_key,
+)
+from mspray.apps.main.models.spray_area_indicators import (
+    SprayAreaIndicators,
+)
 from mspray.libs.common_tags import MOBILISED_FIELD, SENSITIZED_FIELD
 
+TARGET_AREA_INDEX_FIELDS = {"geom", "level", "target", "parent", "parent_id"}
+# simplify tolerance in degrees of each simplified geometry column
+SIMPLIFY_TOLERANCES = getattr(
+    settings,
+    "MSPRAY_SIMPLIFY_TOLERANCES",
+    {"low": 0.01, "medium": 0.001, "high": 0.0001},
+)
+SIMPLIFIED_GEOM_FIELDS = {
+    "low": "geom_low",
+    "medium": "geom_medium",
+    "high": "geom_high",
+}
+# the simplified geometry to use up to and including a map zoom level, full
+# resolution geometries are used beyond the last zoom level
+SIMPLIFY_ZOOM_LEVELS = getattr(
+    settings,
+    "MSPRAY_SIMPLIFY_ZOOM_LEVELS",
+    ((8, "low"), (11, "medium"), (14, "high")),
+)
+BBOX_FIELDS = {
+    "bbox_xmin": "ST_XMin",
+    "bbox_ymin": "ST_YMin",
+    "bbox_xmax": "ST_XMax",
+    "bbox_ymax": "ST_YMax",
+}
+# extra() select of the xmin, ymin, xmax and ymax of locations
+BBOX_SELECT = {
+    field[len("bbox_"):]: "COALESCE(main_location.{}, {}(main_location.geom))"
+    .format(field, function)
+    for field, function in BBOX_FIELDS.items()
+}
+
 
 def get_mopup_locations(queryset):
     """
@@ -44,6 +85,14 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
     # total number of spray areas, will be zero for spray area location
     num_of_spray_areas = models.PositiveIntegerField(default=0)
     geom = models.MultiPolygonField(srid=4326, null=True)
+    # simplified geom and its bounding box, see update_location_geometries()
+    geom_low = models.MultiPolygonField(srid=4326, null=True)
+    geom_medium = models.MultiPolygonField(srid=4326, null=True)
+    geom_high = models.MultiPolygonField(srid=4326, null=True)
+    bbox_xmin = models.FloatField(null=True)
+    bbox_ymin = models.FloatField(null=True)
+    bbox_xmax = models.FloatField(null=True)
+    bbox_ymax = models.FloatField(null=True)
     data_quality_check = models.BooleanField(default=False)
     average_spray_quality_score = models.FloatField(default=0.0)
     # visited - 20% of the structures have been sprayed in the spray area
@@ -54,6 +103,8 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
     is_sensitized = models.BooleanField(null=True)
     is_mobilised = models.BooleanField(null=True)
     priority = models.PositiveIntegerField(null=True)
+    # visited and sprayed need to be recomputed, see main.tasks rollup
+    rollup_pending = models.BooleanField(default=False, db_index=True)
 
     class Meta:
         app_label = "main"
@@ -86,6 +137,42 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         """
         return self.structures
 
+    @cached_property
+    def cache_version(self):
+        """Return the cache version of the location."""
+        return get_location_version(self.pk)
+
+    def cache_key(self, key):
+        """Return the versioned cache key of a location value."""
+        return location_cache_key(key, self.pk, self.cache_version)
+
+    @property
+    def bounds(self):
+        """
+        Return the [xmin, ymin, xmax, ymax] bounding box of the location.
+        """
+        if self.bbox_xmin is not None:
+            return [
+                self.bbox_xmin,
+                self.bbox_ymin,
+                self.bbox_xmax,
+                self.bbox_ymax,
+            ]
+
+        return list(self.geom.extent) if self.geom else []
+
+    def get_geom(self, simplify=None):
+        """
+        Return the geom simplified at the simplify level, the full resolution
+        geom when simplify is None or the simplified geom is missing.
+        """
+        if simplify in SIMPLIFIED_GEOM_FIELDS:
+            geom = getattr(self, SIMPLIFIED_GEOM_FIELDS[simplify])
+            if geom is not None:
+                return geom
+
+        return self.geom
+
     @classmethod
     def get_district_by_code_or_name(cls, name_or_code):
         """
@@ -145,7 +232,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
 
             return sum((_.structures_to_mopup for _ in locations))
 
-        key = "structures-to-mopup-{}".format(self.pk)
+        key = self.cache_key("structures-to-mopup-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -160,7 +247,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             else ninetieth_percentile - self.visited_sprayed
         )
 
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -186,13 +273,24 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
 
         return self.sprayday_set
 
+    @cached_property
+    def indicators(self):
+        """Return the SprayAreaIndicators of a spray area."""
+        try:
+            return self.spray_area_indicators
+        except SprayAreaIndicators.DoesNotExist:
+            return SprayAreaIndicators.for_location(self)
+
     @cached_property
     def visited_sprayed(self):
         """Return the number of structures sprayed.
 
         For MDA ('mda_status'='all_received' + 'mda_status'=some_received')
         """
-        key = "visited-sprayed-{}".format(self.pk)
+        if self.level == "ta":
+            return self.indicators.visited_sprayed
+
+        key = self.cache_key("visited-sprayed-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -200,7 +298,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         val = self.sprayday_queryset.filter(
             sprayable=True, was_sprayed=True
         ).count()
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -214,7 +312,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
 
             return sum((_.mopup_days_needed for _ in locations))
 
-        key = "mopup-days-needed-{}".format(self.pk)
+        key = self.cache_key("mopup-days-needed-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -225,28 +323,33 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             ).count()
             / denominator
         )
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
     @cached_property
     def not_sprayable(self):
         """Return number of structures that are not sprayable."""
+        if self.level == "ta":
+            return self.indicators.not_sprayable
 
-        key = "not-sprayable-{}".format(self.pk)
+        key = self.cache_key("not-sprayable-{}")
         val = cache.get(key)
         if val is not None:
             return val
 
         val = self.household_set.filter(sprayable=False).count()
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
     @cached_property
     def new_structures(self):
         """Return number of new structures that have been sprayed."""
-        key = "new-structures-{}".format(self.pk)
+        if self.level == "ta":
+            return self.indicators.new_structures
+
+        key = self.cache_key("new-structures-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -263,14 +366,17 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             .filter(sprayable=True, household__isnull=True, was_sprayed=True)
             .count()
         )
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
     @cached_property
     def duplicates(self):
         """Return number of duplicates structures that have been sprayed."""
-        key = "duplicates-{}".format(self.pk)
+        if self.level == "ta":
+            return self.indicators.duplicates
+
+        key = self.cache_key("duplicates-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -285,7 +391,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         )
 
         val = agg.get("total_duplicates") if agg.get("total_duplicates") else 0
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -297,25 +403,12 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         Subtract the number of structures not sprayable.
         Add new structures .
         """
-        key = "structures-on-ground-{}".format(self.pk)
-        val = cache.get(key)
-        if val is not None:
-            return val
-
-        if self.level != "ta":
-            val = sum(
-                l.structures_on_ground
-                for l in self.get_descendants().filter(level="ta", target=True)
-            )
-        else:
-            val = (
-                self.household_set.exclude(sprayable=False).count()
-                + self.new_structures
-                + self.duplicates
-            )
-        cache.set(key, val)
+        if self.level == "ta":
+            return self.indicators.structures_on_ground
 
-        return val
+        return SprayAreaIndicators.totals(
+            self.get_descendants().filter(level="ta", target=True)
+        )["structures_on_ground"]
 
     @cached_property
     def visited_found(self):
@@ -324,7 +417,10 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         The number of households visited
         Add number of new structures sprayed.
         """
-        key = "visited-found-{}".format(self.pk)
+        if self.level == "ta":
+            return self.indicators.visited_found
+
+        key = self.cache_key("visited-found-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -334,14 +430,14 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             + self.new_structures
             + self.duplicates
         )
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
     @cached_property
     def last_visit(self):
         """Return the date of last submission."""
-        key = "last-visit-{}".format(self.pk)
+        key = self.cache_key("last-visit-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -349,7 +445,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         last_sprayday = self.sprayday_queryset.last()
         if last_sprayday:
             val = last_sprayday.spray_date
-            cache.set(key, val)
+            cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
             return val
 
@@ -358,7 +454,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
     @cached_property
     def last_decision_date(self):
         """Return the date of last decision report."""
-        key = "last-decision-date-{}".format(self.pk)
+        key = self.cache_key("last-decision-date-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -366,7 +462,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         decision = self.decision_spray_areas.last()  # pylint: disable=E1101
         if decision:
             val = decision.data.get("today")
-            cache.set(key, val)
+            cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
             return val
 
@@ -405,7 +501,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
                 for l in self.get_descendants().filter(level="ta", target=True)
             )
 
-        key = "mda-found-{}".format(self.pk)
+        key = self.cache_key("mda-found-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -415,7 +511,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             + self.new_structures
             + self.duplicates
         )
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -425,7 +521,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
 
         ('mda_status'='none_received')
         """
-        key = "mda-received-{}".format(self.pk)
+        key = self.cache_key("mda-received-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -436,7 +532,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             .distinct()
             .count()
         )
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -444,13 +540,13 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
     def mda_spray_areas(self):
         """Return the number of MDA Spray Areas
         """
-        key = "mda-spray-areas-{}".format(self.pk)
+        key = self.cache_key("mda-spray-areas-{}")
         val = cache.get(key)
         if val is not None:
             return val
 
         val = self.get_descendants().filter(level="ta", target=True).count()
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -466,7 +562,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
     @cached_property
     def mda_spray_areas_found(self):
         """Return the number of MDA Spray Areas."""
-        key = "mda-spray-areas-found-{}".format(self.pk)
+        key = self.cache_key("mda-spray-areas-found-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -481,7 +577,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             )
             if spray_area.mda_received_percentage >= sprayed_found_percentage
         )
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -492,7 +588,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         ('mda_status'='all_received' +'mda_status'=some_received')
         """
 
-        key = "mda-spray-area-received-{}".format(self.pk)
+        key = self.cache_key("mda-spray-area-received-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -506,14 +602,14 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             for l in self.get_descendants().filter(level="ta", target=True)
             if l.mda_received_percentage >= location_sprayed_percentage
         )
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
     @cached_property
     def population_eligible(self):
         """Return the number of MDA population eligible."""
-        key = "population-eligible-{}".format(self.pk)
+        key = self.cache_key("population-eligible-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -530,14 +626,14 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         )
         val = queryset["total_eligible"] or 0
 
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
     @cached_property
     def population_treatment(self):
         """Return the number of MDA population treatment."""
-        key = "population-treatment-{}".format(self.pk)
+        key = self.cache_key("population-treatment-{}")
         val = cache.get(key)
         if val is not None:
             return val
@@ -554,7 +650,7 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
         )
         val = queryset["total_treatment"] or 0
 
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -598,3 +694,85 @@ class Location(MPTTModel, models.Model):  # pylint: disable=R0904
             )
             .order_by("name")
         )
+
+
+def get_simplify_level(query_params, default=None):
+    """
+    Return the simplified geometry level from the simplify or zoom query
+    parameters, default when neither is given. None is full resolution.
+    """
+    simplify = query_params.get("simplify")
+    if simplify is not None:
+        return simplify if simplify in SIMPLIFIED_GEOM_FIELDS else None
+
+    try:
+        zoom = int(query_params.get("zoom"))
+    except (TypeError, ValueError):
+        return default
+
+    for max_zoom, level in SIMPLIFY_ZOOM_LEVELS:
+        if zoom <= max_zoom:
+            return level
+
+    return None
+
+
+def get_location_geometry_expressions():
+    """
+    Return the update() expressions of the simplified geometry and bounding
+    box columns of a location computed from geom.
+    """
+    expressions = {
+        field: Func(
+            Func(
+                F("geom"),
+                Value(SIMPLIFY_TOLERANCES[level]),
+                function="ST_SimplifyPreserveTopology",
+            ),
+            function="ST_Multi",
+            output_field=models.MultiPolygonField(srid=4326),
+        )
+        for level, field in SIMPLIFIED_GEOM_FIELDS.items()
+    }
+    for field, function in BBOX_FIELDS.items():
+        expressions[field] = Func(
+            F("geom"), function=function, output_field=FloatField()
+        )
+
+    return expressions
+
+
+def update_location_geometries(queryset):
+    """
+    Regenerate the simplified geometries and bounding boxes of the locations
+    in queryset, returns the number of locations updated.
+    """
+    return queryset.update(**get_location_geometry_expressions())
+
+
+# pylint: disable=unused-argument
+def invalidate_target_area_index(sender, instance=None, **kwargs):
+    """
+    Invalidate the spray area index when a location geometry may have changed.
+    """
+    update_fields = kwargs.get("update_fields")
+    if update_fields and not TARGET_AREA_INDEX_FIELDS.intersection(
+        update_fields
+    ):
+        return
+
+    from mspray.apps.main.spatial import clear_target_area_index  # noqa
+
+    clear_target_area_index()
+
+
+post_save.connect(
+    invalidate_target_area_index,
+    sender=Location,
+    dispatch_uid="invalidate_target_area_index",
+)
+post_delete.connect(
+    invalidate_target_area_index,
+    sender=Location,
+    dispatch_uid="invalidate_target_area_index_delete",
+)
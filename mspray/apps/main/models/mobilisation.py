@@ -61,7 +61,7 @@ def update_location_mobilisation(sender, instance=None, **kwargs):
     """Update is_mobilised value on location objects."""
     if kwargs.get("created") and instance and sender == Mobilisation:
         instance.spray_area.is_mobilised = instance.is_mobilised
-        instance.spray_area.save()
+        instance.spray_area.save(update_fields=["is_mobilised"])
 
 
 post_save.connect(
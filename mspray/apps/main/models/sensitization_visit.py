@@ -56,7 +56,7 @@ def update_location_sensitization(sender, instance=None, **kwargs):
     """Update is_sensitized value on location objects"""
     if kwargs.get("created") and instance and sender == SensitizationVisit:
         instance.spray_area.is_sensitized = instance.is_sensitized
-        instance.spray_area.save()
+        instance.spray_area.save(update_fields=["is_sensitized"])
 
 
 post_save.connect(
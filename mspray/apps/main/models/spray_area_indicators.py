@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+SprayAreaIndicators model module.
+"""
+from django.db import connection, models
+from django.db.models import Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+
+from mspray.apps.main.models.household import Household
+from mspray.apps.main.models.spray_day import SprayDay
+from mspray.apps.main.models.spraypoint import SprayPoint
+
+INDICATOR_FIELDS = (
+    "not_sprayable",
+    "new_structures",
+    "duplicates",
+    "visited_sprayed",
+    "structures_on_ground",
+    "visited_found",
+)
+
+REFRESH_SPRAY_AREA_INDICATORS_SQL = """
+INSERT INTO "main_sprayareaindicators" ("location_id", "not_sprayable", "new_structures", "duplicates", "visited_sprayed", "structures_on_ground", "visited_found", "modified_on")
+SELECT "location_id", "not_sprayable", "new_structures", "duplicates", "visited_sprayed", "households" + "new_structures" + "duplicates", "households_found" + "new_structures" + "duplicates", %s
+FROM (
+    SELECT "main_location"."id" AS "location_id",
+    (SELECT COUNT(*) FROM "main_household" WHERE "main_household"."location_id" = "main_location"."id" AND "main_household"."sprayable" = false) AS "not_sprayable",
+    (SELECT COUNT(*) FROM "main_household" WHERE "main_household"."location_id" = "main_location"."id" AND "main_household"."sprayable" IS NOT false) AS "households",
+    (SELECT COUNT(*) FROM "main_household" WHERE "main_household"."location_id" = "main_location"."id" AND "main_household"."sprayable" = true AND "main_household"."visited" = true) AS "households_found",
+    (SELECT COUNT(*) FROM "main_sprayday" WHERE "main_sprayday"."location_id" = "main_location"."id" AND "main_sprayday"."sprayable" = true AND "main_sprayday"."household_id" IS NULL AND ("main_sprayday"."was_sprayed" = true OR EXISTS (SELECT 1 FROM "main_spraypoint" WHERE "main_spraypoint"."sprayday_id" = "main_sprayday"."id" AND "main_spraypoint"."location_id" = "main_location"."id"))) AS "new_structures",
+    (SELECT COUNT(*) - COUNT(DISTINCT "main_sprayday"."household_id") FROM "main_sprayday" WHERE "main_sprayday"."location_id" = "main_location"."id" AND "main_sprayday"."was_sprayed" = true AND "main_sprayday"."household_id" IS NOT NULL) AS "duplicates",
+    (SELECT COUNT(*) FROM "main_sprayday" WHERE "main_sprayday"."location_id" = "main_location"."id" AND "main_sprayday"."sprayable" = true AND "main_sprayday"."was_sprayed" = true) AS "visited_sprayed"
+    FROM "main_location" WHERE "main_location"."id" = ANY(%s)
+) AS "counts"
+ON CONFLICT ("location_id") DO UPDATE SET "not_sprayable" = EXCLUDED."not_sprayable", "new_structures" = EXCLUDED."new_structures", "duplicates" = EXCLUDED."duplicates", "visited_sprayed" = EXCLUDED."visited_sprayed", "structures_on_ground" = EXCLUDED."structures_on_ground", "visited_found" = EXCLUDED."visited_found", "modified_on" = EXCLUDED."modified_on";
+"""  # noqa
+
+
+class SprayAreaIndicators(models.Model):
+    """
+    SprayAreaIndicators model - submission counters of a spray area.
+    """
+
+    location = models.OneToOneField(
+        "Location",
+        primary_key=True,
+        related_name="spray_area_indicators",
+        on_delete=models.CASCADE,
+    )
+    not_sprayable = models.PositiveIntegerField(default=0)
+    new_structures = models.PositiveIntegerField(default=0)
+    duplicates = models.PositiveIntegerField(default=0)
+    visited_sprayed = models.PositiveIntegerField(default=0)
+    structures_on_ground = models.PositiveIntegerField(default=0)
+    visited_found = models.PositiveIntegerField(default=0)
+    modified_on = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = "main"
+
+    def __str__(self):
+        return str(self.location_id)
+
+    @classmethod
+    def refresh(cls, location_ids):
+        """Recompute the indicators of the spray areas in location_ids."""
+        location_ids = list(set(pk for pk in location_ids if pk is not None))
+        if location_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    REFRESH_SPRAY_AREA_INDICATORS_SQL,
+                    [timezone.now(), location_ids],
+                )
+
+    @classmethod
+    def for_location(cls, location):
+        """Return the indicators of a spray area, computing them if missing.
+        """
+        try:
+            return cls.objects.get(location=location)
+        except cls.DoesNotExist:
+            cls.refresh([location.pk])
+
+            return cls.objects.get(location=location)
+
+    @classmethod
+    def totals(cls, locations):
+        """Return the sum of each indicator for the spray areas in locations.
+        """
+        cls.refresh(
+            locations.filter(spray_area_indicators__isnull=True).values_list(
+                "pk", flat=True
+            )
+        )
+
+        return cls.objects.filter(location__in=locations).aggregate(
+            **dict(
+                (field, Coalesce(Sum(field), Value(0)))
+                for field in INDICATOR_FIELDS
+            )
+        )
+
+
+# pylint: disable=unused-argument
+def set_previous_location_id(sender, instance=None, **kwargs):
+    """
+    Keep the location of a record before it is changed, so that the spray area
+    it is moved out of is refreshed as well.
+    """
+    if instance and not kwargs.get("raw") and not instance._state.adding:
+        instance._previous_location_id = (
+            sender.objects.filter(pk=instance.pk)
+            .values_list("location_id", flat=True)
+            .first()
+        )
+
+
+def refresh_spray_area_indicators(sender, instance=None, **kwargs):
+    """
+    Refresh the spray area indicators of the location of a changed record and
+    of its previous location.
+    """
+    if instance and not kwargs.get("raw"):
+        SprayAreaIndicators.refresh(
+            [
+                instance.location_id,
+                getattr(instance, "_previous_location_id", None),
+            ]
+        )
+
+
+def refresh_deleted_spray_area_indicators(sender, instance=None, **kwargs):
+    """
+    Refresh the spray area indicators of the location of a deleted record.
+
+    Only existing indicators are refreshed, the location may be in the process
+    of being deleted as well.
+    """
+    if (
+        instance
+        and SprayAreaIndicators.objects.filter(
+            location_id=instance.location_id
+        ).exists()
+    ):
+        SprayAreaIndicators.refresh([instance.location_id])
+
+
+for sender_model in (SprayDay, SprayPoint, Household):
+    pre_save.connect(
+        set_previous_location_id,
+        sender=sender_model,
+        dispatch_uid="set_previous_location_id",
+    )
+    post_save.connect(
+        refresh_spray_area_indicators,
+        sender=sender_model,
+        dispatch_uid="refresh_spray_area_indicators",
+    )
+    post_delete.connect(
+        refresh_deleted_spray_area_indicators,
+        sender=sender_model,
+        dispatch_uid="refresh_deleted_spray_area_indicators",
+    )
@@ -6,7 +6,12 @@ SprayDay model module - holds all submissions for the IRS HH Form
 from django.conf import settings
 from django.contrib.gis.db import models
 from django.contrib.postgres.fields import JSONField
-from django.db.models.signals import post_save, pre_save
+from django.contrib.postgres.fields.jsonb import KeyTextTransform
+from django.db.models import Case, Value, When
+from django.db.models.functions import Cast
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 DATA_FILTER = getattr(
     settings, "MSPRAY_DATA_FILTER", '"sprayable_structure":"yes"'
@@ -29,6 +34,15 @@ OSM_STRUCTURE_FIELD = getattr(settings, "MSPRAY_UNIQUE_FIELD", None)
 NEW_STRUCTURE_GPS_FIELD = getattr(
     settings, "NEW_STRUCTURE_GPS_FIELD", "newstructure/gps_osm_file"
 )
+REASON_FIELD = settings.MSPRAY_UNSPRAYED_REASON_FIELD
+SUBMISSION_TIME_FIELD = "_submission_time"
+# data keys promoted to boolean SprayDay columns
+DATA_KEY_FIELDS = {
+    "has_osm_way": "osmstructure:way:id",
+    "has_osm_node": "osmstructure:node:id",
+    "has_new_osm_node": "newstructure/gps_osm_file:node:id",
+    "has_new_structure_gps": "newstructure/gps",
+}
 
 
 def get_osmid(data):
@@ -45,6 +59,58 @@ def get_osmid(data):
     return None
 
 
+def get_data_fields(data):
+    """
+    Returns the values of the SprayDay columns that are promoted from keys in
+    the submission data.
+    """
+    reason = data.get(REASON_FIELD)
+    try:
+        submission_time = parse_datetime(data.get(SUBMISSION_TIME_FIELD) or "")
+    except ValueError:
+        submission_time = None
+    if submission_time and timezone.is_naive(submission_time):
+        submission_time = timezone.make_aware(submission_time, timezone.utc)
+    fields = {
+        "sprayformid": data.get("sprayformid"),
+        "unsprayed_reason": None if reason is None else str(reason),
+        "submission_time": submission_time,
+    }
+    fields.update(
+        (field, key in data) for field, key in DATA_KEY_FIELDS.items()
+    )
+
+    return fields
+
+
+def get_data_field_expressions():
+    """
+    Returns the expressions that compute the promoted SprayDay columns from
+    the submission data in the database, for use with queryset.update().
+    """
+    expressions = {
+        "sprayformid": KeyTextTransform("sprayformid", "data"),
+        "unsprayed_reason": KeyTextTransform(REASON_FIELD, "data"),
+        "submission_time": Cast(
+            KeyTextTransform(SUBMISSION_TIME_FIELD, "data"),
+            models.DateTimeField(),
+        ),
+    }
+    expressions.update(
+        (
+            field,
+            Case(
+                When(data__has_key=key, then=Value(True)),
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+        )
+        for field, key in DATA_KEY_FIELDS.items()
+    )
+
+    return expressions
+
+
 class SprayDay(models.Model):
     """
     SprayDay model  - IRS HH submission data model.
@@ -93,6 +159,16 @@ class SprayDay(models.Model):
 
     was_sprayed = models.BooleanField(default=False)
     sprayable = models.BooleanField(default=False)
+    # promoted from keys in data, see get_data_fields()
+    sprayformid = models.CharField(max_length=50, null=True, db_index=True)
+    unsprayed_reason = models.CharField(
+        max_length=255, null=True, db_index=True
+    )
+    submission_time = models.DateTimeField(null=True, db_index=True)
+    has_osm_way = models.BooleanField(default=False)
+    has_osm_node = models.BooleanField(default=False)
+    has_new_osm_node = models.BooleanField(default=False)
+    has_new_structure_gps = models.BooleanField(default=False)
     created_on = models.DateTimeField(auto_now_add=True)
     modified_on = models.DateTimeField(auto_now=True)
 
@@ -243,6 +319,31 @@ post_save.connect(
 )
 
 
+def mark_sprayday_locations_for_rollup(sender, instance=None, **kwargs):
+    """
+    Flag the spray area, RHC and district of a submission for a visited and
+    sprayed rollup.
+    """
+    if instance and not kwargs.get("raw"):
+        from mspray.apps.main.tasks import mark_locations_for_rollup
+
+        mark_locations_for_rollup(
+            [instance.location_id, instance.rhc_id, instance.district_id]
+        )
+
+
+post_save.connect(
+    mark_sprayday_locations_for_rollup,
+    sender=SprayDay,
+    dispatch_uid="mark_sprayday_locations_for_rollup",
+)
+post_delete.connect(
+    mark_sprayday_locations_for_rollup,
+    sender=SprayDay,
+    dispatch_uid="mark_sprayday_locations_for_rollup",
+)
+
+
 def mda_population_calculations(sender, instance=None, **kwargs):
     """Calculate MDA population metrics"""
     eligible_field = "_population_eligible"
@@ -267,5 +368,17 @@ pre_save.connect(
     sender=SprayDay,
     dispatch_uid="mda_population_calculations",
 )
+
+
+def set_data_fields(sender, instance=None, **kwargs):
+    """Set the SprayDay columns that are promoted from the submission data."""
+    if instance and instance.data is not None:
+        for field, value in get_data_fields(instance.data).items():
+            setattr(instance, field, value)
+
+
+pre_save.connect(
+    set_data_fields, sender=SprayDay, dispatch_uid="set_data_fields"
+)
 # Auto-generated `LayerMapping` dictionary for SprayDay model
 sprayday_mapping = {"geom": "POINT25D"}  # pylint: disable=C0103
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+SubmissionIntake model module.
+"""
+import json
+
+from django.contrib.postgres.fields import JSONField
+from django.db import connection, models
+from django.utils import timezone
+
+from mspray.apps.main.models.spray_day import DATA_ID_FIELD
+
+STAGE_SUBMISSION_SQL = """
+INSERT INTO "main_submissionintake" ("submission_id", "data", "edited", "attempts", "error", "received_on")
+VALUES (%s, %s::jsonb, %s, 0, '', %s)
+ON CONFLICT ("submission_id") DO UPDATE SET "data" = EXCLUDED."data", "edited" = EXCLUDED."edited", "attempts" = 0, "error" = '', "received_on" = EXCLUDED."received_on"
+WHERE EXCLUDED."edited" >= "main_submissionintake"."edited";
+"""  # noqa
+
+
+def get_edited(data):
+    """
+    Returns the edit time of a submission payload as sent by Ona, an empty
+    string for a submission that has not been edited.
+    """
+    return data.get("_last_edited") or data.get("_date_modified") or ""
+
+
+class SubmissionIntake(models.Model):
+    """
+    SubmissionIntake model - raw submission payloads received by the
+    submission webhook waiting to be processed.
+
+    There is at most one payload per submission, a payload is only replaced
+    by one with the same or a later edit time.
+    """
+
+    submission_id = models.PositiveIntegerField(primary_key=True)
+    data = JSONField(default=dict)
+    edited = models.CharField(max_length=50, blank=True, default="")
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    received_on = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        app_label = "main"
+
+    def __str__(self):
+        return str(self.submission_id)
+
+    @classmethod
+    def stage(cls, data):
+        """Store a submission payload for processing."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                STAGE_SUBMISSION_SQL,
+                [
+                    data.get(DATA_ID_FIELD),
+                    json.dumps(data),
+                    get_edited(data),
+                    timezone.now(),
+                ],
+            )
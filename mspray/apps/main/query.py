@@ -29,17 +29,12 @@ def get_location_qs(queryset, level=None):
     total_structures calculations for each location.
     """
     if level == "RHC":
-        new_gps = {
-            "content_object__data__has_key": (
-                "newstructure/gps_osm_file:node:id"
-            )
-        }
         sprays = (
             SprayDayHealthCenterLocation.objects.filter(
-                Q(content_object__data__has_key="osmstructure:node:id")
-                | Q(**new_gps)
+                Q(content_object__has_osm_node=True)
+                | Q(content_object__has_new_osm_node=True)
                 | Q(
-                    content_object__data__has_key="osmstructure:way:id",
+                    content_object__has_osm_way=True,
                     content_object__household__isnull=True,
                 ),
                 location=OuterRef("pk"),
@@ -78,11 +73,9 @@ def get_location_qs(queryset, level=None):
     else:
         sprays = (
             SprayDay.objects.filter(
-                Q(data__has_key="osmstructure:node:id")
-                | Q(data__has_key="newstructure/gps_osm_file:node:id")
-                | Q(
-                    data__has_key="osmstructure:way:id", household__isnull=True
-                ),
+                Q(has_osm_node=True)
+                | Q(has_new_osm_node=True)
+                | Q(has_osm_way=True, household__isnull=True),
                 location=OuterRef("pk"),
             )
             .order_by()
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Reconcile local records with the submissions of a form on Ona.
+
+The submission ids of a form on Ona are sent to PostgreSQL as a single array
+and compared with the local records using anti-joins, so that neither side
+is loaded into Python sets and no large IN lists are built. Edited and new
+submissions are synced incrementally from the watermarks in FormSyncState.
+"""
+from django.conf import settings
+from django.db import connection
+
+from mspray.apps.main.models.form_sync_state import FormSyncState
+from mspray.libs.ona import iter_form_changes
+
+RECONCILIATION_BATCH_SIZE = getattr(
+    settings, "MSPRAY_RECONCILIATION_BATCH_SIZE", 1000
+)
+MISSING_IDS_SQL = """
+SELECT DISTINCT "remote"."id" FROM unnest(%s::bigint[]) AS "remote" ("id")
+WHERE "remote"."id" IS NOT NULL AND NOT EXISTS (SELECT 1 FROM "{table}" WHERE "{table}"."{column}" = "remote"."id")
+ORDER BY "remote"."id";
+"""  # noqa
+DELETED_IDS_SQL = """
+SELECT "{table}"."{pk}" FROM "{table}"
+WHERE NOT EXISTS (SELECT 1 FROM unnest(%s::bigint[]) AS "remote" ("id") WHERE "remote"."id" = "{table}"."{column}")
+ORDER BY "{table}"."{pk}";
+"""  # noqa
+MISSING_SPRAYFORMIDS_SQL = """
+SELECT DISTINCT "main_sprayday"."sprayformid" FROM "main_sprayday"
+WHERE "main_sprayday"."sprayformid" IS NOT NULL AND NOT EXISTS (SELECT 1 FROM "main_performancereport" WHERE "main_performancereport"."sprayformid" = "main_sprayday"."sprayformid");
+"""  # noqa
+
+
+def _format_sql(sql, model, field):
+    return sql.format(
+        table=model._meta.db_table,
+        column=model._meta.get_field(field).column,
+        pk=model._meta.pk.column,
+    )
+
+
+def find_missing_ids(model, remote_ids, field="submission_id"):
+    """
+    Returns the sorted remote_ids that do not have a model record with a
+    matching field value.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _format_sql(MISSING_IDS_SQL, model, field), [list(remote_ids)]
+        )
+
+        return [row[0] for row in cursor.fetchall()]
+
+
+def find_deleted_ids(model, remote_ids, field="submission_id"):
+    """
+    Returns the primary keys of model records whose field value is not one of
+    remote_ids.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _format_sql(DELETED_IDS_SQL, model, field), [list(remote_ids)]
+        )
+
+        return [row[0] for row in cursor.fetchall()]
+
+
+def remove_deleted(
+    model,
+    remote_ids,
+    field="submission_id",
+    batch_size=RECONCILIATION_BATCH_SIZE,
+):
+    """
+    Deletes model records whose field value is not one of remote_ids,
+    batch_size records at a time.
+
+    Records are deleted through the ORM so that cascades and delete signals
+    still apply. Returns the number of records deleted.
+    """
+    pks = find_deleted_ids(model, remote_ids, field)
+    for i in range(0, len(pks), batch_size):
+        model.objects.filter(pk__in=pks[i:i + batch_size]).delete()
+
+    return len(pks)
+
+
+def find_missing_sprayformids():
+    """
+    Returns the sprayformids of submissions that do not have a performance
+    report.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(MISSING_SPRAYFORMIDS_SQL)
+
+        return [row[0] for row in cursor.fetchall()]
+
+
+def sync_form_changes(formid, sync_func, model=None):
+    """
+    Ingest the submissions of formid edited or submitted since the last sync
+    with sync_func, then advance the watermarks of formid. model is the model
+    of the ingested records, the first sync of formid only requests the
+    submissions newer than its records.
+
+    The watermarks are only advanced once every submission has been
+    ingested, a failure leaves them unchanged so that the next sync picks up
+    from the same point. Returns the number of submissions ingested.
+    """
+    state = FormSyncState.for_form(formid, model)
+    watermarks = {"last_id": state.last_id, "last_edited": state.last_edited}
+    count = 0
+    for record in iter_form_changes(
+        formid, state.last_edited, last_id=state.last_id
+    ):
+        sync_func(record)
+        count += 1
+        for field, key in (
+            ("last_id", "_id"),
+            ("last_edited", "_last_edited"),
+        ):
+            value = record.get(key)
+            if value and value > watermarks[field]:
+                watermarks[field] = value
+
+    if count:
+        FormSyncState.advance(formid, **watermarks)
+
+    return count
@@ -85,8 +85,8 @@ class DistrictMixin:
                     obj.get("xmax"),
                     obj.get("ymax"),
                 ]
-            elif obj.geom:
-                bounds = list(obj.geom.boundary.extent)
+            else:
+                bounds = obj.bounds
 
         return bounds
 
@@ -6,6 +6,10 @@ from django.core.cache import cache
 from rest_framework import serializers
 
 from mspray.apps.main.datetime_tools import average_time
+from mspray.apps.main.location_cache import (
+    LOCATION_CACHE_TIMEOUT,
+    location_cache_key,
+)
 from mspray.apps.main.models import (
     Location,
     PerformanceReport,
@@ -339,7 +343,9 @@ class TLAPerformanceReportSerializer(serializers.ModelSerializer):
         """
         Returns number of sprayable structures not eligible reason.
         """
-        key = "tla-not-eligible-{}".format(obj.pk)
+        key = location_cache_key(
+            "tla-not-eligible-%s-{}" % obj.pk, obj.location_id
+        )
         val = cache.get(key)
         if val is not None:
             return val
@@ -355,7 +361,7 @@ class TLAPerformanceReportSerializer(serializers.ModelSerializer):
             .count()
         )
 
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -537,7 +543,7 @@ class DistrictPerformanceReportSerializer(serializers.ModelSerializer):
 
     def get_not_eligible(self, obj):  # pylint: disable=no-self-use
         """Return number of sprayable structures not eligible reason."""
-        key = "performance-not-eligible-{}".format(obj.pk)
+        key = location_cache_key("performance-not-eligible-{}", obj.pk)
         val = cache.get(key)
         if val is not None:
             return val
@@ -553,7 +559,7 @@ class DistrictPerformanceReportSerializer(serializers.ModelSerializer):
             .count()
         )
 
-        cache.set(key, val)
+        cache.set(key, val, LOCATION_CACHE_TIMEOUT)
 
         return val
 
@@ -5,14 +5,28 @@ from django.conf import settings
 from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.core.cache import cache
 from django.db import connection
-from django.db.models import Case, Count, F, IntegerField, Sum, Value, When
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    IntegerField,
+    Q,
+    Sum,
+    Value,
+    When,
+)
 from django.db.models.functions import Cast, Coalesce
+from django.db.models.manager import Manager
 
 from rest_framework import serializers
 from rest_framework_gis.fields import GeometryField
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
 
-from mspray.apps.main.models.location import Location
+from mspray.apps.main.location_cache import (
+    LOCATION_CACHE_TIMEOUT,
+    location_cache_key,
+)
+from mspray.apps.main.models.location import Location, get_simplify_level
 from mspray.apps.main.models.spray_day import SprayDay
 from mspray.apps.main.models.spray_operator import SprayOperatorDailySummary
 from mspray.apps.main.models.spraypoint import SprayPoint
@@ -37,9 +51,21 @@ HAS_UNIQUE_FIELD = getattr(settings, "MSPRAY_UNIQUE_FIELD", None)
 LOCATION_SPRAYED_PERCENTAGE = getattr(
     settings, "LOCATION_SPRAYED_PERCENTAGE", 90
 )
+# serializer context key holding prefetched spray area indicators
+SPRAY_AREA_INDICATORS = "spray_area_indicators"
+SPRAY_AREA_INDICATOR_FIELDS = (
+    "other",
+    "not_sprayable",
+    "found",
+    "sprayed",
+    "new_structures",
+    "not_sprayed",
+    "refused",
+)
 
 SPRAY_AREA_INDICATOR_SQL = """
 SELECT
+"location_id",
 SUM(CASE WHEN "other" > 0 THEN 1 ELSE 0 END) AS "other",
 SUM(CASE WHEN "not_sprayable" > 0 THEN 1 ELSE 0 END) AS "not_sprayable",
 SUM(CASE WHEN "found" > 0 THEN 1 ELSE 0 END) AS "found",
@@ -49,19 +75,21 @@ SUM(CASE WHEN "not_sprayed" > 0 THEN 1 ELSE 0 END) AS "not_sprayed",
 SUM(CASE WHEN "refused" >0 THEN 1 ELSE 0 END) AS "refused" FROM
 (
   SELECT
+  "main_sprayday"."location_id" AS "location_id",
   SUM(CASE WHEN (("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' OR "main_sprayday"."data" @> '{"newstructure/gps_osm_file:notsprayed_reason": "refused"}') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = true) THEN 0 ELSE 1 END) AS "other",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."household_id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."household_id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "sprayed",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'newstructure/gps' AND "main_sprayday"."sprayable" = true) THEN 1 WHEN (("main_sprayday"."data" ? 'osmstructure:node:id' OR "main_sprayday"."data" ? 'newstructure/gps_osm_file:node:id') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN (("main_sprayday"."data" ? 'osmstructure:node:id' OR "main_sprayday"."data" ? 'newstructure/gps_osm_file:node:id') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = true AND "main_sprayday"."household_id" IS NULL) THEN 1 ELSE 0 END) AS "new_structures",
+  SUM(CASE WHEN ("main_sprayday"."has_new_structure_gps" AND "main_sprayday"."sprayable" = true) THEN 1 WHEN (("main_sprayday"."has_osm_node" OR "main_sprayday"."has_new_osm_node") AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN (("main_sprayday"."has_osm_node" OR "main_sprayday"."has_new_osm_node") AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = true AND "main_sprayday"."household_id" IS NULL) THEN 1 ELSE 0 END) AS "new_structures",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "not_sprayed",
   SUM(CASE WHEN (("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' OR "main_sprayday"."data" @> '{"newstructure/gps_osm_file:notsprayed_reason": "refused"}') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "refused"
-  FROM "main_sprayday" LEFT OUTER JOIN "main_spraypoint" ON ("main_sprayday"."id" = "main_spraypoint"."sprayday_id") WHERE ("main_sprayday"."location_id" = %s) GROUP BY "main_sprayday"."id"
-) AS "sub_query";
+  FROM "main_sprayday" LEFT OUTER JOIN "main_spraypoint" ON ("main_sprayday"."id" = "main_spraypoint"."sprayday_id") WHERE ("main_sprayday"."location_id" = ANY(%s)) GROUP BY "main_sprayday"."id", "main_sprayday"."location_id"
+) AS "sub_query" GROUP BY "location_id";
 """  # noqa
 
 SPRAY_AREA_INDICATOR_SQL_DATE_FILTERED = """
 SELECT
+"location_id",
 SUM(CASE WHEN "other" > 0 THEN 1 ELSE 0 END) AS "other",
 SUM(CASE WHEN "not_sprayable" > 0 THEN 1 ELSE 0 END) AS "not_sprayable",
 SUM(CASE WHEN "found" > 0 THEN 1 ELSE 0 END) AS "found",
@@ -71,19 +99,21 @@ SUM(CASE WHEN "not_sprayed" > 0 THEN 1 ELSE 0 END) AS "not_sprayed",
 SUM(CASE WHEN "refused" >0 THEN 1 ELSE 0 END) AS "refused" FROM
 (
   SELECT
+  "main_sprayday"."location_id" AS "location_id",
   SUM(CASE WHEN (("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' OR "main_sprayday"."data" @> '{"newstructure/gps_osm_file:notsprayed_reason": "refused"}') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = true) THEN 0 ELSE 1 END) AS "other",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."household_id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."household_id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "sprayed",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'newstructure/gps' AND "main_sprayday"."sprayable" = true) THEN 1 WHEN (("main_sprayday"."data" ? 'osmstructure:node:id' OR "main_sprayday"."data" ? 'newstructure/gps_osm_file:node:id') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN (("main_sprayday"."data" ? 'osmstructure:node:id' OR "main_sprayday"."data" ? 'newstructure/gps_osm_file:node:id') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = true AND "main_sprayday"."household_id" IS NULL) THEN 1 ELSE 0 END) AS "new_structures",
+  SUM(CASE WHEN ("main_sprayday"."has_new_structure_gps" AND "main_sprayday"."sprayable" = true) THEN 1 WHEN (("main_sprayday"."has_osm_node" OR "main_sprayday"."has_new_osm_node") AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN (("main_sprayday"."has_osm_node" OR "main_sprayday"."has_new_osm_node") AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = true AND "main_sprayday"."household_id" IS NULL) THEN 1 ELSE 0 END) AS "new_structures",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "not_sprayed",
   SUM(CASE WHEN (("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' OR "main_sprayday"."data" @> '{"newstructure/gps_osm_file:notsprayed_reason": "refused"}') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "refused"
-  FROM "main_sprayday" LEFT OUTER JOIN "main_spraypoint" ON ("main_sprayday"."id" = "main_spraypoint"."sprayday_id") WHERE ("main_sprayday"."location_id" = %s AND "main_sprayday"."spray_date" <= %s::date) GROUP BY "main_sprayday"."id"
-) AS "sub_query";
+  FROM "main_sprayday" LEFT OUTER JOIN "main_spraypoint" ON ("main_sprayday"."id" = "main_spraypoint"."sprayday_id") WHERE ("main_sprayday"."location_id" = ANY(%s) AND "main_sprayday"."spray_date" <= %s::date) GROUP BY "main_sprayday"."id", "main_sprayday"."location_id"
+) AS "sub_query" GROUP BY "location_id";
 """  # noqa
 
 SPRAY_AREA_INDICATOR_SQL_WEEK = """
 SELECT
+"location_id",
 SUM(CASE WHEN "other" > 0 THEN 1 ELSE 0 END) AS "other",
 SUM(CASE WHEN "not_sprayable" > 0 THEN 1 ELSE 0 END) AS "not_sprayable",
 SUM(CASE WHEN "found" > 0 THEN 1 ELSE 0 END) AS "found",
@@ -93,17 +123,19 @@ SUM(CASE WHEN "not_sprayed" > 0 THEN 1 ELSE 0 END) AS "not_sprayed",
 SUM(CASE WHEN "refused" >0 THEN 1 ELSE 0 END) AS "refused" FROM
 (
   SELECT
+  "main_sprayday"."location_id" AS "location_id",
   SUM(CASE WHEN (("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' OR "main_sprayday"."data" @> '{"newstructure/gps_osm_file:notsprayed_reason": "refused"}') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = true) THEN 0 ELSE 1 END) AS "other",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "sprayed",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'newstructure/gps' AND "main_sprayday"."sprayable" = true) THEN 1 WHEN (("main_sprayday"."data" ? 'osmstructure:node:id' OR "main_sprayday"."data" ? 'newstructure/gps_osm_file:node:id') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN (("main_sprayday"."data" ? 'osmstructure:node:id' OR "main_sprayday"."data" ? 'newstructure/gps_osm_file:node:id') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "new_structures",
+  SUM(CASE WHEN ("main_sprayday"."has_new_structure_gps" AND "main_sprayday"."sprayable" = true) THEN 1 WHEN (("main_sprayday"."has_osm_node" OR "main_sprayday"."has_new_osm_node") AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN (("main_sprayday"."has_osm_node" OR "main_sprayday"."has_new_osm_node") AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "new_structures",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "not_sprayed",
   SUM(CASE WHEN (("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' OR "main_sprayday"."data" @> '{"newstructure/gps_osm_file:notsprayed_reason": "refused"}') AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "refused"
   FROM "main_sprayday" LEFT OUTER JOIN "main_spraypoint" ON
   ("main_sprayday"."id" = "main_spraypoint"."sprayday_id") WHERE
-  ("main_sprayday"."location_id" = %s AND EXTRACT('week' FROM "main_sprayday"."spray_date") <= %s) GROUP BY "main_sprayday"."id"
-) AS "sub_query";
+  ("main_sprayday"."location_id" = ANY(%s) AND EXTRACT('week' FROM "main_sprayday"."spray_date") <= %s) GROUP BY "main_sprayday"."id",
+  "main_sprayday"."location_id"
+) AS "sub_query" GROUP BY "location_id";
 """  # noqa
 
 
@@ -127,17 +159,110 @@ def cached_queryset_count(key, queryset, query=None, params=[]):
         if count is None:
             count = 0
 
-    cache.set(key, count)
+    cache.set(key, count, LOCATION_CACHE_TIMEOUT)
 
     return count
 
 
-def get_spray_data(obj, context):
+def get_indicator_filters(context):
+    """Return the (spray_date, week_number) filters set in a context."""
     request = context.get("request")
     spray_date = parse_spray_date(request) if request else None
-    week_number = context.get("week_number")
 
-    if type(obj) == dict:
+    return spray_date, context.get("week_number")
+
+
+def get_spray_area_indicators(location_ids, spray_date=None, week_number=None):
+    """Return spray area indicators for a set of spray areas.
+
+    The indicators for all the spray areas are calculated in one grouped
+    query, a spray area with no submissions has its indicators set to None.
+    The 'sprayed_duplicates' count is not date or week filtered.
+
+    :param location_ids: spray area (target area) primary keys
+    :param spray_date: only consider submissions up to this date
+    :param week_number: only consider submissions up to this week
+
+    :return dict of location_id: indicators
+    """
+    location_ids = list(set(location_ids))
+    indicators = {
+        pk: dict.fromkeys(SPRAY_AREA_INDICATOR_FIELDS) for pk in location_ids
+    }
+    if not location_ids:
+        return indicators
+
+    cursor = connection.cursor()
+    if spray_date:
+        cursor.execute(
+            SPRAY_AREA_INDICATOR_SQL_DATE_FILTERED,
+            [location_ids, spray_date.strftime("%Y-%m-%d")],
+        )
+    elif week_number:
+        cursor.execute(
+            SPRAY_AREA_INDICATOR_SQL_WEEK, [location_ids, week_number]
+        )
+    else:
+        cursor.execute(SPRAY_AREA_INDICATOR_SQL, [location_ids])
+
+    for row in dictfetchall(cursor):
+        indicators[row.pop("location_id")].update(row)
+
+    duplicates = (
+        SprayDay.objects.filter(
+            location__in=location_ids, osmid__isnull=False, was_sprayed=True
+        )
+        .order_by()
+        .values("location", "osmid")
+        .annotate(dupes=Count("osmid"))
+        .filter(dupes__gt=1)
+    )
+    for pk in location_ids:
+        indicators[pk]["sprayed_duplicates"] = 0
+    for duplicate in duplicates:
+        indicators[duplicate["location"]]["sprayed_duplicates"] += (
+            duplicate["dupes"] - 1
+        )
+
+    return indicators
+
+
+def prefetch_spray_area_indicators(location_ids, context):
+    """Add spray area indicators for location_ids to the context.
+
+    Indicators already in the context are not fetched again.
+    """
+    indicators = context.setdefault(SPRAY_AREA_INDICATORS, {})
+    missing = [pk for pk in set(location_ids) if pk not in indicators]
+    if missing:
+        spray_date, week_number = get_indicator_filters(context)
+        indicators.update(
+            get_spray_area_indicators(missing, spray_date, week_number)
+        )
+
+    return indicators
+
+
+def get_cached_spray_area_indicators(location_id, context):
+    """Return spray area indicators from the context or the database."""
+    indicators = context.get(SPRAY_AREA_INDICATORS)
+    if indicators is not None and location_id in indicators:
+        return indicators[location_id]
+
+    spray_date, week_number = get_indicator_filters(context)
+    data = get_spray_area_indicators([location_id], spray_date, week_number)
+    if indicators is not None:
+        indicators.update(data)
+
+    return data[location_id]
+
+
+def get_spray_data(obj, context):
+    spray_date, week_number = get_indicator_filters(context)
+
+    if isinstance(obj, dict):
+        if obj.get("level") == TA_LEVEL:
+            return get_cached_spray_area_indicators(obj.get("pk"), context)
         loc = Location.objects.get(pk=obj.get("pk"))
     else:
         loc = obj
@@ -195,7 +320,7 @@ def get_spray_data(obj, context):
                 Case(
                     When(
                         sprayable=False,
-                        data__has_key="osmstructure:way:id",
+                        has_osm_way=True,
                         spraypoint__isnull=False,
                         then=1,
                     ),
@@ -208,13 +333,13 @@ def get_spray_data(obj, context):
                     When(
                         sprayable=True,
                         spraypoint__isnull=False,
-                        data__has_key="newstructure/gps",
+                        has_new_structure_gps=True,
                         then=1,
                     ),
                     When(
                         sprayable=True,
                         spraypoint__isnull=False,
-                        data__has_key="osmstructure:node:id",
+                        has_osm_node=True,
                         then=1,
                     ),
                     When(
@@ -233,7 +358,7 @@ def get_spray_data(obj, context):
                         sprayable=True,
                         was_sprayed=False,
                         spraypoint__isnull=False,
-                        data__contains={REASON_FIELD: REASON_REFUSED},
+                        unsprayed_reason=REASON_REFUSED,
                         then=1,
                     ),
                     default=0,
@@ -246,7 +371,7 @@ def get_spray_data(obj, context):
                         sprayable=True,
                         was_sprayed=False,
                         spraypoint__isnull=False,
-                        data__contains={REASON_FIELD: REASON_REFUSED},
+                        unsprayed_reason=REASON_REFUSED,
                         then=0,
                     ),
                     When(sprayable=True, was_sprayed=True, then=0),
@@ -257,29 +382,7 @@ def get_spray_data(obj, context):
             structures=F("location__structures"),
         )
 
-    kwargs = {}
-    # if not week_number:
-    #    week_number = int(timezone.now().strftime('%W'))
-    if week_number:
-        kwargs["spray_date__week__lte"] = week_number
-    queryset = loc.sprayday_set.filter(**kwargs)
-
-    if spray_date:
-        queryset = queryset.filter(spray_date__lte=spray_date)
-
-    cursor = connection.cursor()
-
-    if spray_date:
-        cursor.execute(
-            SPRAY_AREA_INDICATOR_SQL_DATE_FILTERED,
-            [loc.id, spray_date.strftime("%Y-%m-%d")],
-        )
-    elif week_number:
-        cursor.execute(SPRAY_AREA_INDICATOR_SQL_WEEK, [loc.id, week_number])
-    else:
-        cursor.execute(SPRAY_AREA_INDICATOR_SQL, [loc.id])
-    results = dictfetchall(cursor)
-    return results[0]
+    return get_cached_spray_area_indicators(loc.pk, context)
 
 
 def get_duplicates(obj, was_sprayed, spray_date=None):
@@ -364,7 +467,7 @@ def get_spray_area_count(location, context=dict()):
     structures = (
         location.structures
         + (data.get("new_structures") or 0)
-        + count_duplicates(location, True)
+        + data.get("sprayed_duplicates")
         - (data.get("not_sprayable") or 0)
     )
 
@@ -376,7 +479,7 @@ def get_spray_area_stats(location, context=dict()):
     structures = (
         location.structures
         + (data.get("new_structures") or 0)
-        + count_duplicates(location, True)
+        + data.get("sprayed_duplicates")
         - (data.get("not_sprayable") or 0)
     )
 
@@ -394,6 +497,14 @@ def count_key_if_percent(obj, key, percentage, context=dict()):
         return counter
 
     loc = Location.objects.get(pk=obj.get("pk")) if type(obj) == dict else obj
+    # fetch indicators of all the spray areas below loc in one query
+    context = dict(context)
+    prefetch_spray_area_indicators(
+        Location.objects.filter(
+            Q(parent=loc) | Q(parent__parent=loc), level=TA_LEVEL
+        ).values_list("pk", flat=True),
+        context,
+    )
 
     if loc.level == "RHC":
         return count_for(loc)
@@ -641,7 +752,7 @@ class TargetAreaMixin(object):
                 not_sprayable = data.get("not_sprayable") or 0
                 new_structures = data.get("new_structures") or 0
                 structures -= not_sprayable
-                structures += new_structures + count_duplicates(obj, True)
+                structures += new_structures + data.get("sprayed_duplicates")
                 count = data.get("found") or 0
             else:
                 not_sprayable = (
@@ -666,8 +777,8 @@ class TargetAreaMixin(object):
                     obj.get("xmax"),
                     obj.get("ymax"),
                 ]
-            elif obj.geom:
-                bounds = list(obj.geom.boundary.extent)
+            else:
+                bounds = obj.bounds
 
         return bounds
 
@@ -712,9 +823,7 @@ class TargetAreaMixin(object):
                 not_sprayable = data.get("not_sprayable") or 0
                 new_structures = data.get("new_structures") or 0
                 structures -= not_sprayable
-                structures += new_structures + count_duplicates(
-                    obj, was_sprayed=True
-                )
+                structures += new_structures + data.get("sprayed_duplicates")
             else:
                 not_sprayable = (
                     data.aggregate(r=Sum("not_sprayable")).get("r") or 0
@@ -902,7 +1011,7 @@ class TargetAreaQueryMixin(TargetAreaMixin):
     def get_found(self, obj):
         if obj:
             pk = obj["pk"] if isinstance(obj, dict) else obj.pk
-            key = "%s_found" % pk
+            key = location_cache_key("{}_found", pk)
             queryset = self.get_spray_queryset(obj)
             query = (
                 "SELECT SUM((data->>'number_sprayable')::int) as id "
@@ -918,7 +1027,7 @@ class TargetAreaQueryMixin(TargetAreaMixin):
     def get_visited_sprayed(self, obj):
         if obj:
             pk = obj["pk"] if isinstance(obj, dict) else obj.pk
-            key = "%s_visited_sprayed" % pk
+            key = location_cache_key("{}_visited_sprayed", pk)
             queryset = self.get_spray_queryset(obj)
 
             query = (
@@ -936,7 +1045,7 @@ class TargetAreaQueryMixin(TargetAreaMixin):
     def get_visited_not_sprayed(self, obj):
         if obj:
             pk = obj["pk"] if isinstance(obj, dict) else obj.pk
-            key = "%s_visited_not_sprayed" % pk
+            key = location_cache_key("{}_visited_not_sprayed", pk)
             queryset = self.get_spray_queryset(obj)
             query = (
                 "SELECT SUM((data->>'sprayed/sprayable_notsprayed')::int)"
@@ -952,39 +1061,60 @@ class TargetAreaQueryMixin(TargetAreaMixin):
     def get_visited_refused(self, obj):
         if obj:
             pk = obj["pk"] if isinstance(obj, dict) else obj.pk
-            key = "%s_visited_refused" % pk
+            key = location_cache_key("{}_visited_refused", pk)
             queryset = self.get_spray_queryset(obj)
             query = (
                 "SELECT SUM((data->>'sprayed/sprayable_notsprayed')::int)"
                 " as id FROM main_sprayday WHERE location_id IN %s"
-                " AND data->>%s = %s"
+                " AND unsprayed_reason = %s"
             )
             location_pks = list(get_ta_in_location(obj))
             if len(location_pks) == 0:
                 return 0
-            params = [tuple(location_pks), REASON_FIELD, REASON_REFUSED]
+            params = [tuple(location_pks), REASON_REFUSED]
 
             return cached_queryset_count(key, queryset, query, params)
 
     def get_visited_other(self, obj):
         if obj:
             pk = obj["pk"] if isinstance(obj, dict) else obj.pk
-            key = "%s_visited_other" % pk
+            key = location_cache_key("{}_visited_other", pk)
             queryset = self.get_spray_queryset(obj)
 
             query = (
                 "SELECT SUM((data->>'sprayed/sprayable_notsprayed')::int)"
                 " as id FROM main_sprayday WHERE location_id IN %s"
-                " AND data->>%s IN %s"
+                " AND unsprayed_reason IN %s"
             )
             location_pks = list(get_ta_in_location(obj))
             if len(location_pks) == 0:
                 return 0
-            params = [tuple(location_pks), REASON_FIELD, tuple(REASON_OTHER)]
+            params = [tuple(location_pks), tuple(REASON_OTHER)]
 
             return cached_queryset_count(key, queryset, query, params)
 
 
+class SprayAreaIndicatorsListSerializer(serializers.ListSerializer):
+    """Prefetch the spray area indicators of all the spray areas at once."""
+
+    def to_representation(self, data):
+        iterable = data.all() if isinstance(data, Manager) else data
+        items = list(iterable)
+        location_ids = []
+        for item in items:
+            if isinstance(item, dict):
+                level, location_id = item.get("level"), item.get("pk")
+            else:
+                level, location_id = getattr(item, "level", None), item.pk
+            if level == TA_LEVEL:
+                location_ids.append(location_id)
+        prefetch_spray_area_indicators(location_ids, self.context)
+
+        return super(
+            SprayAreaIndicatorsListSerializer, self
+        ).to_representation(items)
+
+
 class SprayOperatorDailySummaryMixin(object):
     """
     Adds data from SprayOperatorDailySummary
@@ -992,9 +1122,7 @@ class SprayOperatorDailySummaryMixin(object):
 
     def get_sop_summary_queryset(self, obj):
         sprayday_qs = self.get_queryset(obj)
-        formids = sprayday_qs.annotate(
-            sprayformid=KeyTextTransform("sprayformid", "data")
-        ).values_list("sprayformid", flat=True)
+        formids = sprayday_qs.values_list("sprayformid", flat=True)
         formids = list(set([x for x in formids if x is not None]))
         qs = SprayOperatorDailySummary.objects.filter(
             spray_form_id__in=formids
@@ -1106,6 +1234,7 @@ class TargetAreaSerializer(TargetAreaMixin, serializers.ModelSerializer):
             "priority",
         )
         model = Location
+        list_serializer_class = SprayAreaIndicatorsListSerializer
 
     def get_district(self, obj):
         if obj:
@@ -1296,6 +1425,28 @@ class TargetAreaQuerySerializer(
             "priority",
         )
         model = TargetArea
+        list_serializer_class = SprayAreaIndicatorsListSerializer
+
+
+class SimplifiedGeometryField(GeometryField):
+    """
+    Location geom simplified at the level of the simplify or zoom query
+    parameter of the request, the simplify context value when both are
+    missing.
+    """
+
+    def get_attribute(self, instance):
+        if not isinstance(instance, Location):
+            return super().get_attribute(instance)
+
+        request = self.context.get("request")
+        query_params = getattr(
+            request, "query_params", getattr(request, "GET", {})
+        )
+
+        return instance.get_geom(
+            get_simplify_level(query_params, self.context.get("simplify"))
+        )
 
 
 class GeoTargetAreaSerializer(TargetAreaMixin, GeoFeatureModelSerializer):
@@ -1315,7 +1466,7 @@ class GeoTargetAreaSerializer(TargetAreaMixin, GeoFeatureModelSerializer):
     not_visited = serializers.SerializerMethodField()
     is_sensitized = serializers.NullBooleanField()
     is_mobilised = serializers.NullBooleanField()
-    geom = GeometryField()
+    geom = SimplifiedGeometryField()
 
     class Meta:
         fields = (
@@ -1342,6 +1493,9 @@ class GeoTargetAreaSerializer(TargetAreaMixin, GeoFeatureModelSerializer):
 
 
 class GeoHealthFacilitySerializer(GeoFeatureModelSerializer):
+    geom = SimplifiedGeometryField()
+
     class Meta:
         model = Location
         geo_field = "geom"
+        exclude = ("geom_low", "geom_medium", "geom_high")
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Spatial index of spray areas for resolving the spray area of a geometry.
+
+The spray area polygons are loaded once per process into a grid of prepared
+GEOS geometries so that finding the spray area of a submission or structure
+does not need a polygon containment query on the database.
+"""
+import threading
+import time
+from math import floor
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSException, Point
+from django.core.cache import cache
+
+from mspray.apps.main.models.location import Location
+
+TA_LEVEL = settings.MSPRAY_TA_LEVEL
+TARGET_AREA_INDEX = getattr(settings, "MSPRAY_TARGET_AREA_INDEX", True)
+TARGET_AREA_INDEX_CELL_SIZE = getattr(
+    settings, "MSPRAY_TARGET_AREA_INDEX_CELL_SIZE", 0.05
+)  # degrees
+TARGET_AREA_INDEX_TIMEOUT = getattr(
+    settings, "MSPRAY_TARGET_AREA_INDEX_TIMEOUT", 3600
+)  # seconds
+TARGET_AREA_INDEX_VERSION_KEY = "target-area-index-version"
+
+_lock = threading.Lock()
+_state = {"index": None, "version": None, "loaded_on": 0}
+
+
+class TargetAreaIndex(object):
+    """
+    A grid of the prepared geometries of spray areas.
+
+    Spray areas are kept in tree order so a query returns the same spray area
+    as Location.objects.filter(...).first().
+    """
+
+    def __init__(self, locations, cell_size=TARGET_AREA_INDEX_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        for pk, target, geom in locations:
+            xmin, ymin, xmax, ymax = geom.extent
+            entry = (pk, target, geom.extent, geom.prepared)
+            for x in range(self._cell(xmin), self._cell(xmax) + 1):
+                for y in range(self._cell(ymin), self._cell(ymax) + 1):
+                    self.cells.setdefault((x, y), []).append(entry)
+
+    def _cell(self, value):
+        return int(floor(value / self.cell_size))
+
+    def query(self, geom, target=None, predicate="contains"):
+        """
+        Returns the primary key of the first spray area that contains (or
+        covers) geom, None if there is no such spray area.
+        """
+        point = geom if isinstance(geom, Point) else geom.point_on_surface
+        x, y = point.coords[:2]
+        xmin, ymin, xmax, ymax = geom.extent
+        for pk, area_target, extent, prepared in self.cells.get(
+            (self._cell(x), self._cell(y)), []
+        ):
+            if target is not None and area_target != target:
+                continue
+            if (
+                extent[0] > xmin
+                or extent[1] > ymin
+                or extent[2] < xmax
+                or extent[3] < ymax
+            ):
+                continue
+            if getattr(prepared, predicate)(geom):
+                return pk
+
+        return None
+
+
+def load_target_area_index():
+    """Returns a TargetAreaIndex of all spray areas with a geometry."""
+    locations = (
+        Location.objects.filter(level=TA_LEVEL, geom__isnull=False)
+        .order_by("tree_id", "lft")
+        .values_list("pk", "target", "geom")
+    )
+
+    return TargetAreaIndex(locations.iterator())
+
+
+def get_target_area_index():
+    """
+    Returns the spray area index of this process, loading it when missing,
+    older than TARGET_AREA_INDEX_TIMEOUT or invalidated by another process.
+    """
+    version = cache.get(TARGET_AREA_INDEX_VERSION_KEY)
+    with _lock:
+        if (
+            _state["index"] is None
+            or _state["version"] != version
+            or time.time() - _state["loaded_on"] > TARGET_AREA_INDEX_TIMEOUT
+        ):
+            _state["index"] = load_target_area_index()
+            _state["version"] = version
+            _state["loaded_on"] = time.time()
+
+        return _state["index"]
+
+
+def clear_target_area_index():
+    """Invalidates the spray area index of every process."""
+    with _lock:
+        _state["index"] = None
+    cache.set(TARGET_AREA_INDEX_VERSION_KEY, uuid4().hex, None)
+
+
+def resolve_target_area(geom, target=None, predicate="contains"):
+    """
+    Returns the first spray area Location that contains geom, or covers geom
+    when predicate is "covers". Only spray areas with a matching target flag
+    are considered when target is not None.
+
+    The spray area is looked up in the process spray area index and in the
+    database when the index has no match, is disabled or is out of date.
+    """
+    if geom is None:
+        return None
+
+    if geom.srid and geom.srid != 4326:
+        geom = geom.transform(4326, clone=True)
+
+    if TARGET_AREA_INDEX:
+        try:
+            pk = get_target_area_index().query(geom, target, predicate)
+        except GEOSException:
+            pk = None
+        if pk is not None:
+            try:
+                return Location.objects.get(pk=pk)
+            except Location.DoesNotExist:
+                clear_target_area_index()
+
+    queryset = Location.objects.filter(
+        level=TA_LEVEL, **{"geom__{}".format(predicate): geom}
+    )
+    if target is not None:
+        queryset = queryset.filter(target=target)
+
+    return queryset.first()
@@ -2,7 +2,7 @@
 """Mspray task module."""
 from __future__ import absolute_import
 
-import gc
+import json
 import logging
 import os
 from datetime import timedelta
@@ -10,18 +10,22 @@ from datetime import timedelta
 from django.conf import settings
 from django.contrib.gis.geos import Point
 from django.contrib.gis.geos.polygon import Polygon
+from django.core.cache import cache
+from django.db import connection, transaction
 from django.db.models import Q, Sum, Value
 from django.db.models.functions import Coalesce
 from django.db.utils import IntegrityError
 from django.utils import timezone
 
 from mspray.apps.alerts.tasks import no_gps, user_distance
+from mspray.apps.main.location_cache import bump_location_versions
 from mspray.apps.main.models import (
     DirectlyObservedSprayingForm,
     Household,
     Location,
     Mobilisation,
     SensitizationVisit,
+    SprayAreaIndicators,
     SprayDay,
     SprayOperatorDailySummary,
     WeeklyReport,
@@ -35,10 +39,30 @@ from mspray.apps.main.models.spray_day import (
     STRUCTURE_GPS_FIELD,
     get_osmid,
 )
-from mspray.apps.warehouse.tasks import stream_to_druid
+from mspray.apps.main.reconciliation import (
+    find_missing_ids,
+    find_missing_sprayformids,
+    remove_deleted,
+    sync_form_changes,
+)
+from mspray.apps.main.spatial import resolve_target_area
+from mspray.apps.main.tiles import invalidate_location_tiles
+from mspray.apps.warehouse.tasks import (
+    DRUID_STREAM_BATCHING,
+    queue_stream_to_druid,
+    stream_to_druid,
+)
 from mspray.celery import app
-from mspray.libs.ona import fetch_form_data, fetch_osm_xml
-from mspray.libs.osm import parse_osm, parse_osm_nodes, parse_osm_ways
+from mspray.libs.ona import (
+    fetch_form_data,
+    fetch_osm_xml,
+    fetch_submissions,
+)
+from mspray.libs.osm import (
+    iter_osm,
+    parse_osm_nodes,
+    parse_osm_ways,
+)
 from mspray.libs.utils.geom_buffer import with_metric_buffer
 
 BUFFER_SIZE = getattr(settings, "MSPRAY_NEW_BUFFER_WIDTH", 4)  # default to 4m
@@ -54,6 +78,48 @@ LOCATION_SPRAYED_PERCENTAGE = getattr(
     settings, "LOCATION_SPRAYED_PERCENTAGE", 90
 )
 UPDATE_VISITED_MINUTES = getattr(settings, "UPDATE_VISITED_MINUTES", 5)
+ENABLE_SPRAYED_VISITED_ROLLUP = getattr(
+    settings, "ENABLE_SPRAYED_VISITED_ROLLUP", False
+)
+SPRAYED_VISITED_ROLLUP_DELAY = getattr(
+    settings, "SPRAYED_VISITED_ROLLUP_DELAY", 60
+)  # seconds
+SPRAYED_VISITED_ROLLUP_KEY = "sprayed-visited-rollup-scheduled"
+SUBMISSION_INTAKE_DELAY = getattr(
+    settings, "MSPRAY_SUBMISSION_INTAKE_DELAY", 5
+)  # seconds
+SUBMISSION_INTAKE_KEY = "submission-intake-scheduled"
+WEEKLY_REPORT_UPSERT_SQL = (
+    'INSERT INTO "main_weeklyreport" ("week_number", "location_id", '
+    '"visited", "sprayed", "structures", "created_on", "modified_on") '
+    "VALUES {} "
+    'ON CONFLICT ("week_number", "location_id") DO UPDATE SET '
+    '"visited" = EXCLUDED."visited", "sprayed" = EXCLUDED."sprayed", '
+    '"structures" = EXCLUDED."structures", '
+    '"modified_on" = EXCLUDED."modified_on";'
+)
+WEEKLY_REPORT_UPSERT_BATCH_SIZE = 1000
+OSM_HOUSEHOLD_BATCH_SIZE = getattr(settings, "OSM_HOUSEHOLD_BATCH_SIZE", 1000)
+UPSERT_OSM_HOUSEHOLDS_SQL = """
+WITH "ways" AS (
+    SELECT * FROM unnest(%(hh_ids)s::integer[], %(geoms)s::text[], %(centroids)s::text[], %(bgeoms)s::text[], %(data)s::text[]) AS "ways" ("hh_id", "geom", "centroid", "bgeom", "data")
+), "located" AS (
+    SELECT DISTINCT ON ("ways"."hh_id") "ways"."hh_id", "ways"."centroid", "ways"."bgeom", "ways"."data", COALESCE("ta"."id", %(fallback)s) AS "location_id"
+    FROM "ways" LEFT OUTER JOIN "main_location" "ta" ON "ta"."level" = 'ta' AND ST_Contains("ta"."geom", ST_SetSRID(ST_GeomFromEWKT("ways"."geom"), 4326))
+    ORDER BY "ways"."hh_id", "ta"."tree_id", "ta"."lft"
+)
+INSERT INTO "main_household" ("hh_id", "geom", "bgeom", "location_id", "rhc_id", "district_id", "data", "created_on", "modified_on")
+SELECT "located"."hh_id", ST_SetSRID(ST_GeomFromEWKT("located"."centroid"), 4326), ST_SetSRID(ST_GeomFromEWKT("located"."bgeom"), 4326), "located"."location_id", "ta"."parent_id", "rhc"."parent_id", "located"."data"::jsonb, %(now)s, %(now)s
+FROM "located" INNER JOIN "main_location" "ta" ON "ta"."id" = "located"."location_id" LEFT OUTER JOIN "main_location" "rhc" ON "rhc"."id" = "ta"."parent_id"
+ON CONFLICT ("hh_id") {on_conflict}
+RETURNING "location_id", (xmax = 0) AS "inserted";
+"""  # noqa
+OSM_HOUSEHOLD_UPDATE = (
+    'DO UPDATE SET "geom" = EXCLUDED."geom", "bgeom" = EXCLUDED."bgeom", '
+    '"location_id" = EXCLUDED."location_id", "rhc_id" = EXCLUDED."rhc_id", '
+    '"district_id" = EXCLUDED."district_id", "data" = EXCLUDED."data", '
+    '"modified_on" = EXCLUDED."modified_on"'
+)
 DIRECTLY_OBSERVED_FORM_ID = getattr(
     settings, "DIRECTLY_OBSERVED_FORM_ID", None
 )
@@ -75,13 +141,7 @@ def get_new_structure_location(data, geom, is_node=False):
             if gps_field is not None
             else geom
         )
-    location = None
-    if geom is not None:
-        locations = Location.objects.filter(
-            geom__contains=geom, target=True, level=settings.MSPRAY_TA_LEVEL
-        )
-        if locations:
-            location = locations[0]
+    location = resolve_target_area(geom, target=True)
 
     return location, geom
 
@@ -115,11 +175,9 @@ def get_location_from_osm(data):
         if len(geoms):
             geom = geoms[0]["geom"]
             is_node = isinstance(geom, Point)
-            locations = Location.objects.filter(
-                geom__covers=geom, target=True, level=settings.MSPRAY_TA_LEVEL
+            location = resolve_target_area(
+                geom, target=True, predicate="covers"
             )
-            if locations:
-                location = locations.first()
         else:
             location = get_location_from_data(data)
 
@@ -166,7 +224,10 @@ def run_tasks_after_spray_data(sprayday):
 
     # stream to druid
     if getattr(settings, "STREAM_TO_DRUID", False):
-        stream_to_druid.delay(sprayday.id)
+        if DRUID_STREAM_BATCHING:
+            queue_stream_to_druid([sprayday.id])
+        else:
+            stream_to_druid.delay(sprayday.id)
 
 
 @app.task
@@ -236,45 +297,82 @@ def link_spraypoint_with_osm(spray_day_id):
         return spray_day.pk
 
 
-def _create_household(way, location):
+def upsert_osm_households(ways, fallback_location_id=None, update=False):
+    """Create households from parsed OSM ways in a single statement.
 
-    bgeom = None
-    if isinstance(way.get("geom"), Polygon):
-        bgeom = way.get("geom")
+    Each way is assigned the first spray area containing it, or
+    fallback_location_id, with a spatial join. Ways without a spray area are
+    skipped, existing households are updated when update is True and skipped
+    otherwise. Returns a dict of inserted, updated and skipped counts.
+    """
+    params = {
+        "hh_ids": [],
+        "geoms": [],
+        "centroids": [],
+        "bgeoms": [],
+        "data": [],
+        "fallback": fallback_location_id,
+        "now": timezone.now(),
+    }
+    for way in ways:
+        geom = way.get("geom")
+        params["hh_ids"].append(int(way.get("osm_id")))
+        params["geoms"].append(geom.ewkt)
+        params["centroids"].append(geom.centroid.ewkt)
+        params["bgeoms"].append(
+            geom.ewkt if isinstance(geom, Polygon) else None
+        )
+        params["data"].append(json.dumps(way.get("tags")))
 
-    try:
-        Household.objects.create(
-            hh_id=way.get("osm_id"),
-            geom=way.get("geom").centroid,
-            bgeom=bgeom,
-            data=way.get("tags"),
-            location=location,
+    counts = {"inserted": 0, "updated": 0, "skipped": len(ways)}
+    if not ways:
+        return counts
+
+    on_conflict = OSM_HOUSEHOLD_UPDATE if update else "DO NOTHING"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPSERT_OSM_HOUSEHOLDS_SQL.format(on_conflict=on_conflict), params
         )
-    except Household.DoesNotExist:
-        pass
-    except IntegrityError:
-        pass
+        rows = cursor.fetchall()
+
+    for _location_id, inserted in rows:
+        counts["inserted" if inserted else "updated"] += 1
+    counts["skipped"] -= len(rows)
+    location_ids = set(location_id for location_id, _ in rows)
+    SprayAreaIndicators.refresh(location_ids)
+    invalidate_location_tiles(location_ids)
+
+    return counts
 
 
 @app.task
-def process_osm_file(path):
-    with open(path) as f:
-        name = os.path.basename(path).replace(".osm", "")
-        content = f.read()
-        nodes = parse_osm(content.strip())
-        ways = [way for way in nodes if way.get("osm_type") == "way"]
-        if ways:
-            for way in ways:
-                location = (
-                    Location.objects.filter(
-                        geom__contains=ways[0].get("geom"), level="ta"
-                    ).first()
-                    or Location.objects.filter(name=name, level="ta").first()
-                )
+def process_osm_file(path, update=False, batch_size=OSM_HOUSEHOLD_BATCH_SIZE):
+    """Load the ways in an OSM file as households.
 
-                if location:
-                    _create_household(way, location)
-    gc.collect()
+    Ways are streamed from the file and written batch_size at a time, ways
+    outside a spray area fall back to the spray area named after the file.
+    Returns a dict of inserted, updated and skipped counts.
+    """
+    name = os.path.basename(path).replace(".osm", "")
+    fallback = (
+        Location.objects.filter(name=name, level="ta")
+        .values_list("pk", flat=True)
+        .first()
+    )
+    counts = {"inserted": 0, "updated": 0, "skipped": 0}
+    batch = []
+    for way in iter_osm(path, osm_type="way"):
+        batch.append(way)
+        if len(batch) == batch_size:
+            for key, value in upsert_osm_households(
+                batch, fallback, update
+            ).items():
+                counts[key] += value
+            batch = []
+    for key, value in upsert_osm_households(batch, fallback, update).items():
+        counts[key] += value
+
+    return counts
 
 
 @app.task
@@ -286,8 +384,8 @@ def refresh_data_with_no_osm():
                 link_spraypoint_with_osm.delay(rec.pk)
 
     data = (
-        SprayDay.objects.exclude(data__has_key="osmstructure:way:id")
-        .exclude(data__has_key="osmstructure:node:id")
+        SprayDay.objects.exclude(has_osm_way=True)
+        .exclude(has_osm_node=True)
         .filter(data__has_key="osmstructure")
     )
     found = data.count()
@@ -316,6 +414,228 @@ def set_sprayed_visited_week(
     report.save()
 
 
+def get_sprayed_visited_status(total_structures, found, sprayed):
+    """Return (visited, sprayed) flags of a spray area.
+
+    A spray area is visited once LOCATION_VISITED_PERCENTAGE of its structures
+    are found and sprayed once LOCATION_SPRAYED_PERCENTAGE are sprayed.
+    """
+    visited_status = 0
+    sprayed_status = 0
+
+    if total_structures and found:
+        ratio = round((found * 100) / total_structures)
+        if ratio >= LOCATION_VISITED_PERCENTAGE:
+            visited_status = 1
+
+    if total_structures and sprayed:
+        ratio = round((sprayed * 100) / total_structures)
+        if ratio >= LOCATION_SPRAYED_PERCENTAGE:
+            sprayed_status = 1
+
+    return visited_status, sprayed_status
+
+
+def upsert_weekly_reports(week_number, reports):
+    """Insert or update WeeklyReport records in batches.
+
+    reports is a list of (location_id, visited, sprayed, structures) tuples.
+    """
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        for i in range(0, len(reports), WEEKLY_REPORT_UPSERT_BATCH_SIZE):
+            batch = reports[i:i + WEEKLY_REPORT_UPSERT_BATCH_SIZE]
+            params = []
+            for location_id, visited, sprayed, structures in batch:
+                params.extend(
+                    [
+                        week_number,
+                        location_id,
+                        visited,
+                        sprayed,
+                        structures,
+                        now,
+                        now,
+                    ]
+                )
+            cursor.execute(
+                WEEKLY_REPORT_UPSERT_SQL.format(
+                    ", ".join(["(%s, %s, %s, %s, %s, %s, %s)"] * len(batch))
+                ),
+                params,
+            )
+
+
+def update_location_sprayed_visited(values):
+    """Write visited and sprayed values to locations.
+
+    values is a dict of {location_id: (visited, sprayed)}, locations sharing
+    the same values are updated with one query.
+    """
+    groups = {}
+    for location_id, status in values.items():
+        groups.setdefault(status, []).append(location_id)
+
+    for (visited, sprayed), location_ids in groups.items():
+        Location.objects.filter(pk__in=location_ids).update(
+            visited=visited, sprayed=sprayed
+        )
+
+
+def mark_locations_for_rollup(location_ids):
+    """Flag locations whose visited and sprayed values need recomputing.
+
+    The cached values of the locations are invalidated at once. Schedules a
+    debounced rollup_sprayed_visited task when ENABLE_SPRAYED_VISITED_ROLLUP
+    is set, otherwise the flagged locations are picked up by the periodic
+    update_sprayed_visited_week task.
+    """
+    location_ids = set(pk for pk in location_ids if pk is not None)
+    if not location_ids:
+        return
+
+    bump_location_versions(location_ids)
+    Location.objects.filter(pk__in=location_ids, rollup_pending=False).update(
+        rollup_pending=True
+    )
+    if ENABLE_SPRAYED_VISITED_ROLLUP and cache.add(
+        SPRAYED_VISITED_ROLLUP_KEY, True, SPRAYED_VISITED_ROLLUP_DELAY
+    ):
+        rollup_sprayed_visited.apply_async(
+            countdown=SPRAYED_VISITED_ROLLUP_DELAY
+        )
+
+
+def mark_all_locations_for_rollup():
+    """Flag every location with submissions for a rollup."""
+    submissions = SprayDay.objects.exclude(location__isnull=True)
+    Location.objects.filter(
+        Q(pk__in=submissions.values("location"))
+        | Q(pk__in=submissions.values("location__parent"))
+        | Q(pk__in=submissions.values("location__parent__parent"))
+    ).update(rollup_pending=True)
+
+
+def _rollup_spray_areas(location_ids, week_number):
+    from mspray.apps.main.serializers.target_area import (
+        get_spray_area_stats,
+        prefetch_spray_area_indicators,
+    )
+
+    SprayAreaIndicators.refresh(location_ids)
+    context = {"week_number": week_number}
+    prefetch_spray_area_indicators(location_ids, context)
+    values = {}
+    reports = []
+    queryset = Location.objects.filter(pk__in=location_ids).select_related(
+        "spray_area_indicators"
+    )
+    for location in queryset:
+        values[location.pk] = get_sprayed_visited_status(
+            location.structures_on_ground,
+            location.visited_found,
+            location.visited_sprayed,
+        )
+        data, structures = get_spray_area_stats(location, context)
+        visited, sprayed = get_sprayed_visited_status(
+            structures, data.get("found"), data.get("sprayed")
+        )
+        reports.append((location.pk, visited, sprayed, structures))
+
+    update_location_sprayed_visited(values)
+    upsert_weekly_reports(week_number, reports)
+
+
+def _rollup_parents(location_ids, week_number, children_key):
+    values = dict((pk, (0, 0)) for pk in location_ids)
+    reports = dict((pk, (pk, 0, 0, 0)) for pk in location_ids)
+    queryset = (
+        Location.objects.filter(parent__in=location_ids)
+        .values("parent")
+        .annotate(
+            visited_sum=Coalesce(Sum("visited", distinct=True), Value(0)),
+            sprayed_sum=Coalesce(Sum("sprayed", distinct=True), Value(0)),
+        )
+    )
+    for row in queryset:
+        values[row["parent"]] = (row["visited_sum"], row["sprayed_sum"])
+
+    queryset = (
+        WeeklyReport.objects.filter(
+            **{"week_number": week_number, children_key + "__in": location_ids}
+        )
+        .values(children_key)
+        .annotate(
+            structures_sum=Coalesce(
+                Sum("structures", distinct=True), Value(0)
+            ),
+            visited_sum=Coalesce(Sum("visited", distinct=True), Value(0)),
+            sprayed_sum=Coalesce(Sum("sprayed", distinct=True), Value(0)),
+        )
+    )
+    for row in queryset:
+        reports[row[children_key]] = (
+            row[children_key],
+            row["visited_sum"],
+            row["sprayed_sum"],
+            row["structures_sum"],
+        )
+
+    update_location_sprayed_visited(values)
+    upsert_weekly_reports(week_number, list(reports.values()))
+
+
+def rollup_locations_sprayed_visited(week_number=None):
+    """Recompute visited and sprayed for locations flagged for a rollup.
+
+    Spray areas are computed first followed by RHCs and districts, Location
+    and WeeklyReport records are written in bulk. Returns the number of
+    locations recomputed.
+    """
+    if not week_number:
+        week_number = int(timezone.now().strftime("%W"))
+    if not WeeklyReport.objects.filter(week_number=week_number).exists():
+        # a new week, every location needs a weekly report.
+        mark_all_locations_for_rollup()
+
+    cache.delete(SPRAYED_VISITED_ROLLUP_KEY)
+    # the flags are cleared in the same transaction as the rollup so that a
+    # failed rollup leaves them set, the claimed rows stay locked against a
+    # concurrent rollup until it commits
+    with transaction.atomic():
+        pending = list(
+            Location.objects.select_for_update(skip_locked=True)
+            .filter(rollup_pending=True)
+            .values_list("pk", "level")
+        )
+        Location.objects.filter(pk__in=[pk for pk, _ in pending]).update(
+            rollup_pending=False
+        )
+
+        levels = {}
+        for pk, level in pending:
+            levels.setdefault(level, []).append(pk)
+
+        if levels.get("ta"):
+            _rollup_spray_areas(levels["ta"], week_number)
+        if levels.get("RHC"):
+            _rollup_parents(levels["RHC"], week_number, "location__parent")
+        if levels.get("district"):
+            _rollup_parents(
+                levels["district"], week_number, "location__parent__parent"
+            )
+
+    bump_location_versions(pk for pk, _level in pending)
+
+    return len(pending)
+
+
+@app.task
+def rollup_sprayed_visited(week_number=None):
+    """Recompute visited and sprayed for locations flagged for a rollup."""
+    return rollup_locations_sprayed_visited(week_number)
+
+
 @app.task
 def task_set_sprayed_visited(location_id, week_number=None):
     try:
@@ -335,9 +655,6 @@ def set_sprayed_visited(location, week_number=None):
     from mspray.apps.main.serializers.target_area import get_spray_area_stats
 
     if location.level == "ta":
-        sprayed = 0
-        visited = 0
-
         if week_number:
             context = {"week_number": week_number}
             data, total_structures = get_spray_area_stats(location, context)
@@ -348,15 +665,9 @@ def set_sprayed_visited(location, week_number=None):
             found = location.visited_found
             visited_sprayed = location.visited_sprayed
 
-        if total_structures and found:
-            ratio = round((found * 100) / total_structures)
-            if ratio >= LOCATION_VISITED_PERCENTAGE:
-                visited = 1
-
-        if total_structures and visited_sprayed:
-            ratio = round((visited_sprayed * 100) / total_structures)
-            if ratio >= LOCATION_SPRAYED_PERCENTAGE:
-                sprayed = 1
+        visited, sprayed = get_sprayed_visited_status(
+            total_structures, found, visited_sprayed
+        )
 
         if week_number:
             # print(week_number, location, week_number, visited, sprayed)
@@ -366,7 +677,7 @@ def set_sprayed_visited(location, week_number=None):
         else:
             location.visited = visited
             location.sprayed = sprayed
-            location.save()
+            location.save(update_fields=["visited", "sprayed"])
     else:
         if week_number:
             kwargs = {"week_number": week_number}
@@ -397,7 +708,7 @@ def set_sprayed_visited(location, week_number=None):
             )
             location.visited = queryset.get("visited_sum") or 0
             location.sprayed = queryset.get("sprayed_sum") or 0
-            location.save()
+            location.save(update_fields=["visited", "sprayed"])
 
 
 @app.task
@@ -432,29 +743,10 @@ def update_sprayed_visited_week(
     time_within=UPDATE_VISITED_MINUTES, week_number=None
 ):
     """
-    Sets 'sprayed' and 'visited' values for locations on submissions within
-    UPDATE_VISITED_MINUTES which defaults to every 5 minutes.
+    Sets 'sprayed' and 'visited' values for locations whose submissions have
+    changed since the last run, see rollup_locations_sprayed_visited().
     """
-
-    def _set_sprayed_visited(key):
-        for loc_id in submissions.values_list(key, flat=True).distinct():
-            location = Location.objects.get(pk=loc_id)
-            set_sprayed_visited(location, week_number=week_number)
-
-    # time_since = timezone.now() - timedelta(minutes=time_within + 1)
-    # submissions = SprayDay.objects.filter(created_on__gte=time_since)\
-    submissions = SprayDay.objects.filter().exclude(location__isnull=True)
-    if not week_number:
-        week_number = int(timezone.now().strftime("%W"))
-
-    # spray areas
-    _set_sprayed_visited("location")
-
-    # RHC
-    _set_sprayed_visited("location__parent")
-
-    # District
-    _set_sprayed_visited("location__parent__parent")
+    return rollup_locations_sprayed_visited(week_number)
 
 
 @app.task
@@ -483,9 +775,7 @@ def remove_deleted_records():
             return count
 
         pks = [i["_id"] for i in data]
-        deleted_submissions = SprayDay.objects.exclude(submission_id__in=pks)
-        count = deleted_submissions.count()
-        deleted_submissions.delete()
+        count = remove_deleted(SprayDay, pks)
 
     return count
 
@@ -497,19 +787,9 @@ def update_edited_records():
     """
     count = 0
     if FORM_ID:
-        data = fetch_form_data(FORM_ID, dataids_only=True, edited_only=True)
-        if not data:
-            return count
+        from mspray.apps.main.utils import add_spray_data
 
-        pks = [i["_id"] for i in data]
-        edited_submissions = SprayDay.objects.filter(submission_id__in=pks)
-        for rec in edited_submissions:
-            data = fetch_form_data(FORM_ID, dataid=rec.submission_id)
-            if data:
-                from mspray.apps.main.utils import add_spray_data
-
-                add_spray_data(data)
-                count += 1
+        count = sync_form_changes(FORM_ID, add_spray_data, SprayDay)
 
     return count
 
@@ -528,11 +808,7 @@ def remove_deleted_daily_summary_records():
             return count
 
         pks = [i["_id"] for i in data]
-        records = SprayOperatorDailySummary.objects.exclude(
-            submission_id__in=pks
-        )
-        count = records.count()
-        records.delete()
+        count = remove_deleted(SprayOperatorDailySummary, pks)
 
     return count
 
@@ -551,20 +827,15 @@ def fetch_directly_observed():
             return count
 
         pks = [i["_id"] for i in data]
-        received = DirectlyObservedSprayingForm.objects.values_list(
-            "submission_id", flat=True
-        )
-        new_ids = set(pks).difference(set((i for i in received)))
+        new_ids = find_missing_ids(DirectlyObservedSprayingForm, pks)
 
-        for rec in new_ids:
-            data = fetch_form_data(formid, dataid=rec)
-            if data:
-                from mspray.apps.main.utils import (
-                    add_directly_observed_spraying_data
-                )  # NOQA
+        from mspray.apps.main.utils import (
+            add_directly_observed_spraying_data
+        )  # NOQA
 
-                add_directly_observed_spraying_data(data)
-                count += 1
+        for data in fetch_submissions(formid, new_ids):
+            add_directly_observed_spraying_data(data)
+            count += 1
 
     return count
 
@@ -578,20 +849,15 @@ def fetch_updated_directly_observed():
     dos = DirectlyObservedSprayingForm.objects.last()
     formid = dos.data.get("_xform_id") if dos else DIRECTLY_OBSERVED_FORM_ID
     if formid:
-        data = fetch_form_data(formid, dataids_only=True, edited_only=True)
-        if not data:
-            return count
-
-        pks = [i["_id"] for i in data]
-        for rec in pks:
-            data = fetch_form_data(formid, dataid=rec)
-            if data:
-                from mspray.apps.main.utils import (
-                    add_directly_observed_spraying_data
-                )  # NOQA
-
-                add_directly_observed_spraying_data(data)
-                count += 1
+        from mspray.apps.main.utils import (
+            add_directly_observed_spraying_data
+        )  # NOQA
+
+        count = sync_form_changes(
+            formid,
+            add_directly_observed_spraying_data,
+            DirectlyObservedSprayingForm,
+        )
 
     return count
 
@@ -610,15 +876,62 @@ def remove_deleted_dos_records():
             return count
 
         pks = [i["_id"] for i in data]
-        deleted_submissions = DirectlyObservedSprayingForm.objects.exclude(
-            submission_id__in=pks
-        )
-        count = deleted_submissions.count()
-        deleted_submissions.delete()
+        count = remove_deleted(DirectlyObservedSprayingForm, pks)
 
     return count
 
 
+@app.task
+def create_location_households_buffer_task(
+    location_id, distance=15, recreate=False
+):
+    """
+    Create the households buffers of a spray area.
+    """
+    from mspray.apps.main.utils import create_location_households_buffer
+
+    return create_location_households_buffer(location_id, distance, recreate)
+
+
+@app.task
+def link_new_structures_to_existing_task(location_id, distance=10):
+    """
+    Match the new structures of a spray area to existing households.
+    """
+    from mspray.apps.main.utils import link_new_structures_to_existing
+
+    try:
+        location = Location.objects.get(pk=location_id)
+    except Location.DoesNotExist:
+        return 0
+
+    return link_new_structures_to_existing(location, distance)
+
+
+def queue_submission_intake():
+    """
+    Schedule a process_submission_intake task SUBMISSION_INTAKE_DELAY seconds
+    after the first of a burst of staged submissions.
+    """
+    if cache.add(SUBMISSION_INTAKE_KEY, True, SUBMISSION_INTAKE_DELAY):
+        process_submission_intake.apply_async(
+            countdown=SUBMISSION_INTAKE_DELAY
+        )
+
+
+@app.task
+def process_submission_intake():
+    """
+    Add the submissions staged by the submission webhook.
+    """
+    from mspray.apps.main.utils import (
+        process_submission_intake as _process_submission_intake,
+    )
+
+    cache.delete(SUBMISSION_INTAKE_KEY)
+    return _process_submission_intake()
+
+
 @app.task
 def check_missing_data():
     """
@@ -647,12 +960,9 @@ def check_missing_unique_link():
     """
     from mspray.apps.main.utils import queryset_iterator
 
-    queryset = SprayDay.objects.filter(spraypoint__isnull=True).only(
-        "pk", "location_id"
-    )
-    for record in queryset_iterator(queryset):
+    queryset = SprayDay.objects.filter(spraypoint__isnull=True)
+    for record in queryset_iterator(queryset, only=("pk", "location_id")):
         add_unique_record(record.pk, record.location_id)
-        gc.collect()
 
 
 @app.task
@@ -661,32 +971,20 @@ def update_performance_reports(update_all=True):
     Update performance records updated in the last UPDATE_VISITED_MINUTES
     minutes.
     """
-    from mspray.apps.main.utils import performance_report
+    from mspray.apps.main.utils import build_performance_reports
 
     time_within = UPDATE_VISITED_MINUTES
     time_since = timezone.now() - timedelta(minutes=time_within + 1)
 
+    submissions = SprayDay.objects.filter(
+        Q(created_on__gte=time_since) | Q(modified_on__gte=time_since)
+    )
     if update_all:
-        submissions = SprayDay.objects.all()
-    else:
         submissions = SprayDay.objects.filter(
-            Q(created_on__gte=time_since) | Q(modified_on__gte=time_since)
-        )
-
-    sop_queryset = (
-        SprayDay.objects.filter(
-            Q(created_on__gte=time_since) | Q(modified_on__gte=time_since)
+            spray_operator__in=submissions.values("spray_operator")
         )
-        .filter(spray_operator__isnull=False)
-        .only("spray_operator")
-        .distinct("spray_operator")
-    )
 
-    for record in sop_queryset:
-        performance_report(
-            record.spray_operator,
-            submissions.filter(spray_operator=record.spray_operator),
-        )
+    return build_performance_reports(submissions)
 
 
 @app.task
@@ -694,34 +992,23 @@ def sync_performance_reports():
     """
     Task to find missing performance reports and sync them back in
     """
-    from mspray.apps.main.utils import find_missing_performance_report_records
-    from mspray.apps.main.utils import performance_report
-    from mspray.apps.main.utils import queryset_iterator
+    from mspray.apps.main.utils import build_performance_reports
 
-    missing_sprayformids = find_missing_performance_report_records()
+    missing_sprayformids = find_missing_sprayformids()
 
-    queryset = SprayDay.objects.filter(
-        data__sprayformid__in=missing_sprayformids
-    ).distinct("spray_operator")
-
-    for record in queryset_iterator(queryset):
-        performance_report(record.spray_operator)
+    return build_performance_reports(
+        SprayDay.objects.filter(sprayformid__in=missing_sprayformids)
+    )
 
 
 def get_missing_ids(formid, target_class):
     """Return submission ids not yet synchronised."""
     data_ids = fetch_form_data(formid, dataids_only=True)
     if data_ids:
-        data_ids = set(i["_id"] for i in data_ids)
-        existing = set(
-            i
-            for i in target_class.objects.values_list(
-                "submission_id", flat=True
-            )
+        return set(
+            find_missing_ids(target_class, [i["_id"] for i in data_ids])
         )
 
-        return data_ids - existing
-
     return []
 
 
@@ -731,15 +1018,13 @@ def fetch_sensitization_visits():
     formid = getattr(settings, "SENSITIZATION_VISIT_FORM_ID", None)
     if formid:
         data_ids = get_missing_ids(formid, SensitizationVisit)
-        for data_id in data_ids:
-            data = fetch_form_data(formid, dataid=data_id)
-            if data:
-                try:
-                    create_sensitization_visit(data)
-                except IntegrityError:
-                    # Fail silently, likely we did not find the household
-                    # matching the osm id.
-                    pass
+        for data in fetch_submissions(formid, data_ids):
+            try:
+                create_sensitization_visit(data)
+            except IntegrityError:
+                # Fail silently, likely we did not find the household
+                # matching the osm id.
+                pass
 
 
 @app.task
@@ -748,11 +1033,9 @@ def fetch_mobilisation():
     formid = getattr(settings, "MOBILISATION_FORM_ID", None)
     if formid:
         data_ids = get_missing_ids(formid, Mobilisation)
-        for data_id in data_ids:
-            data = fetch_form_data(formid, dataid=data_id)
-            if data:
-                try:
-                    create_mobilisation_visit(data)
-                except IntegrityError:
-                    logger.exception("{} Record not found.".format(formid))
-                    continue
+        for data in fetch_submissions(formid, data_ids):
+            try:
+                create_mobilisation_visit(data)
+            except IntegrityError:
+                logger.exception("{} Record not found.".format(formid))
+                continue
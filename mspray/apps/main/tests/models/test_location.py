@@ -7,7 +7,11 @@ import datetime
 from django.test import TestCase
 
 from mspray.apps.main.models.decision import Decision, create_decision_visit
-from mspray.apps.main.models.location import Location
+from mspray.apps.main.models.location import (
+    Location,
+    get_simplify_level,
+    update_location_geometries,
+)
 from mspray.apps.main.tests.utils import (
     DECISION_VISIT_DATA,
     data_setup,
@@ -114,3 +118,43 @@ class TestLocation(TestCase):
         akros_2 = Location.objects.get(name="Akros_2", level="ta")
         self.assertEqual(akros_2.last_visit, datetime.date(2018, 9, 20))
         self.assertEqual(akros_2.last_decision_date, "2018-09-25")
+
+    def test_simplified_geometries(self):
+        """
+        Test the simplified geometries and bounding boxes are set when the
+        locations are loaded.
+        """
+        data_setup()
+        lusaka = Location.objects.get(name="Lusaka", level="district")
+        self.assertIsNotNone(lusaka.geom_low)
+        self.assertIsNotNone(lusaka.geom_high)
+        self.assertLessEqual(
+            lusaka.geom_low.num_coords, lusaka.geom.num_coords
+        )
+        self.assertEqual(
+            [round(i, 9) for i in lusaka.bounds],
+            [round(i, 9) for i in lusaka.geom.boundary.extent],
+        )
+        self.assertEqual(lusaka.get_geom("low"), lusaka.geom_low)
+        self.assertEqual(lusaka.get_geom(), lusaka.geom)
+
+        Location.objects.update(geom_low=None, bbox_xmin=None)
+        lusaka = Location.objects.get(pk=lusaka.pk)
+        self.assertEqual(lusaka.get_geom("low"), lusaka.geom)
+        self.assertEqual(lusaka.bounds, list(lusaka.geom.extent))
+        self.assertEqual(
+            update_location_geometries(Location.objects.filter(pk=lusaka.pk)),
+            1,
+        )
+        self.assertIsNotNone(Location.objects.get(pk=lusaka.pk).bbox_xmin)
+
+    def test_get_simplify_level(self):
+        """Test get_simplify_level() from the simplify and zoom parameters."""
+        self.assertEqual(get_simplify_level({"simplify": "medium"}), "medium")
+        self.assertIsNone(get_simplify_level({"simplify": "none"}, "low"))
+        self.assertEqual(get_simplify_level({"zoom": "6"}), "low")
+        self.assertEqual(get_simplify_level({"zoom": "10"}), "medium")
+        self.assertEqual(get_simplify_level({"zoom": "13"}), "high")
+        self.assertIsNone(get_simplify_level({"zoom": "16"}, "low"))
+        self.assertEqual(get_simplify_level({}, "high"), "high")
+        self.assertIsNone(get_simplify_level({"zoom": "x"}))
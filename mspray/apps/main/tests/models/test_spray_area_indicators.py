@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Test SprayAreaIndicators model module.
+"""
+from django.test import TestCase
+
+from mspray.apps.main.models.location import Location
+from mspray.apps.main.models.spray_area_indicators import SprayAreaIndicators
+from mspray.apps.main.models.spray_day import SprayDay
+from mspray.apps.main.tests.utils import data_setup, load_spray_data
+
+
+class TestSprayAreaIndicators(TestCase):
+    """Test SprayAreaIndicators model class"""
+
+    def test_refreshed_on_submission(self):
+        """Test indicators are refreshed when submissions are received."""
+        data_setup()
+        load_spray_data()
+        akros_2 = Location.objects.get(name="Akros_2", level="ta")
+        indicators = SprayAreaIndicators.objects.get(location=akros_2)
+
+        self.assertEqual(indicators.visited_sprayed, 5)
+        self.assertEqual(indicators.structures_on_ground, 9)
+        self.assertEqual(indicators.visited_found, 8)
+        self.assertEqual(indicators.not_sprayable, 4)
+        with self.assertNumQueries(1):
+            akros_2 = Location.objects.select_related(
+                "spray_area_indicators"
+            ).get(name="Akros_2", level="ta")
+            self.assertEqual(akros_2.visited_sprayed, 5)
+            self.assertEqual(akros_2.structures_on_ground, 9)
+            self.assertEqual(akros_2.visited_found, 8)
+
+    def test_refreshed_on_delete(self):
+        """Test indicators are refreshed when submissions are deleted."""
+        data_setup()
+        load_spray_data()
+        akros_2 = Location.objects.get(name="Akros_2", level="ta")
+        SprayDay.objects.filter(
+            location=akros_2, sprayable=True, was_sprayed=True
+        ).first().delete()
+
+        indicators = SprayAreaIndicators.objects.get(location=akros_2)
+        self.assertEqual(indicators.visited_sprayed, 4)
+
+    def test_refreshed_on_move(self):
+        """
+        Test indicators of both spray areas are refreshed when a submission
+        moves to another spray area.
+        """
+        data_setup()
+        load_spray_data()
+        akros_2 = Location.objects.get(name="Akros_2", level="ta")
+        sprayday = SprayDay.objects.filter(
+            location=akros_2, sprayable=True, was_sprayed=True
+        ).first()
+        other = (
+            Location.objects.filter(level="ta")
+            .exclude(pk=akros_2.pk)
+            .first()
+        )
+        visited_sprayed = SprayAreaIndicators.for_location(
+            other
+        ).visited_sprayed
+        sprayday.location = other
+        sprayday.save()
+
+        indicators = SprayAreaIndicators.objects.get(location=akros_2)
+        self.assertEqual(indicators.visited_sprayed, 4)
+        indicators = SprayAreaIndicators.objects.get(location=other)
+        self.assertEqual(indicators.visited_sprayed, visited_sprayed + 1)
+
+    def test_totals(self):
+        """Test totals() sums the indicators of spray areas."""
+        data_setup()
+        load_spray_data()
+        lusaka = Location.objects.get(name="Lusaka", level="district")
+        spray_areas = lusaka.get_descendants().filter(level="ta", target=True)
+        totals = SprayAreaIndicators.totals(spray_areas)
+
+        self.assertEqual(
+            totals["structures_on_ground"],
+            sum(
+                SprayAreaIndicators.for_location(location).structures_on_ground
+                for location in spray_areas
+            ),
+        )
+        self.assertEqual(
+            SprayAreaIndicators.objects.filter(
+                location__in=spray_areas
+            ).count(),
+            spray_areas.count(),
+        )
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+Test SprayDay model module.
+"""
+from django.conf import settings
+from django.test import TestCase
+
+from mspray.apps.main.models.spray_day import SprayDay, get_data_fields
+from mspray.apps.main.tests.utils import data_setup, load_spray_data
+from mspray.apps.main.utils import backfill_sprayday_data_fields
+
+
+class TestSprayDay(TestCase):
+    """Test SprayDay model class"""
+
+    def test_get_data_fields(self):
+        """Test get_data_fields() returns the promoted data keys."""
+        fields = get_data_fields(
+            {
+                "sprayformid": "28.11.0001",
+                settings.MSPRAY_UNSPRAYED_REASON_FIELD: "refused",
+                "_submission_time": "2018-11-28T10:31:17",
+                "osmstructure:way:id": "-4551",
+                "newstructure/gps": "-15.41 28.35 0 0",
+            }
+        )
+        self.assertEqual(fields["sprayformid"], "28.11.0001")
+        self.assertEqual(fields["unsprayed_reason"], "refused")
+        self.assertEqual(
+            fields["submission_time"].isoformat(), "2018-11-28T10:31:17+00:00"
+        )
+        self.assertTrue(fields["has_osm_way"])
+        self.assertFalse(fields["has_osm_node"])
+        self.assertFalse(fields["has_new_osm_node"])
+        self.assertTrue(fields["has_new_structure_gps"])
+
+        fields = get_data_fields({"_submission_time": "not a date"})
+        self.assertIsNone(fields["sprayformid"])
+        self.assertIsNone(fields["unsprayed_reason"])
+        self.assertIsNone(fields["submission_time"])
+
+    def test_data_fields(self):
+        """
+        Test the promoted columns are set on save and match the backfill.
+        """
+        data_setup()
+        load_spray_data()
+        submissions = SprayDay.objects.order_by("pk")
+        self.assertTrue(submissions.filter(sprayformid__isnull=False).exists())
+        saved = list(submissions.values())
+        for values in saved:
+            data = SprayDay.objects.get(pk=values["id"]).data
+            self.assertEqual(values["sprayformid"], data.get("sprayformid"))
+            self.assertEqual(
+                values["has_osm_way"], "osmstructure:way:id" in data
+            )
+
+        SprayDay.objects.update(sprayformid=None, has_osm_way=False)
+        self.assertEqual(
+            backfill_sprayday_data_fields(batch_size=2), len(saved)
+        )
+        self.assertEqual(list(submissions.values()), saved)
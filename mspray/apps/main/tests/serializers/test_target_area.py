@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Test mspray.apps.main.serializers.target_area module."""
+from mspray.apps.main.models import Location, SprayDay
+from mspray.apps.main.query import get_location_qs
+from mspray.apps.main.serializers.target_area import (
+    SPRAY_AREA_INDICATORS,
+    TargetAreaSerializer,
+    count_duplicates,
+    get_spray_area_indicators,
+    get_spray_data,
+)
+from mspray.apps.main.tests.test_base import TestBase
+
+
+class TestTargetAreaSerializer(TestBase):
+    """Test target area serializer module class."""
+
+    def test_get_spray_area_indicators(self):
+        """Test get_spray_area_indicators() for a set of spray areas."""
+        self._load_fixtures()
+        location_ids = list(
+            Location.objects.filter(level="ta").values_list("pk", flat=True)
+        )
+        indicators = get_spray_area_indicators(location_ids)
+
+        self.assertEqual(sorted(indicators), sorted(location_ids))
+        for location in Location.objects.filter(pk__in=location_ids):
+            data = indicators[location.pk]
+            sprayed = SprayDay.objects.filter(
+                location=location, sprayable=True, was_sprayed=True
+            ).count()
+            self.assertEqual(data["sprayed"] or 0, sprayed)
+            self.assertEqual(
+                data["sprayed_duplicates"], count_duplicates(location, True)
+            )
+
+    def test_get_spray_area_indicators_no_submissions(self):
+        """Test get_spray_area_indicators() for a spray area with no data."""
+        self._load_fixtures()
+        location = Location.objects.filter(level="ta").first()
+        SprayDay.objects.filter(location=location).delete()
+        data = get_spray_area_indicators([location.pk])[location.pk]
+
+        self.assertIsNone(data["found"])
+        self.assertIsNone(data["sprayed"])
+        self.assertEqual(data["sprayed_duplicates"], 0)
+        self.assertEqual(get_spray_area_indicators([]), {})
+
+    def test_get_spray_data_uses_context(self):
+        """Test get_spray_data() reads prefetched indicators in the context.
+        """
+        self._load_fixtures()
+        location = Location.objects.filter(level="ta").first()
+        data = {"found": 3, "sprayed": 2, "sprayed_duplicates": 0}
+        context = {SPRAY_AREA_INDICATORS: {location.pk: data}}
+
+        self.assertEqual(get_spray_data(location, context), data)
+        with self.assertNumQueries(0):
+            get_spray_data({"pk": location.pk, "level": "ta"}, context)
+
+    def test_target_area_serializer_many(self):
+        """Test TargetAreaSerializer(many=True) matches single serializer."""
+        self._load_fixtures()
+        queryset = get_location_qs(
+            Location.objects.filter(level="ta").order_by("pk")
+        )
+        request = self.factory.get("/")
+        data = TargetAreaSerializer(
+            queryset, many=True, context={"request": request}
+        ).data
+
+        self.assertEqual(len(data), queryset.count())
+        for location, item in zip(queryset, data):
+            expected = TargetAreaSerializer(
+                location, context={"request": request}
+            ).data
+            self.assertEqual(dict(expected), dict(item))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Test mspray.apps.main.location_cache module."""
+from django.core.cache import cache
+from django.test import TestCase
+
+from mspray.apps.main.location_cache import (
+    bump_location_versions,
+    get_location_version,
+    get_location_versions,
+    location_cache_key,
+)
+from mspray.apps.main.models import Location, SprayDay
+from mspray.apps.main.tests.utils import data_setup, load_spray_data
+from mspray.apps.main.utils import delete_cached_target_area_keys
+
+
+class TestLocationCache(TestCase):
+    """Test location_cache module functions."""
+
+    def setUp(self):
+        data_setup()
+
+    def test_bump_location_versions(self):
+        """Test bump_location_versions() only changes the given versions."""
+        pks = list(Location.objects.values_list("pk", flat=True)[:3])
+        versions = get_location_versions(pks)
+        self.assertEqual(set(versions), set(pks))
+        self.assertEqual(get_location_versions(pks), versions)
+
+        key = location_cache_key("visited-sprayed-{}", pks[0])
+        self.assertTrue(key.startswith("visited-sprayed-{}:".format(pks[0])))
+        cache.set(key, 10)
+
+        bump_location_versions([pks[0], None])
+        self.assertNotEqual(get_location_version(pks[0]), versions[pks[0]])
+        self.assertEqual(get_location_version(pks[1]), versions[pks[1]])
+        self.assertEqual(get_location_version(pks[2]), versions[pks[2]])
+        self.assertNotEqual(
+            location_cache_key("visited-sprayed-{}", pks[0]), key
+        )
+
+    def test_delete_cached_target_area_keys(self):
+        """
+        Test a submission invalidates the cached values of its spray area, RHC
+        and district only.
+        """
+        load_spray_data()
+        sprayday = SprayDay.objects.filter(
+            location__isnull=False, rhc__isnull=False, district__isnull=False
+        ).first()
+        pks = [sprayday.location_id, sprayday.rhc_id, sprayday.district_id]
+        other = Location.objects.exclude(pk__in=pks).first()
+        versions = get_location_versions(pks + [other.pk])
+
+        district = Location.objects.get(pk=sprayday.district_id)
+        visited_sprayed = district.visited_sprayed
+        key = district.cache_key("visited-sprayed-{}")
+        self.assertEqual(cache.get(key), visited_sprayed)
+
+        delete_cached_target_area_keys(sprayday)
+        for pk in pks:
+            self.assertNotEqual(get_location_version(pk), versions[pk])
+        self.assertEqual(get_location_version(other.pk), versions[other.pk])
+
+        district = Location.objects.get(pk=sprayday.district_id)
+        self.assertNotEqual(district.cache_key("visited-sprayed-{}"), key)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""Test mspray.apps.main.reconciliation module."""
+from unittest.mock import MagicMock, patch
+
+from mspray.apps.main.models import (
+    FormSyncState,
+    PerformanceReport,
+    SprayDay,
+)
+from mspray.apps.main.reconciliation import (
+    find_deleted_ids,
+    find_missing_ids,
+    find_missing_sprayformids,
+    remove_deleted,
+    sync_form_changes,
+)
+from mspray.apps.main.tests.test_base import TestBase
+
+
+class TestReconciliation(TestBase):
+    """Test reconciliation module functions."""
+
+    def test_find_missing_ids(self):
+        """Test find_missing_ids() returns remote ids without a record."""
+        self._load_fixtures()
+        submission_ids = list(
+            SprayDay.objects.values_list("submission_id", flat=True)
+        )
+        remote_ids = submission_ids + [99999998, 99999999, 99999999]
+
+        self.assertEqual(
+            find_missing_ids(SprayDay, remote_ids), [99999998, 99999999]
+        )
+        self.assertEqual(find_missing_ids(SprayDay, submission_ids), [])
+        self.assertEqual(find_missing_ids(SprayDay, []), [])
+
+    def test_remove_deleted(self):
+        """Test remove_deleted() removes records not in the remote ids."""
+        self._load_fixtures()
+        submission_ids = list(
+            SprayDay.objects.order_by("pk").values_list(
+                "submission_id", flat=True
+            )
+        )
+        count = len(submission_ids)
+        self.assertTrue(count > 2)
+        deleted = SprayDay.objects.filter(
+            submission_id__in=submission_ids[:2]
+        ).values_list("pk", flat=True)
+
+        self.assertEqual(
+            find_deleted_ids(SprayDay, submission_ids[2:]),
+            sorted(deleted),
+        )
+        self.assertEqual(
+            remove_deleted(SprayDay, submission_ids[2:], batch_size=1), 2
+        )
+        self.assertEqual(SprayDay.objects.count(), count - 2)
+        self.assertEqual(remove_deleted(SprayDay, submission_ids), 0)
+
+    def test_find_missing_sprayformids(self):
+        """
+        Test find_missing_sprayformids() returns sprayformids without a
+        performance report.
+        """
+        self._load_fixtures()
+        PerformanceReport.objects.all().delete()
+        sprayformids = set(
+            SprayDay.objects.filter(data__has_key="sprayformid").values_list(
+                "data__sprayformid", flat=True
+            )
+        )
+        self.assertTrue(sprayformids)
+        self.assertEqual(set(find_missing_sprayformids()), sprayformids)
+
+    @patch("mspray.apps.main.reconciliation.iter_form_changes")
+    def test_sync_form_changes(self, iter_form_changes):
+        """
+        Test sync_form_changes() advances the watermarks after ingesting the
+        edited and new records and requests records from the watermarks.
+        """
+        iter_form_changes.return_value = [
+            {
+                "_id": 2,
+                "_last_edited": "2018-11-28T10:31:17",
+            },
+            {
+                "_id": 1,
+                "_last_edited": "2018-11-29T08:00:00",
+            },
+        ]
+        sync_func = MagicMock()
+
+        self.assertEqual(sync_form_changes(10, sync_func), 2)
+        self.assertEqual(sync_func.call_count, 2)
+        iter_form_changes.assert_called_with(10, "", last_id=0)
+        state = FormSyncState.objects.get(formid="10")
+        self.assertEqual(state.last_id, 2)
+        self.assertEqual(state.last_edited, "2018-11-29T08:00:00")
+
+        # a failed ingest leaves the watermarks unchanged
+        iter_form_changes.return_value = [
+            {"_id": 3, "_last_edited": "2018-11-30T08:00:00"}
+        ]
+        sync_func.side_effect = ValueError
+        with self.assertRaises(ValueError):
+            sync_form_changes(10, sync_func)
+        iter_form_changes.assert_called_with(
+            10, "2018-11-29T08:00:00", last_id=2
+        )
+        state.refresh_from_db()
+        self.assertEqual(state.last_edited, "2018-11-29T08:00:00")
+
+    @patch("mspray.apps.main.reconciliation.iter_form_changes")
+    def test_sync_form_changes_first_sync(self, iter_form_changes):
+        """
+        Test the first sync_form_changes() of a form only requests the
+        submissions newer than the stored records.
+        """
+        self._load_fixtures()
+        iter_form_changes.return_value = []
+        latest = SprayDay.objects.order_by("-submission_id").first()
+
+        self.assertEqual(sync_form_changes(11, MagicMock(), SprayDay), 0)
+        iter_form_changes.assert_called_with(
+            11, "", last_id=latest.submission_id
+        )
+        self.assertEqual(
+            FormSyncState.objects.get(formid="11").last_id,
+            latest.submission_id,
+        )
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Test mspray.apps.main.spatial module."""
+from django.contrib.gis.geos import Point
+from django.test import TestCase
+
+from mspray.apps.main.models import Household, Location
+from mspray.apps.main.models.mobilisation import create_mobilisation_visit
+from mspray.apps.main.spatial import (
+    clear_target_area_index,
+    get_target_area_index,
+    resolve_target_area,
+)
+from mspray.apps.main.tests.utils import MOBILISATION_VISIT_DATA, data_setup
+
+
+class TestSpatial(TestCase):
+    """Test spatial module functions."""
+
+    def setUp(self):
+        data_setup()
+        clear_target_area_index()
+
+    def test_resolve_target_area(self):
+        """Test resolve_target_area() matches the database query."""
+        get_target_area_index()
+        households = Household.objects.filter(bgeom__isnull=False)
+        for household in households[:20]:
+            expected = Location.objects.filter(
+                level="ta", geom__contains=household.geom
+            ).first()
+            # a single primary key lookup instead of a containment query
+            with self.assertNumQueries(1):
+                location = resolve_target_area(household.geom)
+            self.assertEqual(location, expected)
+            self.assertEqual(
+                resolve_target_area(household.bgeom, predicate="covers"),
+                Location.objects.filter(
+                    level="ta", geom__covers=household.bgeom
+                ).first(),
+            )
+
+        self.assertIsNone(resolve_target_area(Point(0, 0)))
+        self.assertIsNone(resolve_target_area(None))
+
+    def test_resolve_target_area_target(self):
+        """Test resolve_target_area() only returns target spray areas."""
+        household = Household.objects.first()
+        location = resolve_target_area(household.geom)
+        self.assertIsNotNone(location)
+
+        location.target = False
+        location.save()
+        self.assertIsNone(resolve_target_area(household.geom, target=True))
+        self.assertEqual(
+            resolve_target_area(household.geom, target=False), location
+        )
+
+    def test_index_invalidated_on_save(self):
+        """Test the index is reloaded when a location geometry changes."""
+        index = get_target_area_index()
+        self.assertIs(get_target_area_index(), index)
+
+        location = Location.objects.filter(level="ta").first()
+        location.save(update_fields=["visited", "sprayed"])
+        self.assertIs(get_target_area_index(), index)
+
+        location.save()
+        self.assertIsNot(get_target_area_index(), index)
+
+    def test_index_kept_on_visit(self):
+        """Test a mobilisation visit does not reload the index."""
+        index = get_target_area_index()
+        mobilisation = create_mobilisation_visit(MOBILISATION_VISIT_DATA)
+        self.assertTrue(mobilisation.spray_area.is_mobilised)
+        self.assertIs(get_target_area_index(), index)
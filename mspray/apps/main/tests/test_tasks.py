@@ -1,23 +1,36 @@
 # -*- coding: utf-8 -*-
 """Test mspray.apps.main.tasks module.
 """
+import os
 from unittest.mock import patch
 
-from mspray.apps.main.models import Mobilisation, SensitizationVisit, SprayDay
+from mspray.apps.main.models import (
+    Household,
+    Location,
+    Mobilisation,
+    SensitizationVisit,
+    SprayDay,
+    WeeklyReport,
+)
 from mspray.apps.main.tasks import (
     fetch_mobilisation,
     fetch_sensitization_visits,
     link_spraypoint_with_osm,
+    process_osm_file,
+    rollup_locations_sprayed_visited,
     run_tasks_after_spray_data,
+    set_sprayed_visited,
 )
 from mspray.apps.main.tests.test_base import TestBase
 from mspray.apps.main.tests.utils import (
+    FIXTURES_DIR,
     MOBILISATION_VISIT_DATA,
     SENSITIZATION_VISIT_DATA,
     data_setup,
 )
 from mspray.apps.main.utils import add_spray_data
 from mspray.celery import app
+from mspray.libs.osm import iter_osm
 
 OSMXML = """
     <?xml version='1.0' encoding='UTF-8' ?>
@@ -154,28 +167,120 @@ class TestTasks(TestBase):
         distance_args, _kwargs = distance_mock.delay.call_args_list[0]
         self.assertEqual(distance_args[0], sprayday.id)
 
+    @patch("mspray.apps.main.tasks.fetch_submissions")
     @patch("mspray.apps.main.tasks.fetch_form_data")
-    def test_fetch_sensitization_visits(self, fetch_form_data):
+    def test_fetch_sensitization_visits(
+        self, fetch_form_data, fetch_submissions
+    ):
         """Test fetching sensitization visit submissions."""
         data_setup()
-        fetch_form_data.side_effect = [
-            [{"_id": 343725}],
-            SENSITIZATION_VISIT_DATA,
-        ]
+        fetch_form_data.return_value = [{"_id": 343725}]
+        fetch_submissions.return_value = [SENSITIZATION_VISIT_DATA]
         count = SensitizationVisit.objects.count()
         with self.settings(SENSITIZATION_VISIT_FORM_ID=343725):
             fetch_sensitization_visits()
             self.assertEqual(SensitizationVisit.objects.count(), count + 1)
+            fetch_submissions.assert_called_with(343725, {343725})
 
+    @patch("mspray.apps.main.tasks.fetch_submissions")
     @patch("mspray.apps.main.tasks.fetch_form_data")
-    def test_fetch_mobilisation(self, fetch_form_data):
+    def test_fetch_mobilisation(self, fetch_form_data, fetch_submissions):
         """Test fetching mobilisation submissions."""
         data_setup()
-        fetch_form_data.side_effect = [
-            [{"_id": 343725}],
-            MOBILISATION_VISIT_DATA,
-        ]
+        fetch_form_data.return_value = [{"_id": 343725}]
+        fetch_submissions.return_value = [MOBILISATION_VISIT_DATA]
         count = Mobilisation.objects.count()
         with self.settings(MOBILISATION_FORM_ID=343725):
             fetch_mobilisation()
             self.assertEqual(Mobilisation.objects.count(), count + 1)
+
+    def test_rollup_locations_sprayed_visited(self):
+        """Test rollup_locations_sprayed_visited() on flagged locations."""
+        self._load_fixtures()
+        Location.objects.update(rollup_pending=False)
+        sprayday = SprayDay.objects.exclude(location__isnull=True).first()
+        sprayday.save()
+        location = sprayday.location
+        expected = {
+            location.pk,
+            location.parent_id,
+            location.parent.parent_id,
+        }
+        self.assertEqual(
+            set(
+                Location.objects.filter(rollup_pending=True).values_list(
+                    "pk", flat=True
+                )
+            ),
+            expected,
+        )
+
+        # an existing report for the week, only flagged locations are rolled up
+        WeeklyReport.objects.create(location=location, week_number=1)
+
+        # a failed rollup leaves the locations flagged
+        with patch(
+            "mspray.apps.main.tasks._rollup_parents", side_effect=ValueError
+        ):
+            with self.assertRaises(ValueError):
+                rollup_locations_sprayed_visited(week_number=1)
+        self.assertEqual(
+            set(
+                Location.objects.filter(rollup_pending=True).values_list(
+                    "pk", flat=True
+                )
+            ),
+            expected,
+        )
+
+        self.assertEqual(rollup_locations_sprayed_visited(week_number=1), 3)
+        self.assertFalse(Location.objects.filter(rollup_pending=True).exists())
+        self.assertEqual(
+            set(
+                WeeklyReport.objects.filter(week_number=1).values_list(
+                    "location", flat=True
+                )
+            ),
+            expected,
+        )
+
+        set_sprayed_visited(location, week_number=2)
+        report = WeeklyReport.objects.get(location=location, week_number=1)
+        expected_report = WeeklyReport.objects.get(
+            location=location, week_number=2
+        )
+        self.assertEqual(report.visited, expected_report.visited)
+        self.assertEqual(report.sprayed, expected_report.sprayed)
+        self.assertEqual(report.structures, expected_report.structures)
+        self.assertEqual(rollup_locations_sprayed_visited(week_number=1), 0)
+
+    def test_process_osm_file(self):
+        """Test process_osm_file() reports inserted, updated and skipped."""
+        data_setup()
+        path = os.path.join(FIXTURES_DIR, "Lusaka", "OSM", "Akros_2.osm")
+        ways = list(iter_osm(path, osm_type="way"))
+        household = Household.objects.get(hh_id=int(ways[0]["osm_id"]))
+        self.assertEqual(household.rhc, household.location.parent)
+        self.assertEqual(household.district, household.location.parent.parent)
+
+        # existing structures are skipped
+        self.assertEqual(
+            process_osm_file(path),
+            {"inserted": 0, "updated": 0, "skipped": len(ways)},
+        )
+
+        household.delete()
+        counts = process_osm_file(path, update=True, batch_size=2)
+        self.assertEqual(counts["inserted"], 1)
+        self.assertEqual(sum(counts.values()), len(ways))
+        inserted = Household.objects.get(hh_id=household.hh_id)
+        self.assertEqual(inserted.location_id, household.location_id)
+        self.assertEqual(inserted.rhc_id, household.rhc_id)
+        self.assertEqual(inserted.geom.srid, 4326)
+        self.assertEqual(
+            Household.objects.filter(
+                hh_id__in=[int(way["osm_id"]) for way in ways],
+                location__isnull=False,
+            ).count(),
+            len(ways),
+        )
@@ -3,41 +3,59 @@
 import codecs
 import json
 import os
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 from django.conf import settings
+from django.contrib.gis.geos import Point
 from django.core.exceptions import ValidationError
 from django.db.models import Count
 
 from mspray.apps.main.models import (
     Household,
+    HouseholdsBuffer,
     Location,
     PerformanceReport,
     SprayDay,
+    SprayDayHealthCenterLocation,
     SprayOperator,
     SprayOperatorDailySummary,
     TeamLeader,
     TeamLeaderAssistant,
 )
-from mspray.apps.main.models.spray_day import DATA_ID_FIELD
+from mspray.apps.main.models.spray_day import (
+    DATA_ID_FIELD,
+    DATE_FIELD,
+    STRUCTURE_GPS_FIELD,
+)
 from mspray.apps.main.tests.test_base import TestBase
 from mspray.apps.main.tests.utils import FIXTURES_DIR, data_setup
 from mspray.apps.main.utils import (
     add_spray_data,
+    add_spray_data_batch,
     add_spray_operator_daily,
     avg_time_per_group,
     avg_time_tuple,
+    build_performance_reports,
+    create_households_buffer,
+    create_location_households_buffer,
+    find_household_duplicates,
     find_mismatched_spraydays,
     get_formid,
     get_spray_operator,
     get_spraydays_with_mismatched_locations,
+    link_new_structures,
     link_new_structures_to_existing,
     link_sprayday_to_actors,
     performance_report,
+    queryset_chunks,
+    queryset_iterator,
     remove_duplicate_sprayoperatordailysummary,
+    remove_household_duplicates,
     remove_household_geom_duplicates,
+    sync_missing_data,
 )
 from mspray.celery import app
+from mspray.libs.utils.geom_buffer import with_metric_buffer
 
 SUBMISSION_DATA = [
     {
@@ -110,6 +128,33 @@ class TestUtils(TestBase):
         self.assertEqual(kwargs["sprayday"], SprayDay.objects.first())
         self.assertEqual(kwargs["data"], SUBMISSION_DATA[0])
 
+    @patch("mspray.apps.main.utils.link_sprayday_to_actors")
+    def test_add_spray_data_gps(self, _mock):
+        """
+        Test add_spray_data() sets the location and geom of a submission from
+        its GPS field.
+        """
+        self._load_fixtures()
+        location = Location.objects.filter(
+            level="ta", geom__isnull=False
+        ).first()
+        point = location.geom.point_on_surface
+        data = dict(SUBMISSION_DATA[0])
+        data[DATA_ID_FIELD] = 3698
+        data[STRUCTURE_GPS_FIELD] = "{} {} 0 0".format(point.y, point.x)
+
+        with self.settings(MSPRAY_SPATIAL_QUERIES=True):
+            sprayday = add_spray_data(data)
+
+        sprayday.refresh_from_db()
+        self.assertEqual(sprayday.geom.srid, 4326)
+        self.assertAlmostEqual(sprayday.geom.x, point.x)
+        self.assertAlmostEqual(sprayday.geom.y, point.y)
+        self.assertEqual(
+            sprayday.location,
+            Location.objects.filter(level="ta", geom__contains=point).first(),
+        )
+
     def test_add_spray_data_with_exception(self):  # pylint: disable=C0103
         """
         test that raises Validation error in case no data is passed
@@ -292,6 +337,78 @@ class TestUtils(TestBase):
         remove_household_geom_duplicates(hh_obj.location)
         self.assertEqual(Household.objects.filter(geom=hh_obj.geom).count(), 1)
 
+    def test_remove_household_duplicates(self):
+        """
+        Test that remove_household_duplicates reports duplicates in dry run
+        mode and moves linked records before removing them
+        """
+        self._load_fixtures()
+        hh_obj = Household.objects.order_by("pk").first()
+        duplicate_hh_obj = Household.objects.create(
+            hh_id=-99_999_999,
+            geom=hh_obj.geom,
+            bgeom=hh_obj.bgeom,
+            location=hh_obj.location,
+            data=hh_obj.data,
+        )
+        sprayday = SprayDay.objects.first()
+        sprayday.household = duplicate_hh_obj
+        sprayday.save()
+
+        report = remove_household_duplicates(match="geom", dry_run=True)
+        self.assertIn((hh_obj.hh_id, [-99_999_999]), report["clusters"])
+        self.assertIn(hh_obj.location_id, report["locations"])
+        self.assertEqual(report["deleted"], 0)
+        self.assertTrue(Household.objects.filter(hh_id=-99_999_999).exists())
+
+        report = remove_household_duplicates(match="geom")
+        self.assertEqual(
+            report["deleted"],
+            sum(len(dups) for _kept, dups in report["clusters"]),
+        )
+        self.assertFalse(Household.objects.filter(hh_id=-99_999_999).exists())
+        sprayday.refresh_from_db()
+        self.assertEqual(sprayday.household, hh_obj)
+        self.assertEqual(
+            remove_household_duplicates(match="geom")["clusters"], []
+        )
+
+    def test_find_household_duplicates_overlap(self):
+        """
+        Test find_household_duplicates() does not chain overlapping
+        households, a household is only a duplicate of a kept household whose
+        bgeom contains it.
+        """
+        self._load_fixtures()
+        location = Location.objects.filter(level="ta").first()
+        households = []
+        # three households in a line 14m apart with 15m buffers
+        for i in range(3):
+            point = Point(28.0, -15.0 + i * 14 / 110_600.0, srid=4326)
+            households.append(
+                Household.objects.create(
+                    hh_id=-99_999_990 + i,
+                    geom=point,
+                    bgeom=with_metric_buffer(point, 15),
+                    location=location,
+                )
+            )
+        first, second, third = households
+
+        clusters = [
+            (kept, duplicates)
+            for kept, duplicates in find_household_duplicates(
+                match="overlap"
+            )
+            if kept in households
+        ]
+        self.assertEqual(clusters, [(first, [second])])
+        report = remove_household_duplicates(match="overlap", dry_run=True)
+        self.assertNotIn(
+            third.hh_id,
+            [hh_id for _kept, dups in report["clusters"] for hh_id in dups],
+        )
+
     def test_find_mismatched_spraydays_true(self):  # pylint: disable=C0103
         """
         Test that find_mismatched_spraydays returns all SprayDay objects
@@ -376,6 +493,153 @@ class TestUtils(TestBase):
             self.assertTrue(spray.household is not None)
             self.assertTrue(spray.household.visited)
 
+    def test_add_spray_data_batch(self):
+        """Test add_spray_data_batch() matches add_spray_data()."""
+        data_setup()
+        path = os.path.join(FIXTURES_DIR, "spray_data.json")
+        with codecs.open(path, encoding="utf-8") as spray_data_file:
+            records = json.load(spray_data_file)
+
+        spraydays = add_spray_data_batch(records)
+        self.assertEqual(len(spraydays), len(records))
+        self.assertEqual(SprayDay.objects.count(), len(records))
+        self.assertEqual(
+            SprayDayHealthCenterLocation.objects.count(),
+            SprayDay.objects.filter(location__isnull=False).count(),
+        )
+        spray = SprayDay.objects.get(
+            submission_id=records[0][DATA_ID_FIELD]
+        )
+        self.assertIsNotNone(spray.location)
+        self.assertIsNotNone(spray.household)
+        self.assertTrue(spray.household.visited)
+        self.assertIsNotNone(spray.rhc)
+        self.assertIsNotNone(spray.district)
+
+        akros_2 = Location.objects.get(name="Akros_2", level="ta")
+        self.assertEqual(akros_2.visited_sprayed, 5)
+        self.assertEqual(akros_2.structures_on_ground, 9)
+        self.assertEqual(akros_2.visited_found, 8)
+
+        # existing submissions are updated
+        count = SprayDay.objects.count()
+        add_spray_data_batch(records[:2])
+        self.assertEqual(SprayDay.objects.count(), count)
+
+        # a new submission without a spray date is rejected
+        data = records[0].copy()
+        data[DATA_ID_FIELD] = 1234567
+        data.pop(DATE_FIELD, None)
+        with self.assertRaises(ValidationError):
+            add_spray_data_batch([data])
+        self.assertEqual(SprayDay.objects.count(), count)
+
+    @patch("mspray.apps.main.utils.fetch_submissions")
+    @patch("mspray.apps.main.utils.fetch_form_data")
+    def test_sync_missing_data_tasks(self, fetch_form_data, fetch_submissions):
+        """
+        Test sync_missing_data() runs the tasks of a batch once it is saved
+        and drops them when the batch fails.
+        """
+        records = [{"_id": 1}, {"_id": 2}, {"_id": 3}]
+        fetch_form_data.return_value = records
+        fetch_submissions.side_effect = lambda formid, dataids: iter(records)
+        task = MagicMock()
+
+        def _batch_sync(batch, deferred_tasks):
+            deferred_tasks.append(task)
+            if len(batch) < 2:
+                raise ValidationError("Invalid batch")
+
+        sync_func = MagicMock()
+        sync_missing_data(
+            1,
+            SprayDay,
+            sync_func,
+            MagicMock(),
+            batch_sync_func=_batch_sync,
+            batch_size=2,
+        )
+
+        self.assertEqual(task.call_count, 1)
+        sync_func.assert_called_once_with({"_id": 3})
+
+    def test_queryset_iterator(self):
+        """
+        Test queryset_iterator() pages through a queryset in primary key order
+        chunksize records at a time.
+        """
+        self._load_fixtures()
+        pks = sorted(Location.objects.values_list("pk", flat=True))
+        self.assertGreater(len(pks), 3)
+
+        # the ordering of the queryset is not kept
+        queryset = Location.objects.order_by("-name")
+        with self.assertNumQueries(len(pks) // 3 + 1):
+            records = list(queryset_iterator(queryset, chunksize=3))
+        self.assertEqual([record.pk for record in records], pks)
+
+        # a last chunk of exactly chunksize records needs one more query
+        with self.assertNumQueries(2):
+            records = list(queryset_iterator(queryset, chunksize=len(pks)))
+        self.assertEqual([record.pk for record in records], pks)
+
+        # filters are kept
+        queryset = Location.objects.filter(level="ta")
+        self.assertEqual(
+            [record.pk for record in queryset_iterator(queryset, 2)],
+            sorted(queryset.values_list("pk", flat=True)),
+        )
+
+    def test_queryset_iterator_fallback(self):
+        """
+        Test queryset_iterator() streams sliced and DISTINCT ON querysets in
+        their own order.
+        """
+        self._load_fixtures()
+        queryset = Location.objects.order_by("-pk")[:5]
+        self.assertEqual(
+            [record.pk for record in queryset_iterator(queryset, 2)],
+            [record.pk for record in queryset],
+        )
+
+        queryset = Location.objects.order_by("level", "pk").distinct("level")
+        self.assertEqual(
+            [record.pk for record in queryset_iterator(queryset, 2)],
+            [record.pk for record in queryset],
+        )
+
+    def test_queryset_iterator_only_prefetch_related(self):
+        """
+        Test queryset_iterator() loads only the given fields and prefetches
+        related objects for each chunk.
+        """
+        self._load_fixtures()
+        queryset = Location.objects.filter(parent__isnull=False)
+        records = list(
+            queryset_iterator(
+                queryset,
+                chunksize=2,
+                only=("pk", "name", "parent"),
+                prefetch_related=["parent"],
+            )
+        )
+        self.assertTrue(records)
+        with self.assertNumQueries(0):
+            for record in records:
+                self.assertIn("geom", record.get_deferred_fields())
+                self.assertEqual(record.parent.pk, record.parent_id)
+
+    def test_queryset_chunks_values(self):
+        """Test queryset_chunks() pages values() querysets."""
+        self._load_fixtures()
+        pks = sorted(Location.objects.values_list("pk", flat=True))
+        chunks = list(
+            queryset_chunks(Location.objects.values("id", "name"), 3)
+        )
+        self.assertTrue(all(len(chunk) <= 3 for chunk in chunks))
+        self.assertEqual([row["id"] for chunk in chunks for row in chunk], pks)
+
     def test_get_spray_operator(self):
         """Test get_spray_operator function."""
         operator = SprayOperator.objects.create(name="Test", code="01234")
@@ -429,6 +693,130 @@ class TestUtils(TestBase):
             1,
         )
 
+    def test_build_performance_reports(self):
+        """
+        Test build_performance_reports() creates and updates reports with the
+        same values as performance_report() for each spray operator
+        """
+        self._load_fixtures()
+        team_leader = TeamLeader.objects.first()
+        SprayOperator.objects.update(
+            team_leader=team_leader, district=team_leader.location
+        )
+        SprayDay.objects.filter(spray_operator__isnull=False).update(
+            sprayable=True
+        )
+        fields = (
+            "spray_operator_id",
+            "sprayformid",
+            "found",
+            "sprayed",
+            "refused",
+            "other",
+            "not_eligible",
+            "spray_date",
+            "start_time",
+            "end_time",
+            "reported_found",
+            "reported_sprayed",
+            "data_quality_check",
+            "team_leader_id",
+            "district_id",
+        )
+
+        for spray_operator in SprayOperator.objects.all():
+            performance_report(spray_operator)
+        expected = set(PerformanceReport.objects.values_list(*fields))
+        self.assertTrue(expected)
+
+        PerformanceReport.objects.update(found=0, sprayed=0)
+        self.assertEqual(build_performance_reports(), len(expected))
+        self.assertEqual(
+            set(PerformanceReport.objects.values_list(*fields)), expected
+        )
+
+        PerformanceReport.objects.all().delete()
+        build_performance_reports(SprayDay.objects.all())
+        self.assertEqual(
+            set(PerformanceReport.objects.values_list(*fields)), expected
+        )
+
+    def test_build_performance_reports_reported(self):
+        """
+        Test build_performance_reports() sets the reported values from the
+        daily summary of the sprayformid of each report.
+        """
+        self._load_fixtures()
+        team_leader = TeamLeader.objects.first()
+        SprayOperator.objects.update(
+            team_leader=team_leader, district=team_leader.location
+        )
+        SprayDay.objects.filter(spray_operator__isnull=False).update(
+            sprayable=True
+        )
+        build_performance_reports()
+        report = PerformanceReport.objects.first()
+        SprayOperatorDailySummary.objects.filter(
+            sprayoperator_code=report.spray_operator.code
+        ).delete()
+        SprayOperatorDailySummary.objects.create(
+            spray_form_id=report.sprayformid,
+            submission_id=99_999_998,
+            sprayoperator_code=report.spray_operator.code,
+            found=report.found,
+            sprayed=report.sprayed,
+        )
+        SprayOperatorDailySummary.objects.create(
+            spray_form_id="{}-other".format(report.sprayformid)[-50:],
+            submission_id=99_999_999,
+            sprayoperator_code=report.spray_operator.code,
+            found=report.found + 1,
+            sprayed=report.sprayed + 1,
+        )
+
+        build_performance_reports()
+        report.refresh_from_db()
+        self.assertEqual(report.reported_found, report.found)
+        self.assertEqual(report.reported_sprayed, report.sprayed)
+        self.assertTrue(report.data_quality_check)
+
+    def test_performance_report_custom_aggregations(self):
+        """
+        Test custom aggregations are computed together with the performance
+        report counts
+        """
+        self._load_fixtures()
+        team_leader = TeamLeader.objects.first()
+        SprayOperator.objects.update(
+            team_leader=team_leader, district=team_leader.location
+        )
+        SprayDay.objects.filter(spray_operator__isnull=False).update(
+            sprayable=True
+        )
+        custom_aggregations = {
+            "was_sprayed": {"was_sprayed": True},
+            "not_sprayed": {"was_sprayed": False},
+        }
+
+        with self.settings(EXTRA_PERFORMANCE_AGGREGATIONS=custom_aggregations):
+            build_performance_reports()
+            reports = PerformanceReport.objects.all()
+            self.assertTrue(reports.exists())
+            for report in reports:
+                self.assertEqual(report.data["was_sprayed"], report.sprayed)
+                self.assertEqual(
+                    report.data["not_sprayed"], report.refused + report.other
+                )
+
+            # other data is kept
+            report = reports.first()
+            report.data = {"other_field": 1}
+            report.save()
+            build_performance_reports()
+            report.refresh_from_db()
+            self.assertEqual(report.data["other_field"], 1)
+            self.assertEqual(report.data["was_sprayed"], report.sprayed)
+
     def test_link_new_structures_to_existing(self):  # pylint: disable=C0103
         """
         Test that link_new_structures_to_existing works
@@ -456,11 +844,12 @@ class TestUtils(TestBase):
         sprayday.save()  # save it!
 
         # now link it
-        link_new_structures_to_existing(
+        linked = link_new_structures_to_existing(
             target_area=sprayday.location, distance=5
         )
 
         sprayday.refresh_from_db()
+        self.assertGreaterEqual(linked, 1)
 
         self.assertEqual(
             1234,
@@ -478,3 +867,71 @@ class TestUtils(TestBase):
             sprayday.data[f"{settings.MSPRAY_UNIQUE_FIELD}:way:id"],
         )
         self.assertEqual(1, sprayday.spraypoint_set.all().count())
+        self.assertTrue(sprayday.household.visited)
+
+        # matched structures are not linked again
+        self.assertEqual(
+            link_new_structures_to_existing(
+                target_area=sprayday.location, distance=5
+            ),
+            0,
+        )
+
+    def test_link_new_structures(self):
+        """
+        Test that link_new_structures links the new structures of every
+        target area in a district
+        """
+        self._load_fixtures()
+        sprayday = SprayDay.objects.first()
+        sprayday.data[f"{settings.MSPRAY_UNIQUE_FIELD}:node:id"] = 1234
+        sprayday.osmid = -1337
+        sprayday.household = None
+        sprayday.save()
+
+        link_new_structures(sprayday.location.parent.parent, distance=5)
+
+        sprayday.refresh_from_db()
+        self.assertIsNotNone(sprayday.household)
+        self.assertEqual(sprayday.osmid, sprayday.household.hh_id)
+
+    def test_create_households_buffer(self):
+        """
+        Test create_households_buffer() creates buffers per spray area and
+        skips spray areas that have not changed
+        """
+        data_setup()
+        akros_2 = Location.objects.get(name="Akros_2", level="ta")
+        households = Household.objects.filter(location=akros_2)
+
+        create_households_buffer()
+        buffers = HouseholdsBuffer.objects.filter(location=akros_2)
+        self.assertTrue(buffers.exists())
+        self.assertEqual(
+            len(set(buffers.values_list("checksum", flat=True))), 1
+        )
+        for household in households:
+            self.assertTrue(
+                buffers.filter(geom__covers=household.geom).exists()
+            )
+        for buffer in buffers:
+            self.assertEqual(
+                buffer.num_households,
+                Household.objects.filter(geom__coveredby=buffer.geom).count(),
+            )
+
+        ids = set(buffers.values_list("pk", flat=True))
+        self.assertIsNone(create_location_households_buffer(akros_2.pk))
+        self.assertEqual(set(buffers.values_list("pk", flat=True)), ids)
+
+        # a changed household or recreate rebuilds the buffers
+        households.first().save()
+        self.assertEqual(
+            create_location_households_buffer(akros_2.pk), buffers.count()
+        )
+        self.assertFalse(buffers.filter(pk__in=ids).exists())
+        ids = set(buffers.values_list("pk", flat=True))
+        self.assertTrue(
+            create_location_households_buffer(akros_2.pk, recreate=True)
+        )
+        self.assertFalse(buffers.filter(pk__in=ids).exists())
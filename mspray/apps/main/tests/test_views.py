@@ -6,8 +6,9 @@ from mspray.apps.main.tests.test_base import TestBase
 from mspray.apps.main.views.sprayday import SprayDayViewSet
 from mspray.apps.main.tests.test_tasks import SUBMISSION_DATA, OSMXML
 from mspray.celery import app
-from mspray.apps.main.models import SprayDay
-from mspray.apps.main.models.spray_day import DATA_ID_FIELD
+from mspray.apps.main.models import SprayDay, SubmissionIntake
+from mspray.apps.main.models.spray_day import DATA_ID_FIELD, DATE_FIELD
+from mspray.apps.main.utils import process_submission_intake
 
 
 class TestViews(TestBase):
@@ -29,6 +30,65 @@ class TestViews(TestBase):
         self.assertTrue(osm_mock.called)
         self.assertFalse(tasks_mock.called)
 
+    @patch("mspray.apps.main.views.sprayday.queue_submission_intake")
+    @patch("mspray.apps.main.tasks.fetch_osm_xml")
+    @patch("mspray.apps.main.utils.run_tasks_after_spray_data")
+    def test_create_sprayday_async(self, tasks_mock, osm_mock, queue_mock):
+        view = SprayDayViewSet.as_view({"post": "create"})
+
+        osm_mock.return_value = OSMXML.strip()
+
+        data = SUBMISSION_DATA
+        count = SprayDay.objects.count()
+        with self.settings(MSPRAY_ASYNC_INTAKE=True):
+            response = view(self.factory.post("/api/spraydays", data))
+            self.assertEqual(response.status_code, 202)
+            # a retried webhook is staged once
+            response = view(self.factory.post("/api/spraydays", data))
+            self.assertEqual(response.status_code, 202)
+
+        self.assertTrue(queue_mock.called)
+        self.assertEqual(SprayDay.objects.count(), count)
+        self.assertEqual(SubmissionIntake.objects.count(), 1)
+
+        self.assertEqual(process_submission_intake(), 1)
+        self.assertEqual(SprayDay.objects.count(), count + 1)
+        self.assertTrue(
+            SprayDay.objects.filter(
+                submission_id=SUBMISSION_DATA[DATA_ID_FIELD]
+            ).exists()
+        )
+        self.assertEqual(SubmissionIntake.objects.count(), 0)
+
+    @patch("mspray.apps.main.utils.link_spraypoint_with_osm")
+    @patch("mspray.apps.main.utils.add_spray_data")
+    @patch("mspray.apps.main.utils.add_spray_data_batch")
+    def test_process_submission_intake_error(
+        self, batch_mock, add_mock, link_mock
+    ):
+        """
+        Test a payload that fails is kept with the error and does not block
+        the rest of the queue.
+        """
+        batch_mock.side_effect = KeyError("batch")
+        add_mock.side_effect = TypeError("bad payload")
+        SubmissionIntake.stage(SUBMISSION_DATA)
+
+        self.assertEqual(process_submission_intake(), 0)
+        intake = SubmissionIntake.objects.get()
+        self.assertEqual(intake.attempts, 1)
+        self.assertEqual(intake.error, "bad payload")
+        self.assertFalse(link_mock.delay.called)
+
+    def test_create_sprayday_async_invalid(self):
+        view = SprayDayViewSet.as_view({"post": "create"})
+        data = SUBMISSION_DATA.copy()
+        data[DATE_FIELD] = "not a date"
+        with self.settings(MSPRAY_ASYNC_INTAKE=True):
+            response = view(self.factory.post("/api/spraydays", data))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(SubmissionIntake.objects.count(), 0)
+
     @patch("mspray.apps.main.tasks.fetch_osm_xml")
     @patch("mspray.apps.main.utils.run_tasks_after_spray_data")
     def test_update_sprayday(self, tasks_mock, osm_mock):
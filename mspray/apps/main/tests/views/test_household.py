@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Test household views module."""
+import json
+
+from django.test import TestCase
+
+from rest_framework.test import APIRequestFactory
+
+from mspray.apps.main.models import Household, Location
+from mspray.apps.main.serializers.household import (
+    HouseholdBSerializer,
+    HouseholdSerializer,
+)
+from mspray.apps.main.tests.utils import data_setup
+from mspray.apps.main.views.household import HouseholdViewSet
+from mspray.apps.main.views.target_area import TargetAreaHouseholdsViewSet
+
+
+def _streamed_json(response):
+    return json.loads(b"".join(response.streaming_content).decode())
+
+
+class TestHouseholdViews(TestCase):
+    """Test the streaming GeoJSON household views."""
+
+    def setUp(self):
+        data_setup()
+        self.factory = APIRequestFactory()
+
+    def test_households_geojson(self):
+        """Test the household features are built by PostGIS."""
+        view = HouseholdViewSet.as_view({"get": "list"})
+        response = view(self.factory.get("/households", {"format": "geojson"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        data = _streamed_json(response)
+        expected = HouseholdSerializer(
+            Household.objects.order_by("pk"), many=True
+        ).data
+        self.assertEqual(data["type"], "FeatureCollection")
+        self.assertEqual(len(data["features"]), len(expected["features"]))
+        for feature, expected_feature in zip(
+            data["features"], expected["features"]
+        ):
+            self.assertEqual(feature["id"], expected_feature["id"])
+            self.assertEqual(feature["geometry"]["type"], "Point")
+            self.assertEqual(
+                [round(i, 9) for i in feature["geometry"]["coordinates"]],
+                [
+                    round(i, 9)
+                    for i in expected_feature["geometry"]["coordinates"]
+                ],
+            )
+            for key in ("hh_id", "location", "visited", "sprayable"):
+                self.assertEqual(
+                    feature["properties"][key],
+                    expected_feature["properties"][key],
+                )
+
+    def test_households_geojson_precision(self):
+        """Test the precision query parameter rounds the coordinates."""
+        view = HouseholdViewSet.as_view({"get": "list"})
+        response = view(
+            self.factory.get(
+                "/households", {"format": "geojson", "precision": 3}
+            )
+        )
+        for feature in _streamed_json(response)["features"]:
+            for value in feature["geometry"]["coordinates"]:
+                self.assertEqual(value, round(value, 3))
+
+    def test_target_area_households_bgeom(self):
+        """Test the bgeom variant of the target area households."""
+        location = Location.objects.get(name="Akros_2", level="ta")
+        view = TargetAreaHouseholdsViewSet.as_view({"get": "retrieve"})
+        response = view(
+            self.factory.get("/"), pk=location.pk, bgeom=True, format="geojson"
+        )
+        data = _streamed_json(response)
+        expected = HouseholdBSerializer(
+            Household.objects.filter(location=location).order_by("pk"),
+            many=True,
+        ).data
+        self.assertEqual(
+            [feature["id"] for feature in data["features"]],
+            [feature["id"] for feature in expected["features"]],
+        )
+        self.assertEqual(
+            set(
+                feature["geometry"]["type"]
+                for feature in data["features"]
+                if feature["geometry"]
+            ),
+            {"Polygon"},
+        )
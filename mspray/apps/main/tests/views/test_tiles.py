@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Test vector tiles view module."""
+import math
+import os
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.test import TestCase
+from django.urls import reverse
+
+from mspray.apps.main.models import Household
+from mspray.apps.main.tests.utils import data_setup
+from mspray.apps.main.tiles import invalidate_location_tiles
+
+
+def _tile(point, zoom):
+    """Returns the x, y of the tile at zoom that contains point."""
+    count = 2 ** zoom
+    x = int((point.x + 180.0) / 360.0 * count)
+    latitude = math.radians(point.y)
+    y = int(
+        (1.0 - math.asinh(math.tan(latitude)) / math.pi) / 2.0 * count
+    )
+
+    return x, y
+
+
+class TestTileView(TestCase):
+    """Test TileView class."""
+
+    def setUp(self):
+        data_setup()
+        self.household = Household.objects.exclude(geom__isnull=True).first()
+        self.x, self.y = _tile(self.household.geom, 15)
+
+    def test_tile(self):
+        """Test a tile is rendered and cached per location version."""
+        url = reverse(
+            "tiles",
+            kwargs={"layer": "households", "z": 15, "x": self.x, "y": self.y},
+        )
+        with TemporaryDirectory() as cache_dir:
+            with patch("mspray.apps.main.tiles.TILE_CACHE_DIR", cache_dir):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response["Content-Type"],
+                    "application/vnd.mapbox-vector-tile",
+                )
+                self.assertTrue(response.content)
+                directory = os.path.join(
+                    cache_dir, "households", "15", str(self.x), str(self.y)
+                )
+                files = os.listdir(directory)
+                self.assertEqual(len(files), 1)
+
+                response = self.client.get(url)
+                self.assertEqual(os.listdir(directory), files)
+
+                invalidate_location_tiles([self.household.location_id])
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(os.listdir(directory)), 1)
+                self.assertNotEqual(os.listdir(directory), files)
+
+    def test_invalid_tile(self):
+        """Test unknown layers and tiles outside the zoom level are 404."""
+        response = self.client.get(
+            reverse("tiles", kwargs={"layer": "other", "z": 1, "x": 0, "y": 0})
+        )
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            reverse(
+                "tiles", kwargs={"layer": "households", "z": 1, "x": 2, "y": 0}
+            )
+        )
+        self.assertEqual(response.status_code, 404)
+
+    def test_min_zoom_and_filters(self):
+        """
+        Test tiles below the minimum zoom are empty and an invalid spray_date
+        filter is ignored.
+        """
+        response = self.client.get(
+            reverse(
+                "tiles", kwargs={"layer": "spraydays", "z": 2, "x": 2, "y": 2}
+            )
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+
+        url = reverse(
+            "tiles",
+            kwargs={"layer": "spraydays", "z": 15, "x": self.x, "y": self.y},
+        )
+        with patch("mspray.apps.main.tiles.TILE_CACHE_DIR", None):
+            response = self.client.get(url, {"spray_date": "not a date"})
+            self.assertEqual(response.status_code, 200)
+            response = self.client.get(url, {"spray_date": "2018-09-19"})
+            self.assertEqual(response.status_code, 200)
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Mapbox Vector Tiles of households, spray points and household buffers.
+
+Tiles are built by PostGIS with ST_AsMVT and kept in a cache on disk. A tile
+is stored under a digest of the cache versions of the locations it overlaps,
+a submission or a change to the households or buffers of a spray area bumps
+the versions of the spray area and its parents which invalidates the tiles
+of those locations only.
+"""
+import hashlib
+import os
+from tempfile import NamedTemporaryFile
+
+from django.conf import settings
+from django.contrib.gis.geos import Polygon
+from django.db import connection
+
+from mspray.apps.main.location_cache import (
+    bump_location_versions,
+    get_location_versions,
+)
+from mspray.apps.main.models.location import Location
+
+TILE_CACHE_DIR = getattr(
+    settings, "MSPRAY_TILE_CACHE_DIR", os.path.join(settings.BASE_DIR, "tiles")
+)
+TILE_EXTENT = getattr(settings, "MSPRAY_TILE_EXTENT", 4096)
+TILE_BUFFER = getattr(settings, "MSPRAY_TILE_BUFFER", 64)
+TILE_MAX_ZOOM = getattr(settings, "MSPRAY_TILE_MAX_ZOOM", 22)
+# tiles below this zoom level are invalidated by district instead of by
+# spray area, to keep the number of versions looked up per tile small
+TILE_SPRAY_AREA_ZOOM = getattr(settings, "MSPRAY_TILE_SPRAY_AREA_ZOOM", 13)
+WEB_MERCATOR_MAX = 20037508.342789244
+TILE_SQL = """
+SELECT ST_AsMVT("tile", %(layer)s, %(extent)s, 'geom') FROM (
+    SELECT ST_AsMVTGeom(ST_Transform("{table}"."{geom}", 3857), ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857), %(extent)s, %(buffer)s, true) AS "geom", {attributes}
+    FROM "{table}"
+    WHERE "{table}"."{geom}" && ST_Transform(ST_MakeEnvelope(%(xmin)s, %(ymin)s, %(xmax)s, %(ymax)s, 3857), 4326){where}
+) AS "tile" WHERE "tile"."geom" IS NOT NULL;
+"""  # noqa
+# tiles of a layer below its minimum zoom level are empty, so that a tile
+# never covers more than a few spray areas
+TILE_MIN_ZOOM = getattr(
+    settings,
+    "MSPRAY_TILE_MIN_ZOOM",
+    {"households": 13, "spraydays": 13, "buffers": 11},
+)
+# the table, geometry column, attributes and optional filters of each layer
+TILE_LAYERS = {
+    "households": {
+        "table": "main_household",
+        "geom": "geom",
+        "attributes": (
+            '"id", "hh_id", "location_id", "visited", "sprayable"'
+        ),
+    },
+    "spraydays": {
+        "table": "main_sprayday",
+        "geom": "geom",
+        "attributes": (
+            '"id", "submission_id", "location_id", "household_id", "osmid", '
+            '"spray_date"::text AS "spray_date", "was_sprayed", "sprayable", '
+            '"unsprayed_reason"'
+        ),
+        "filters": {"spray_date": '"main_sprayday"."spray_date" <= %s'},
+    },
+    "buffers": {
+        "table": "main_householdsbuffer",
+        "geom": "geom",
+        "attributes": '"id", "location_id", "num_households"',
+    },
+}
+
+
+def tile_bounds(z, x, y):
+    """Returns the web mercator (xmin, ymin, xmax, ymax) of a tile."""
+    size = 2 * WEB_MERCATOR_MAX / 2 ** z
+    xmin = -WEB_MERCATOR_MAX + x * size
+    ymax = WEB_MERCATOR_MAX - y * size
+
+    return xmin, ymax - size, xmin + size, ymax
+
+
+def is_valid_tile(layer, z, x, y):
+    """Returns True if layer is a tile layer and z/x/y a valid tile."""
+    return (
+        layer in TILE_LAYERS
+        and 0 <= z <= TILE_MAX_ZOOM
+        and 0 <= x < 2 ** z
+        and 0 <= y < 2 ** z
+    )
+
+
+def render_tile(layer, z, x, y, filters=None):
+    """
+    Returns the Mapbox Vector Tile z/x/y of layer as bytes, filters is a dict
+    of the values of the filters of the layer.
+    """
+    config = TILE_LAYERS[layer]
+    xmin, ymin, xmax, ymax = tile_bounds(z, x, y)
+    params = {
+        "layer": layer,
+        "extent": TILE_EXTENT,
+        "buffer": TILE_BUFFER,
+        "xmin": xmin,
+        "ymin": ymin,
+        "xmax": xmax,
+        "ymax": ymax,
+    }
+    where = ""
+    for name, value in sorted((filters or {}).items()):
+        where += " AND " + config["filters"][name].replace(
+            "%s", "%({})s".format(name)
+        )
+        params[name] = value
+    sql = TILE_SQL.format(
+        table=config["table"],
+        geom=config["geom"],
+        attributes=config["attributes"],
+        where=where,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+
+    return bytes(row[0]) if row and row[0] is not None else b""
+
+
+def get_tile_version(z, x, y):
+    """
+    Returns a digest of the cache versions of the locations that overlap the
+    tile z/x/y.
+    """
+    envelope = Polygon.from_bbox(tile_bounds(z, x, y))
+    envelope.srid = 3857
+    envelope.transform(4326)
+    level = (
+        settings.MSPRAY_TA_LEVEL if z >= TILE_SPRAY_AREA_ZOOM else "district"
+    )
+    pks = Location.objects.filter(
+        level=level, geom__bboverlaps=envelope
+    ).values_list("pk", flat=True)
+    versions = get_location_versions(pks)
+    digest = hashlib.md5()
+    for pk in sorted(versions):
+        digest.update("{}:{};".format(pk, versions[pk]).encode())
+
+    return digest.hexdigest()
+
+
+def invalidate_location_tiles(location_ids):
+    """
+    Invalidate the cached tiles of spray areas and of their RHCs and
+    districts, e.g. after their households or buffers change.
+    """
+    location_ids = set(pk for pk in location_ids if pk is not None)
+    if not location_ids:
+        return
+
+    bump_location_versions(
+        pk
+        for row in Location.objects.filter(pk__in=location_ids).values_list(
+            "pk", "parent_id", "parent__parent_id"
+        )
+        for pk in row
+    )
+
+
+def get_tile(layer, z, x, y, filters=None):
+    """
+    Returns the Mapbox Vector Tile z/x/y of layer from the tile cache,
+    rendering and storing it when it is missing or out of date. Filtered
+    tiles are not cached, tiles below the minimum zoom of the layer are
+    empty.
+    """
+    if z < TILE_MIN_ZOOM.get(layer, 0):
+        return b""
+
+    if filters or not TILE_CACHE_DIR:
+        return render_tile(layer, z, x, y, filters)
+
+    directory = os.path.join(TILE_CACHE_DIR, layer, str(z), str(x), str(y))
+    filename = "{}.mvt".format(get_tile_version(z, x, y))
+    path = os.path.join(directory, filename)
+    try:
+        with open(path, "rb") as tile_file:
+            return tile_file.read()
+    except FileNotFoundError:
+        pass
+
+    tile = render_tile(layer, z, x, y)
+    os.makedirs(directory, exist_ok=True)
+    with NamedTemporaryFile(dir=directory, delete=False) as tile_file:
+        tile_file.write(tile)
+    os.replace(tile_file.name, path)
+    # tiles of older location versions are never read again
+    for name in os.listdir(directory):
+        if name.endswith(".mvt") and name != filename:
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                pass
+
+    return tile
@@ -4,33 +4,42 @@ import gc
 import json
 import logging
 from datetime import datetime, timedelta
+from functools import partial
 
 from django.conf import settings
-from django.contrib.gis.db.models.functions import Distance
-from django.contrib.gis.geos import MultiPolygon, Point, Polygon
-from django.contrib.gis.measure import D
+from django.contrib.gis.geos import Point
+from django.contrib.postgres.fields.jsonb import KeyTextTransform
 from django.contrib.gis.utils import LayerMapping
-from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import connection
-from django.db.models import Count, F, Q
-from django.db.models.expressions import RawSQL
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, Min, Q
 from django.db.utils import IntegrityError
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django.utils.dateparse import parse_datetime
 
 from dateutil.parser import parse
 
+from mspray.apps.main.location_cache import bump_location_versions
 from mspray.apps.main.models.household import Household, household_mapping
 from mspray.apps.main.models.households_buffer import HouseholdsBuffer
 from mspray.apps.main.models.location import Location
 from mspray.apps.main.models.performance_report import PerformanceReport
+from mspray.apps.main.models.spray_area_indicators import (
+    SprayAreaIndicators,
+)
 from mspray.apps.main.models.spray_day import (
     DATA_ID_FIELD,
     DATE_FIELD,
     NON_STRUCTURE_GPS_FIELD,
     STRUCTURE_GPS_FIELD,
     SprayDay,
+    SprayDayDistrict,
+    SprayDayHealthCenterLocation,
+    get_data_field_expressions,
+    get_osmid,
+    mda_population_calculations,
+    set_data_fields,
     sprayday_mapping,
 )
 from mspray.apps.main.models.spray_operator import (
@@ -39,15 +48,22 @@ from mspray.apps.main.models.spray_operator import (
     SprayOperatorDailySummary,
 )
 from mspray.apps.main.models.spraypoint import SprayPoint, SprayPointView
+from mspray.apps.main.models.submission_intake import SubmissionIntake
 from mspray.apps.main.models.target_area import TargetArea, namibia_mapping
 from mspray.apps.main.models.team_leader import TeamLeader
 from mspray.apps.main.models.team_leader_assistant import TeamLeaderAssistant
+from mspray.apps.main.reconciliation import (
+    find_missing_ids,
+    find_missing_sprayformids,
+)
+from mspray.apps.main.spatial import resolve_target_area
 from mspray.apps.main.tasks import (
-    add_unique_record,
     link_spraypoint_with_osm,
+    mark_locations_for_rollup,
     run_tasks_after_spray_data,
 )
-from mspray.libs.ona import fetch_form_data
+from mspray.apps.main.tiles import invalidate_location_tiles
+from mspray.libs.ona import fetch_form_data, fetch_submissions
 from mspray.libs.utils.geom_buffer import with_metric_buffer
 
 BUFFER_SIZE = getattr(settings, "MSPRAY_NEW_BUFFER_WIDTH", 4)  # default to 4m
@@ -67,6 +83,114 @@ REASON_REFUSED = settings.MSPRAY_UNSPRAYED_REASON_REFUSED
 REASONS = settings.MSPRAY_UNSPRAYED_REASON_OTHER.copy()
 REASONS.pop(REASON_REFUSED)
 REASON_OTHER = REASONS.keys()
+SYNC_BATCH_SIZE = getattr(settings, "MSPRAY_SYNC_BATCH_SIZE", 500)
+INTAKE_BATCH_SIZE = getattr(settings, "MSPRAY_INTAKE_BATCH_SIZE", 500)
+INTAKE_MAX_ATTEMPTS = getattr(settings, "MSPRAY_INTAKE_MAX_ATTEMPTS", 5)
+LOCATIONS_FOR_POINTS_SQL = """
+SELECT DISTINCT ON ("points"."idx") "points"."idx", "main_location"."id"
+FROM unnest(%s::integer[], %s::text[]) AS "points"("idx", "wkt")
+JOIN "main_location" ON "main_location"."level" = %s
+AND {lookup}("main_location"."geom", ST_GeomFromText("points"."wkt", 4326))
+ORDER BY "points"."idx", "main_location"."id";
+"""  # noqa
+HOUSEHOLDS_BUFFER_CHECKSUM_SQL = """
+SELECT COUNT(*), md5(concat_ws(':', COUNT(*), MAX("modified_on"), %s::text, %s::text))
+FROM "main_household" WHERE "location_id" = %s;
+"""  # noqa
+SET_HOUSEHOLD_BUFFER_SQL = """
+UPDATE "main_household" SET "bgeom" = ST_Buffer(geography("geom"), %s)::geometry
+WHERE "location_id" = %s;
+"""  # noqa
+HOUSEHOLD_DUPLICATES_SQL = {
+    "geom": 'SELECT "a"."id", "b"."id" FROM "main_household" "a" INNER JOIN "main_household" "b" ON "a"."geom" ~= "b"."geom" AND "a"."id" < "b"."id"',  # noqa
+    "bgeom": 'SELECT "a"."id", "b"."id" FROM "main_household" "a" INNER JOIN "main_household" "b" ON "a"."bgeom" ~= "b"."bgeom" AND "a"."id" < "b"."id"',  # noqa
+    "overlap": 'SELECT "a"."id", "b"."id" FROM "main_household" "a" INNER JOIN "main_household" "b" ON ST_Within("b"."geom", "a"."bgeom") AND "a"."id" <> "b"."id"',  # noqa
+}
+REPOINT_SPRAYDAY_OSMID_SQL = """
+UPDATE "main_sprayday" SET "osmid" = "dups"."keep_hh_id"
+FROM unnest(%s::bigint[], %s::bigint[]) AS "dups" ("hh_id", "keep_hh_id")
+WHERE "main_sprayday"."osmid" = "dups"."hh_id";
+"""  # noqa
+REPOINT_HOUSEHOLD_SQL = """
+UPDATE "{table}" SET "{column}" = "dups"."keep_id"
+FROM unnest(%s::integer[], %s::integer[]) AS "dups" ("id", "keep_id")
+WHERE "{table}"."{column}" = "dups"."id";
+"""  # noqa
+HOUSEHOLD_DEDUP_BATCH_SIZE = getattr(
+    settings, "MSPRAY_HOUSEHOLD_DEDUP_BATCH_SIZE", 1000
+)
+CREATE_HOUSEHOLDS_BUFFER_SQL = """
+WITH "clusters" AS (
+    SELECT "bgeom", ST_ClusterDBSCAN("bgeom", 0, 1) OVER () AS "cluster"
+    FROM "main_household" WHERE "location_id" = %(location_id)s AND "bgeom" IS NOT NULL
+), "buffers" AS (
+    SELECT (ST_Dump(ST_Simplify(ST_Union("bgeom"), %(tolerance)s))).geom AS "geom"
+    FROM "clusters" GROUP BY "cluster"
+)
+INSERT INTO "main_householdsbuffer" ("location_id", "num_households", "geom", "checksum")
+SELECT %(location_id)s, (SELECT COUNT(*) FROM "main_household" WHERE ST_CoveredBy("main_household"."geom", "buffers"."geom")), "buffers"."geom", %(checksum)s
+FROM "buffers" WHERE GeometryType("buffers"."geom") = 'POLYGON';
+"""  # noqa
+
+LINK_NEW_STRUCTURES_SQL = """
+WITH "matches" AS (
+    SELECT "main_sprayday"."id" AS "sprayday_id", "nearest"."id" AS "household_id"
+    FROM "main_sprayday"
+    CROSS JOIN LATERAL (
+        SELECT "main_household"."id" FROM "main_household"
+        WHERE "main_household"."location_id" = "main_sprayday"."location_id"
+        AND ST_DWithin(geography("main_household"."geom"), geography("main_sprayday"."geom"), %(distance)s)
+        ORDER BY "main_household"."geom" <-> "main_sprayday"."geom"
+        LIMIT 1
+    ) AS "nearest"
+    WHERE "main_sprayday"."location_id" = %(location_id)s AND "main_sprayday"."household_id" IS NULL AND "main_sprayday"."geom" IS NOT NULL
+)
+UPDATE "main_sprayday" SET "household_id" = "main_household"."id", "geom" = "main_household"."geom", "bgeom" = "main_household"."bgeom", "osmid" = "main_household"."hh_id", "modified_on" = %(now)s,
+"data" = ("main_sprayday"."data" - %(node_key)s) || jsonb_build_object(%(way_key)s, "main_household"."hh_id") || CASE WHEN "main_sprayday"."data" ? %(node_key)s THEN jsonb_build_object(%(original_key)s, "main_sprayday"."data" -> %(node_key)s) ELSE '{}'::jsonb END
+FROM "matches" INNER JOIN "main_household" ON ("matches"."household_id" = "main_household"."id")
+WHERE "main_sprayday"."id" = "matches"."sprayday_id"
+RETURNING "main_sprayday"."id", "main_sprayday"."rhc_id", "main_sprayday"."district_id";
+"""  # noqa
+LINK_MATCHED_HOUSEHOLDS_SQL = """
+UPDATE "main_household" SET "visited" = true, "sprayable" = "main_household"."sprayable" IS TRUE OR "linked"."sprayable", "modified_on" = %s
+FROM (
+    SELECT "household_id", bool_or("sprayable") AS "sprayable" FROM "main_sprayday"
+    WHERE "id" = ANY(%s) GROUP BY "household_id"
+) AS "linked"
+WHERE "main_household"."id" = "linked"."household_id";
+"""  # noqa
+REBUILD_LINKED_SPRAYPOINTS_SQL = """
+INSERT INTO "main_spraypoint" ("data_id", "sprayday_id", "location_id")
+SELECT DISTINCT ON ("main_household"."hh_id") "main_household"."hh_id"::text, "main_sprayday"."id", "main_sprayday"."location_id"
+FROM "main_sprayday" INNER JOIN "main_household" ON ("main_sprayday"."household_id" = "main_household"."id")
+WHERE "main_sprayday"."id" = ANY(%(ids)s)
+ORDER BY "main_household"."hh_id", "main_sprayday"."sprayable" IS TRUE DESC, "main_sprayday"."id" DESC
+ON CONFLICT ("data_id", "location_id") DO UPDATE SET "sprayday_id" = EXCLUDED."sprayday_id"
+WHERE EXISTS (SELECT 1 FROM "main_sprayday" WHERE "main_sprayday"."id" = EXCLUDED."sprayday_id" AND "main_sprayday"."sprayable" = true)
+AND NOT EXISTS (SELECT 1 FROM "main_sprayday" WHERE "main_sprayday"."id" = "main_spraypoint"."sprayday_id" AND COALESCE(NULLIF("main_sprayday"."data" ->> %(was_sprayed)s, ''), "main_sprayday"."data" ->> %(new_was_sprayed)s) = %(sprayed)s);
+"""  # noqa
+
+PERFORMANCE_REPORT_BATCH_SIZE = getattr(
+    settings, "MSPRAY_PERFORMANCE_REPORT_BATCH_SIZE", 1000
+)
+UPSERT_PERFORMANCE_REPORTS_SQL = """
+INSERT INTO "main_performancereport" ("spray_operator_id", "sprayformid", "found", "sprayed", "refused", "other", "not_eligible", "spray_date", "start_time", "end_time", "reported_found", "reported_sprayed", "data_quality_check", "team_leader_id", "team_leader_assistant_id", "district_id", "data", "created_on", "modified_on")
+SELECT "spray_operator_id", "sprayformid", "found", "sprayed", "refused", "other", "not_eligible", "spray_date", "start_time", "end_time", COALESCE("reported_found", 0), COALESCE("reported_sprayed", 0), "data_quality_check", "team_leader_id", "team_leader_assistant_id", "district_id", "data"::jsonb, %(now)s, %(now)s
+FROM unnest(%(spray_operator_id)s::integer[], %(sprayformid)s::text[], %(found)s::integer[], %(sprayed)s::integer[], %(refused)s::integer[], %(other)s::integer[], %(not_eligible)s::integer[], %(spray_date)s::date[], %(start_time)s::time[], %(end_time)s::time[], %(reported_found)s::integer[], %(reported_sprayed)s::integer[], %(data_quality_check)s::boolean[], %(team_leader_id)s::integer[], %(team_leader_assistant_id)s::integer[], %(district_id)s::integer[], %(data)s::text[])
+AS "reports" ("spray_operator_id", "sprayformid", "found", "sprayed", "refused", "other", "not_eligible", "spray_date", "start_time", "end_time", "reported_found", "reported_sprayed", "data_quality_check", "team_leader_id", "team_leader_assistant_id", "district_id", "data")
+ON CONFLICT ("spray_operator_id", "sprayformid") DO UPDATE SET "found" = EXCLUDED."found", "sprayed" = EXCLUDED."sprayed", "refused" = EXCLUDED."refused", "other" = EXCLUDED."other", "not_eligible" = EXCLUDED."not_eligible", "spray_date" = EXCLUDED."spray_date", "start_time" = EXCLUDED."start_time", "end_time" = EXCLUDED."end_time",
+"reported_found" = CASE WHEN EXCLUDED."data_quality_check" IS NULL THEN "main_performancereport"."reported_found" ELSE EXCLUDED."reported_found" END,
+"reported_sprayed" = CASE WHEN EXCLUDED."data_quality_check" IS NULL THEN "main_performancereport"."reported_sprayed" ELSE EXCLUDED."reported_sprayed" END,
+"data_quality_check" = COALESCE(EXCLUDED."data_quality_check", "main_performancereport"."data_quality_check"),
+"team_leader_id" = COALESCE(EXCLUDED."team_leader_id", "main_performancereport"."team_leader_id"),
+"team_leader_assistant_id" = COALESCE(EXCLUDED."team_leader_assistant_id", "main_performancereport"."team_leader_assistant_id"),
+"district_id" = EXCLUDED."district_id", "data" = "main_performancereport"."data" || EXCLUDED."data", "modified_on" = EXCLUDED."modified_on"
+RETURNING "id";
+"""  # noqa
+
+SPRAYDAY_DATA_FIELDS_BATCH_SIZE = getattr(
+    settings, "MSPRAY_SPRAYDAY_DATA_FIELDS_BATCH_SIZE", 5000
+)
 
 
 logger = logging.getLogger(__name__)
@@ -99,28 +223,65 @@ def geojson_from_gps_string(geolocation, geom=False):
     geolocation = [float(p) for p in geolocation.split()[:2]]
     geolocation.reverse()
     if geom:
-        return Point(geolocation[0], geolocation[1])
+        return Point(geolocation[0], geolocation[1], srid=4326)
 
     return json.dumps({"type": "point", "coordinates": geolocation})
 
 
-def queryset_iterator(queryset, chunksize=100):
-    """''
-    Iterate over a Django Queryset.
+def queryset_chunks(queryset, chunksize=100):
+    """
+    Yields lists of at most chunksize rows of a Django Queryset in primary
+    key order, model instances or the dicts of a values() queryset that
+    includes the primary key.
+
+    Each chunk is fetched with the last primary key seen as the cursor
+    (pk > last_pk LIMIT chunksize) so every chunk is an index range scan and
+    the ordering of the queryset is not kept. Sliced and DISTINCT ON
+    querysets cannot be paged this way and are streamed in their own order
+    from a server-side cursor instead.
+    """
+    if not queryset.query.can_filter() or queryset.query.distinct_fields:
+        chunk = []
+        for row in queryset.iterator(chunk_size=chunksize):
+            chunk.append(row)
+            if len(chunk) == chunksize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+        return
+
+    pk_name = queryset.model._meta.pk.attname
+    queryset = queryset.order_by("pk")
+    chunk = list(queryset[:chunksize])
+    while chunk:
+        yield chunk
+        if len(chunk) < chunksize:
+            break
+        last = chunk[-1]
+        last_pk = last[pk_name] if isinstance(last, dict) else last.pk
+        chunk = list(queryset.filter(pk__gt=last_pk)[:chunksize])
+
+
+def queryset_iterator(
+    queryset, chunksize=100, only=None, prefetch_related=None
+):
+    """
+    Iterate over a Django Queryset in primary key order.
+
+    Loads a maximum of chunksize (default: 100) rows at a time with
+    queryset_chunks().
 
-    This method loads a maximum of chunksize (default: 100) rows in
-    its memory at the same time while django normally would load all
-    rows in its memory. Using the iterator() method only causes it to
-    not preload all the classes.
+    only - optional list of fields to load.
+    prefetch_related - optional lookups to prefetch for each chunk.
     """
-    start = 0
-    end = chunksize
-    while start < queryset.count():
-        for row in queryset[start:end]:
-            yield row
-        start += chunksize
-        end += chunksize
-        gc.collect()
+    if only:
+        queryset = queryset.only(*only)
+    if prefetch_related:
+        queryset = queryset.prefetch_related(*prefetch_related)
+
+    for chunk in queryset_chunks(queryset, chunksize):
+        yield from chunk
 
 
 def load_layer_mapping(model, shp_file, mapping, verbose=False, unique=None):
@@ -157,44 +318,76 @@ def set_household_buffer(distance=15, wkt=None):
     )
 
 
-def create_households_buffer(distance=15, recreate=False, target=None):
-    ta = None
-    ta_qs = Location.objects.filter(level=TA_LEVEL)
-    wkt = None
+def create_location_households_buffer(location_id, distance=15,
+                                      recreate=False):
+    """
+    Create the households buffers of a spray area in the database.
 
-    if target:
-        ta_qs = ta_qs.filter(code=target)
-        wkt = ta.geom.wkt
+    Households are buffered by distance metres, intersecting buffers are
+    clustered and merged with ST_Union and every resulting polygon is stored
+    with the number of households it covers. Spray areas whose households
+    have not changed since their buffers were created are skipped unless
+    recreate is True.
+
+    Returns the number of buffers created, None when skipped.
+    """
+    tolerance = settings.BUFFER_TOLERANCE
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            HOUSEHOLDS_BUFFER_CHECKSUM_SQL, [distance, tolerance, location_id]
+        )
+        count, checksum = cursor.fetchone()
+        buffers = HouseholdsBuffer.objects.filter(location_id=location_id)
+        if count == 0:
+            created = None
+            deleted = recreate and buffers.delete()[0]
+        elif not recreate and set(
+            buffers.values_list("checksum", flat=True)
+        ) == {checksum}:
+            return None
+        else:
+            cursor.execute(SET_HOUSEHOLD_BUFFER_SQL, [distance, location_id])
+            deleted = buffers.delete()[0]
+            cursor.execute(
+                CREATE_HOUSEHOLDS_BUFFER_SQL,
+                {
+                    "location_id": location_id,
+                    "tolerance": tolerance,
+                    "checksum": checksum,
+                },
+            )
+            created = cursor.rowcount
 
-    set_household_buffer(distance, wkt)
+    if created or deleted:
+        invalidate_location_tiles([location_id])
 
-    if recreate:
-        buffer_qs = HouseholdsBuffer.objects.all()
+    return created
 
-        if ta is not None:
-            buffer_qs = buffer_qs.filter(geom__within=ta.geom)
 
-        buffer_qs.delete()
+def create_households_buffer(
+    distance=15, recreate=False, target=None, is_async=False
+):
+    """
+    Create households buffers for every spray area, or the spray area with
+    the code target.
 
-    for ta in queryset_iterator(ta_qs, 10):
-        hh_buffers = Household.objects.filter(location=ta).values_list(
-            "bgeom", flat=True
-        )
-        if len(hh_buffers) == 0:
-            continue
-        bf = MultiPolygon([hhb for hhb in hh_buffers])
+    Spray areas are processed in parallel celery tasks when is_async is True.
+    """
+    from mspray.apps.main.tasks import create_location_households_buffer_task
 
-        # pylint: disable=no-member
-        for b in bf.cascaded_union.simplify(settings.BUFFER_TOLERANCE):
-            if not isinstance(b, Polygon):
-                continue
-            obj, created = HouseholdsBuffer.objects.get_or_create(
-                geom=b, location=ta
+    ta_qs = Location.objects.filter(level=TA_LEVEL)
+    if target:
+        ta_qs = ta_qs.filter(code=target)
+    elif recreate:
+        HouseholdsBuffer.objects.all().delete()
+
+    for location_id in ta_qs.values_list("pk", flat=True).iterator():
+        if is_async:
+            create_location_households_buffer_task.delay(
+                location_id, distance, recreate
             )
-            obj.num_households = Household.objects.filter(
-                geom__coveredby=b
-            ).count()
-            obj.save()
+        else:
+            create_location_households_buffer(location_id, distance, recreate)
 
 
 def link_sprayday_to_actors(sprayday, data=None):
@@ -250,9 +443,23 @@ def link_sprayday_to_actors(sprayday, data=None):
     sprayday.save()
 
 
-def add_spray_data(data):
+def _run_task(deferred_tasks, func, *args):
+    """
+    Call func(*args) now or, when deferred_tasks is a list, add it to the
+    list for the caller to run once its transaction is committed.
+    """
+    if deferred_tasks is None:
+        func(*args)
+    else:
+        deferred_tasks.append(partial(func, *args))
+
+
+def add_spray_data(data, deferred_tasks=None):
     """"
     Add spray data submission from aggregate submission to the dashboard
+
+    The celery tasks of the submission are added to deferred_tasks instead
+    of being sent when it is a list, see _run_task().
     """
     submission_id = data.get(DATA_ID_FIELD)
     spray_date = data.get(DATE_FIELD)
@@ -264,18 +471,16 @@ def add_spray_data(data):
         STRUCTURE_GPS_FIELD, data.get(NON_STRUCTURE_GPS_FIELD)
     )
     geom = (
-        geojson_from_gps_string(gps_field) if gps_field is not None else None
+        geojson_from_gps_string(gps_field, geom=True)
+        if gps_field is not None
+        else None
     )
     location_code = data.get(settings.MSPRAY_LOCATION_FIELD)
     location = None
     if location_code and not settings.MSPRAY_SPATIAL_QUERIES:
         location = Location.objects.get(code=location_code)
     elif geom is not None:
-        locations = Location.objects.filter(
-            geom__contains=geom, level=settings.MSPRAY_TA_LEVEL
-        )
-        if locations:
-            location = locations[0]
+        location = resolve_target_area(geom)
     osmid = data.get("{}:way:id".format(HAS_UNIQUE_FIELD))
     household = None
     if HAS_UNIQUE_FIELD and osmid:
@@ -295,9 +500,9 @@ def add_spray_data(data):
             lat = data.get("{}:ctr:lat".format(HAS_UNIQUE_FIELD))
             lon = data.get("{}:ctr:lon".format(HAS_UNIQUE_FIELD))
             if "{}:node:id".format(HAS_UNIQUE_FIELD) in data and lat and lon:
-                location = Location.objects.filter(
-                    level="ta", geom__covers=Point(lon, lat)
-                ).first()
+                location = resolve_target_area(
+                    Point(lon, lat), predicate="covers"
+                )
                 if location:
                     sprayday.location = location
                     sprayday.save()
@@ -322,18 +527,449 @@ def add_spray_data(data):
     link_sprayday_to_actors(sprayday=sprayday, data=data)
 
     if settings.OSM_SUBMISSIONS and not household:
-        link_spraypoint_with_osm.delay(sprayday.pk)
+        _run_task(deferred_tasks, link_spraypoint_with_osm.delay, sprayday.pk)
 
     if HAS_UNIQUE_FIELD and location:
         add_unique_data(sprayday, HAS_UNIQUE_FIELD, location)
 
     # run tasks after creating SprayDay obj
     if sprayday.has_osm_data():
-        run_tasks_after_spray_data(sprayday)
+        _run_task(deferred_tasks, run_tasks_after_spray_data, sprayday)
 
     return sprayday
 
 
+def get_locations_for_points(points, level, lookup="ST_Contains"):
+    """Return {key: location_id} of the locations at level covering points.
+
+    points is a dict of {key: GEOSGeometry} with integer keys, lookup is the
+    PostGIS function used to match a location geom to a point.
+    """
+    if not points:
+        return {}
+
+    keys = list(points)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            LOCATIONS_FOR_POINTS_SQL.format(lookup=lookup),
+            [keys, [points[key].wkt for key in keys], level],
+        )
+
+        return dict(cursor.fetchall())
+
+
+def get_spray_operators(codes):
+    """Return {code: SprayOperator} for the given spray operator codes."""
+    codes = set(code for code in codes if code)
+    spray_operators = dict(
+        (spray_operator.code, spray_operator)
+        for spray_operator in SprayOperator.objects.filter(
+            code__in=codes
+        ).select_related(
+            "team_leader", "team_leader_assistant__team_leader"
+        )
+    )
+    for code in codes.difference(spray_operators):
+        spray_operators[code] = get_spray_operator(code)
+
+    return spray_operators
+
+
+def _get_unique_data_id(data, unique_field):
+    data_id = (
+        data.get(unique_field + ":way:id")
+        or data.get(unique_field + ":node:id")
+        or data.get("newstructure/gps")
+    )
+    if isinstance(data_id, str) and len(data_id) > 50:
+        data_id = data_id[:50]
+
+    return data_id
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# pylint: disable=too-many-locals,too-many-branches,too-many-statements
+def add_spray_data_batch(records, deferred_tasks=None):
+    """
+    Add a batch of spray data submissions to the dashboard.
+
+    Has the same effect as calling add_spray_data() on each record, locations,
+    households and actors are resolved for the whole batch in a few queries
+    and new SprayDay, SprayPoint and location link records are written with
+    bulk_create. Submissions that already exist are updated with
+    add_spray_data() and spray points that clash with an existing record go
+    through add_unique_data(). Raises ValidationError, like
+    add_spray_data(), when a new record has no spray date, nothing in the
+    batch is added then.
+    deferred_tasks is passed on to add_spray_data().
+
+    Returns a list of the SprayDay objects.
+    """
+    existing = set(
+        SprayDay.objects.filter(
+            submission_id__in=[data.get(DATA_ID_FIELD) for data in records]
+        ).values_list("submission_id", flat=True)
+    )
+    new_records = []
+    updated_records = []
+    for data in records:
+        submission_id = data.get(DATA_ID_FIELD)
+        if submission_id in existing:
+            updated_records.append(data)
+            continue
+        try:
+            spray_date = datetime.strptime(data.get(DATE_FIELD), "%Y-%m-%d")
+        except TypeError:
+            raise ValidationError("{} not provided".format(DATE_FIELD))
+        existing.add(submission_id)
+        gps_field = data.get(
+            STRUCTURE_GPS_FIELD, data.get(NON_STRUCTURE_GPS_FIELD)
+        )
+        geom = (
+            geojson_from_gps_string(gps_field, geom=True)
+            if gps_field is not None
+            else None
+        )
+        new_records.append((data, spray_date, geom))
+
+    # resolve locations, households and actors for the whole batch
+    location_ids = {}
+    if settings.MSPRAY_SPATIAL_QUERIES:
+        location_ids = get_locations_for_points(
+            dict(
+                (index, geom)
+                for index, (_data, _date, geom) in enumerate(new_records)
+                if geom is not None
+            ),
+            settings.MSPRAY_TA_LEVEL,
+        )
+    else:
+        codes = {}
+        points = {}
+        for index, (data, _spray_date, geom) in enumerate(new_records):
+            code = data.get(settings.MSPRAY_LOCATION_FIELD)
+            if code:
+                codes[index] = code
+            elif geom is not None:
+                points[index] = geom
+        location_ids = get_locations_for_points(
+            points, settings.MSPRAY_TA_LEVEL
+        )
+        code_ids = dict(
+            Location.objects.filter(code__in=codes.values()).values_list(
+                "code", "pk"
+            )
+        )
+        for index, code in codes.items():
+            if code not in code_ids:
+                raise Location.DoesNotExist(
+                    "Location with code {} does not exist.".format(code)
+                )
+            location_ids[index] = code_ids[code]
+
+    households = {}
+    if HAS_UNIQUE_FIELD:
+        osmids = [
+            _to_int(data.get("{}:way:id".format(HAS_UNIQUE_FIELD)))
+            for data, _spray_date, _geom in new_records
+        ]
+        households = dict(
+            (household.hh_id, household)
+            for household in Household.objects.filter(
+                hh_id__in=[osmid for osmid in osmids if osmid]
+            ).select_related("location__parent__parent")
+        )
+
+    node_points = {}
+    for index, (data, _spray_date, _geom) in enumerate(new_records):
+        osmid = _to_int(data.get("{}:way:id".format(HAS_UNIQUE_FIELD)))
+        if index in location_ids or osmid in households:
+            continue
+        lat = data.get("{}:ctr:lat".format(HAS_UNIQUE_FIELD))
+        lon = data.get("{}:ctr:lon".format(HAS_UNIQUE_FIELD))
+        if "{}:node:id".format(HAS_UNIQUE_FIELD) in data and lat and lon:
+            node_points[index] = Point(lon, lat)
+    location_ids.update(
+        get_locations_for_points(node_points, "ta", lookup="ST_Covers")
+    )
+    locations = Location.objects.select_related("parent__parent").in_bulk(
+        set(location_ids.values())
+    )
+
+    spray_operators = get_spray_operators(
+        data.get(SPRAY_OPERATOR_CODE) for data, _date, _geom in new_records
+    )
+    team_leader_assistants = TeamLeaderAssistant.objects.select_related(
+        "team_leader"
+    ).in_bulk(
+        [
+            data.get(TEAM_LEADER_ASSISTANT_CODE)
+            for data, _spray_date, _geom in new_records
+        ],
+        field_name="code",
+    )
+    team_leaders = TeamLeader.objects.in_bulk(
+        [data.get(TEAM_LEADER_CODE) for data, _date, _geom in new_records],
+        field_name="code",
+    )
+
+    spraydays = []
+    for index, (data, spray_date, geom) in enumerate(new_records):
+        sprayday = SprayDay(
+            submission_id=data.get(DATA_ID_FIELD),
+            spray_date=spray_date,
+            data=data,
+        )
+        location = locations.get(location_ids.get(index))
+        if geom is not None:
+            sprayday.geom = geom
+        household = households.get(
+            _to_int(data.get("{}:way:id".format(HAS_UNIQUE_FIELD)))
+        )
+        if household:
+            sprayday.household = household
+            sprayday.geom = household.geom
+            sprayday.bgeom = household.bgeom
+            location = household.location
+        sprayday.location = location
+        if settings.OSM_SUBMISSIONS and geom is not None:
+            sprayday.geom = geom
+            sprayday.bgeom = with_metric_buffer(sprayday.geom, BUFFER_SIZE)
+
+        spray_operator = spray_operators.get(data.get(SPRAY_OPERATOR_CODE))
+        team_leader_assistant = team_leader_assistants.get(
+            data.get(TEAM_LEADER_ASSISTANT_CODE)
+        )
+        team_leader = team_leaders.get(data.get(TEAM_LEADER_CODE))
+        if not team_leader_assistant and spray_operator:
+            team_leader_assistant = spray_operator.team_leader_assistant
+        if not team_leader:
+            if team_leader_assistant and team_leader_assistant.team_leader:
+                team_leader = team_leader_assistant.team_leader
+            elif spray_operator:
+                team_leader = spray_operator.team_leader
+        sprayday.spray_operator = spray_operator
+        sprayday.team_leader_assistant = team_leader_assistant
+        sprayday.team_leader = team_leader
+        if spray_operator:
+            data["sprayformid"] = get_formid(spray_operator, spray_date)
+
+        # what SprayDay.save() and its pre_save signal would do
+        sprayday._set_sprayed_status()  # pylint: disable=protected-access
+        sprayday._set_sprayable_status()  # pylint: disable=protected-access
+        sprayday._set_parent_locations()  # pylint: disable=protected-access
+        osmid = _to_int(get_osmid(data))
+        if osmid and not location:
+            sprayday.osmid = osmid
+        mda_population_calculations(SprayDay, instance=sprayday)
+        set_data_fields(SprayDay, instance=sprayday)
+        spraydays.append(sprayday)
+
+    spray_points = []
+    with transaction.atomic():
+        spraydays = SprayDay.objects.bulk_create(spraydays)
+        with_location = [
+            sprayday for sprayday in spraydays if sprayday.location
+        ]
+        SprayDayHealthCenterLocation.objects.bulk_create(
+            [
+                SprayDayHealthCenterLocation(
+                    location_id=sprayday.rhc_id, content_object=sprayday
+                )
+                for sprayday in with_location
+                if sprayday.rhc_id
+            ]
+        )
+        SprayDayDistrict.objects.bulk_create(
+            [
+                SprayDayDistrict(
+                    location_id=sprayday.district_id, content_object=sprayday
+                )
+                for sprayday in with_location
+                if sprayday.district_id
+            ]
+        )
+
+        visited = set(
+            sprayday.household_id
+            for sprayday in spraydays
+            if sprayday.household_id
+        )
+        sprayable = set(
+            sprayday.household_id
+            for sprayday in spraydays
+            if sprayday.household_id and sprayday.sprayable
+        )
+        Household.objects.filter(pk__in=visited).exclude(visited=True).update(
+            visited=True
+        )
+        Household.objects.filter(pk__in=sprayable).exclude(
+            sprayable=True
+        ).update(sprayable=True)
+        Household.objects.filter(
+            pk__in=visited.difference(sprayable), sprayable__isnull=True
+        ).update(sprayable=False)
+
+        if HAS_UNIQUE_FIELD:
+            candidates = []
+            for sprayday in with_location:
+                data_id = _get_unique_data_id(sprayday.data, HAS_UNIQUE_FIELD)
+                if data_id:
+                    candidates.append((sprayday, str(data_id)))
+            taken = set(
+                SprayPoint.objects.filter(
+                    data_id__in=[data_id for _sprayday, data_id in candidates]
+                ).values_list("data_id", "location_id")
+            )
+            clashes = []
+            for sprayday, data_id in candidates:
+                key = (data_id, sprayday.location_id)
+                if key in taken:
+                    clashes.append(sprayday)
+                    continue
+                taken.add(key)
+                spray_points.append(
+                    SprayPoint(
+                        sprayday=sprayday,
+                        data_id=data_id,
+                        location_id=sprayday.location_id,
+                    )
+                )
+            SprayPoint.objects.bulk_create(spray_points)
+            for sprayday in clashes:
+                add_unique_data(sprayday, HAS_UNIQUE_FIELD, sprayday.location)
+
+        # signals are not sent by bulk_create
+        location_ids = [sprayday.location_id for sprayday in with_location]
+        SprayAreaIndicators.refresh(location_ids)
+        mark_locations_for_rollup(
+            location_ids
+            + [sprayday.rhc_id for sprayday in with_location]
+            + [sprayday.district_id for sprayday in with_location]
+        )
+
+    for sprayday in spraydays:
+        if settings.OSM_SUBMISSIONS and not sprayday.household_id:
+            _run_task(
+                deferred_tasks, link_spraypoint_with_osm.delay, sprayday.pk
+            )
+        if sprayday.has_osm_data():
+            _run_task(deferred_tasks, run_tasks_after_spray_data, sprayday)
+
+    for data in updated_records:
+        spraydays.append(add_spray_data(data, deferred_tasks))
+
+    return spraydays
+
+
+def delete_cached_submission_keys(spraydays):
+    """
+    Invalidate the cached values of the spray areas, RHCs and districts of a
+    batch of submissions.
+    """
+    bump_location_versions(
+        pk
+        for sprayday in spraydays
+        for pk in (sprayday.location_id, sprayday.rhc_id, sprayday.district_id)
+    )
+
+
+def process_submission_intake(batch_size=INTAKE_BATCH_SIZE):
+    """
+    Process the staged SubmissionIntake payloads, batch_size submissions at
+    a time in submission id order.
+
+    Each batch is added with add_spray_data_batch(), a batch that fails is
+    added one submission at a time with add_spray_data(). Payloads older
+    than the stored submission are dropped, payloads that fail are kept with
+    the error for up to INTAKE_MAX_ATTEMPTS attempts. The celery tasks of
+    the submissions are sent once their batch is committed. Returns the
+    number of submissions added.
+    """
+    count = 0
+    failed = {}
+    while True:
+        spraydays = []
+        tasks = []
+        with transaction.atomic():
+            staged = list(
+                SubmissionIntake.objects.select_for_update(skip_locked=True)
+                .filter(attempts__lt=INTAKE_MAX_ATTEMPTS)
+                .exclude(pk__in=list(failed))
+                .order_by("submission_id")[:batch_size]
+            )
+            if not staged:
+                break
+
+            current = dict(
+                (submission_id, last_edited or date_modified or "")
+                for submission_id, last_edited, date_modified in (
+                    SprayDay.objects.filter(
+                        submission_id__in=[i.pk for i in staged]
+                    )
+                    .annotate(
+                        last_edited=KeyTextTransform("_last_edited", "data"),
+                        date_modified=KeyTextTransform(
+                            "_date_modified", "data"
+                        ),
+                    )
+                    .values_list(
+                        "submission_id", "last_edited", "date_modified"
+                    )
+                )
+            )
+            records = [
+                intake
+                for intake in staged
+                if intake.edited >= current.get(intake.pk, "")
+            ]
+            errors = {}
+            try:
+                with transaction.atomic():
+                    spraydays = add_spray_data_batch(
+                        [intake.data for intake in records], tasks
+                    )
+            except Exception:  # pylint: disable=broad-except
+                # a payload that fails must not hold back the queue
+                tasks = []
+                for intake in records:
+                    record_tasks = []
+                    try:
+                        with transaction.atomic():
+                            spraydays.append(
+                                add_spray_data(intake.data, record_tasks)
+                            )
+                    except Exception as error:  # pylint: disable=broad-except
+                        logger.exception(
+                            "Staged submission %s failed.", intake.pk
+                        )
+                        errors[intake.pk] = "%s" % error
+                    else:
+                        tasks.extend(record_tasks)
+
+            for submission_id, error in errors.items():
+                SubmissionIntake.objects.filter(pk=submission_id).update(
+                    attempts=F("attempts") + 1, error=error
+                )
+            SubmissionIntake.objects.filter(
+                pk__in=[i.pk for i in staged if i.pk not in errors]
+            ).delete()
+            failed.update(errors)
+
+        for task in tasks:
+            task()
+        count += len(spraydays)
+        delete_cached_submission_keys(spraydays)
+
+    return count
+
+
 def set_team_leader_assistant(sprayday, save=True):
     team_leader_assistant = get_team_leader_assistant(
         sprayday.data.get(TEAM_LEADER_ASSISTANT_CODE)
@@ -422,7 +1058,7 @@ def update_average_dos_score_all_levels(code, score):
         district.average_spray_quality_score = round(
             average_spray_quality_score, 2
         )
-        district.save()
+        district.save(update_fields=["average_spray_quality_score"])
 
 
 def get_calculate_avg_dos_score(spray_operator_code):
@@ -587,7 +1223,7 @@ def calculate_data_quality_check(spray_form_id, spray_operator_code):
             )
 
         district.data_quality_check = data_quality_check
-        district.save()
+        district.save(update_fields=["data_quality_check"])
 
 
 def add_spray_operator_daily(data):
@@ -630,7 +1266,7 @@ def add_spray_operator_daily(data):
         calculate_data_quality_check(spray_form_id, spray_operator_code)
         if spray_operator is None:
             sprayday = SprayDay.objects.filter(
-                data__sprayformid=spray_form_id
+                sprayformid=spray_form_id
             ).last()
             if sprayday:
                 spray_operator = sprayday.spray_operator
@@ -730,23 +1366,13 @@ def add_unique_data(sprayday, unique_field, location, osmid=None):
 
 
 def delete_cached_target_area_keys(sprayday):
-    locations = []
-
-    if sprayday.geom is not None:
-        locations = Location.objects.exclude(geom=None)
-    elif sprayday.location is not None:
-        locations = Location.objects.filter(
-            Q(location=sprayday.location)
-            | Q(location=sprayday.location.parent)
-        )
-
-    for location in locations:
-        keys = (
-            "%(key)s_not_visited %(key)s_visited_other "
-            "%(key)s_visited_refused %(key)s_visited_sprayed "
-            "%(key)s_visited_total" % {"key": location.pk}
-        )
-        cache.delete_many(keys.split())
+    """
+    Invalidate the cached values of the spray area, RHC and district of a
+    submission.
+    """
+    bump_location_versions(
+        [sprayday.location_id, sprayday.rhc_id, sprayday.district_id]
+    )
 
 
 def avg_time_per_group(results):
@@ -866,20 +1492,11 @@ def sprayed_queryset(queryset):
 
 
 def refused_queryset(queryset):
-    return queryset.extra(
-        where=["data->>%s = %s"], params=[REASON_FIELD, REASON_REFUSED]
-    )
+    return queryset.filter(unsprayed_reason=REASON_REFUSED)
 
 
 def other_queryset(queryset):
-    return queryset.extra(
-        where=[
-            "data->>%s IN ({})".format(
-                ",".join(["'{}'".format(i) for i in REASON_OTHER])
-            )
-        ],
-        params=[REASON_FIELD],
-    )
+    return queryset.filter(unsprayed_reason__in=REASON_OTHER)
 
 
 def unique_spray_points(queryset):
@@ -970,179 +1587,237 @@ def remove_duplicate_sprayoperatordailysummary():
         objects.exclude(id=objects.first().id).delete()
 
 
-def start_end_time(sprayday_qs, sprayformid):
-    """
-    Returns start, end times and spray_date for a given sprayformid.
-    """
-    start_time = (
-        sprayday_qs.filter(
-            data__sprayformid=sprayformid, data__start__isnull=False
-        )
-        .annotate(start=RawSQL("data->>'start'", ()))
-        .values_list("start", flat=True)
-        .order_by("start")
-        .first()
-    )
-    end_time = (
-        sprayday_qs.filter(
-            data__sprayformid=sprayformid, data__end__isnull=False
-        )
-        .annotate(end=RawSQL("data->>'end'", ()))
-        .values_list("end", flat=True)
-        .order_by("-end")
-        .first()
-    )
-    spray_date = (
-        parse_datetime(start_time).date()
-        if start_time
-        else formid_date(sprayformid)
-    )
-    start_time = parse_datetime(start_time).time() if start_time else None
-    end_time = parse_datetime(end_time).time() if end_time else None
-
-    return start_time, end_time, spray_date
-
-
 def performance_report(spray_operator, queryset=None):
     """
     Update performance report for spray_operator.
     """
     if spray_operator is not None:
-        operator_qs = SprayDay.objects.filter(
-            spray_operator=spray_operator, sprayable=True
-        )
         if queryset is None:
-            queryset = operator_qs.annotate(
-                sprayformid=RawSQL("data->'sprayformid'", ())
-            )
-        else:
-            queryset = queryset.annotate(
-                sprayformid=RawSQL("data->'sprayformid'", ())
-            )
-        queryset = (
-            queryset.values_list("sprayformid", flat=True)
-            .exclude(sprayformid__isnull=True)
-            .order_by("spray_date")
-            .distinct()
+            queryset = SprayDay.objects.filter(sprayable=True)
+        build_performance_reports(
+            queryset.filter(spray_operator=spray_operator)
         )
-        for sprayformid in queryset:
-            create_performance_report(spray_operator, sprayformid, operator_qs)
 
         return spray_operator
     return None
 
 
-def create_performance_report(spray_operator, sprayformid, operator_qs):
-    """Create or update a PerformanceReport object."""
-    try:
-        report = PerformanceReport.objects.get(
-            sprayformid=sprayformid, spray_operator=spray_operator
+def get_custom_aggregations(condition=None):
+    """Compile the EXTRA_PERFORMANCE_AGGREGATIONS setting to aggregates.
+
+    :param condition - an optional Q object every aggregate is limited to
+
+    :return a dict of each custom field and its (alias, Count) aggregate.
+    """
+    custom_aggregations = getattr(
+        settings, "EXTRA_PERFORMANCE_AGGREGATIONS", {}
+    )
+    aggregations = {}
+    for i, (field, query) in enumerate(custom_aggregations.items()):
+        query = Q(**query) if condition is None else condition & Q(**query)
+        aggregations[field] = (
+            "custom_aggregation_%d" % i,
+            Count("pk", filter=query),
+        )
+
+    return aggregations
+
+
+def get_performance_report_values(queryset=None):
+    """
+    Returns the PerformanceReport values of every spray operator and
+    sprayformid with a submission in queryset, of all submissions when
+    queryset is None.
+
+    The counts, start and end times of all the reports are computed in one
+    grouped query, the daily summaries and spray operators are then loaded in
+    one query each.
+    """
+    submissions = SprayDay.objects.filter(spray_operator__isnull=False)
+    keys = None
+    if queryset is not None:
+        keys = set(
+            queryset.filter(spray_operator__isnull=False)
+            .exclude(sprayformid__isnull=True)
+            .values_list("spray_operator_id", "sprayformid")
+            .distinct()
         )
-    except PerformanceReport.DoesNotExist:
-        report = PerformanceReport(
-            sprayformid=sprayformid, spray_operator=spray_operator
+        if not keys:
+            return []
+        submissions = submissions.filter(
+            spray_operator_id__in=set(key[0] for key in keys),
+            sprayformid__in=set(key[1] for key in keys),
         )
-    queryset = operator_qs.filter(data__sprayformid=sprayformid)
-    # found is also same us residential for MDA
-    found = queryset.count()
-    sprayed = queryset.filter(was_sprayed=True).count()
-    refused = queryset.filter(
-        was_sprayed=False, data__contains={REASON_FIELD: REASON_REFUSED}
-    ).count()
-    other = (
-        queryset.filter(was_sprayed=False)
-        .exclude(data__contains={REASON_FIELD: REASON_REFUSED})
-        .count()
-    )
-    report.found = found
-    report.sprayed = sprayed
-    report.refused = refused
-    report.other = other
 
-    report.start_time, report.end_time, report.spray_date = start_end_time(
-        operator_qs, sprayformid
+    sprayable = Q(sprayable=True)
+    refused = Q(unsprayed_reason=REASON_REFUSED)
+    custom_aggregations = get_custom_aggregations(sprayable)
+    rows = (
+        submissions.exclude(sprayformid__isnull=True)
+        .values("spray_operator_id", "sprayformid")
+        .annotate(
+            # found is also same us residential for MDA
+            found=Count("pk", filter=sprayable),
+            sprayed=Count("pk", filter=sprayable & Q(was_sprayed=True)),
+            refused=Count(
+                "pk", filter=sprayable & Q(was_sprayed=False) & refused
+            ),
+            other=Count(
+                "pk", filter=sprayable & Q(was_sprayed=False) & ~refused
+            ),
+            not_eligible=Count("pk", filter=Q(sprayable=False)),
+            start=Min(KeyTextTransform("start", "data"), filter=sprayable),
+            end=Max(KeyTextTransform("end", "data"), filter=sprayable),
+            **dict(custom_aggregations.values())
+        )
+        .filter(found__gt=0)
+        .order_by()
     )
-
-    reported = (
-        SprayOperatorDailySummary.objects.filter(
-            sprayoperator_code=spray_operator.code
+    if keys is not None:
+        rows = [
+            row
+            for row in rows
+            if (row["spray_operator_id"], row["sprayformid"]) in keys
+        ]
+    else:
+        rows = list(rows)
+    if not rows:
+        return []
+
+    spray_operators = dict(
+        (pk, values)
+        for pk, *values in SprayOperator.objects.filter(
+            pk__in=set(row["spray_operator_id"] for row in rows)
+        ).values_list(
+            "pk",
+            "code",
+            "team_leader_id",
+            "team_leader_assistant_id",
+            "district_id",
         )
-        .filter(spray_form_id=sprayformid)
-        .order_by("date_created")
-        .last()
     )
-    if reported:
-        reported_found = 0 if not reported else reported.found
-        reported_sprayed = 0 if not reported else reported.sprayed
-        found_difference = reported_found - found
-        sprayed_difference = reported_sprayed - sprayed
-        data_quality_check = found_difference == 0 and sprayed_difference == 0
-        report.reported_found = reported_found
-        report.reported_sprayed = reported_sprayed
-        report.data_quality_check = data_quality_check
-
-    if spray_operator.team_leader:
-        report.team_leader = spray_operator.team_leader
-    if spray_operator.team_leader_assistant:
-        report.team_leader_assistant = spray_operator.team_leader_assistant
-
-    report.not_eligible = spray_operator.sprayday_set.filter(
-        sprayable=False, data__sprayformid=sprayformid
-    ).count()
-
-    report.district = spray_operator.district
-
-    try:
-        report.save()
-    except IntegrityError as error:
-        logger.error(
-            "Error: %s while creating %s performance report.",
-            error,
-            sprayformid,
+    reported = dict(
+        ((code, spray_form_id), (found, sprayed))
+        for code, spray_form_id, found, sprayed in (
+            SprayOperatorDailySummary.objects.filter(
+                sprayoperator_code__in=set(
+                    values[0] for values in spray_operators.values()
+                )
+            )
+            # the latest summary of a sprayformid is used
+            .order_by("date_created", "pk")
+            .values_list(
+                "sprayoperator_code", "spray_form_id", "found", "sprayed"
+            )
         )
+    )
 
-    return apply_custom_aggregations(report, queryset)
+    sprayformid_length = PerformanceReport._meta.get_field(
+        "sprayformid"
+    ).max_length
+    reports = []
+    for row in rows:
+        code, team_leader_id, assistant_id, district_id = spray_operators[
+            row["spray_operator_id"]
+        ]
+        start = parse_datetime(row["start"]) if row["start"] else None
+        end = parse_datetime(row["end"]) if row["end"] else None
+        if (
+            not (start and end and district_id)
+            or len(row["sprayformid"]) > sprayformid_length
+        ):
+            logger.error(
+                "Error: missing or invalid values while creating %s "
+                "performance report.",
+                row["sprayformid"],
+            )
+            continue
 
+        reported_found, reported_sprayed = reported.get(
+            (code, row["sprayformid"]), (None, None)
+        )
+        data_quality_check = None
+        if reported_found is not None:
+            data_quality_check = (
+                reported_found == row["found"]
+                and reported_sprayed == row["sprayed"]
+            )
+        reports.append(
+            {
+                "spray_operator_id": row["spray_operator_id"],
+                "sprayformid": row["sprayformid"],
+                "found": row["found"],
+                "sprayed": row["sprayed"],
+                "refused": row["refused"],
+                "other": row["other"],
+                "not_eligible": row["not_eligible"],
+                "spray_date": start.date(),
+                "start_time": start.time(),
+                "end_time": end.time(),
+                "reported_found": reported_found,
+                "reported_sprayed": reported_sprayed,
+                "data_quality_check": data_quality_check,
+                "team_leader_id": team_leader_id,
+                "team_leader_assistant_id": assistant_id,
+                "district_id": district_id,
+                "data": json.dumps(
+                    dict(
+                        (field, row[alias])
+                        for field, (alias, _aggregate) in (
+                            custom_aggregations.items()
+                        )
+                    )
+                ),
+            }
+        )
 
-def apply_custom_aggregations(report, queryset):
-    """Apply custom aggregations to a performance report.
+    return reports
 
-    :param report - a performance report
-    :param queryset - a SprayDay queryset preferably
 
-    :return PerformanceReport.
+def build_performance_reports(
+    queryset=None, batch_size=PERFORMANCE_REPORT_BATCH_SIZE
+):
     """
-    # custom fields
-    custom_aggregations = getattr(
-        settings, "EXTRA_PERFORMANCE_AGGREGATIONS", {}
-    )
-    for field, query in custom_aggregations.items():
-        report.data[field] = queryset.filter(**query).count()
+    Create or update the PerformanceReport of every spray operator and
+    sprayformid with a submission in queryset, of all submissions when
+    queryset is None.
 
-    if custom_aggregations:
-        report.save()
+    Returns the number of reports created or updated.
+    """
+    reports = get_performance_report_values(queryset)
+    report_ids = []
+    with connection.cursor() as cursor:
+        for i in range(0, len(reports), batch_size):
+            batch = reports[i:i + batch_size]
+            params = dict(
+                (field, [report[field] for report in batch])
+                for field in batch[0]
+            )
+            params["now"] = timezone.now()
+            cursor.execute(UPSERT_PERFORMANCE_REPORTS_SQL, params)
+            report_ids.extend(row[0] for row in cursor.fetchall())
 
-    return report
+    return len(report_ids)
 
 
 def create_performance_reports():
     """
     Create PerfomanceReports for all spray operators.
     """
-    for spray_operator in SprayOperator.objects.filter().iterator():
-        try:
-            performance_report(spray_operator)
-        except AttributeError:
-            # ignore AttributeError exceptions and continue processing
-            pass
-        gc.collect()
+    return build_performance_reports()
 
 
 def sync_missing_sprays(formid, log_writer):
     """
     Sync missing spray day data for the given formid from Ona.
     """
-    sync_missing_data(formid, SprayDay, add_spray_data, log_writer)
+    sync_missing_data(
+        formid,
+        SprayDay,
+        add_spray_data,
+        log_writer,
+        batch_sync_func=add_spray_data_batch,
+    )
 
 
 def sync_missing_sopdailysummary(formid, log_writer):
@@ -1154,55 +1829,262 @@ def sync_missing_sopdailysummary(formid, log_writer):
     )
 
 
-def sync_missing_data(formid, ModelClass, sync_func, log_writer):
+def _sync_records(records, sync_func, log_writer):
+    for rec in records:
+        dataid = rec.get("_id")
+        try:
+            sync_func(rec)
+        except IntegrityError:
+            log_writer("Already saved {}".format(dataid))
+        except ValidationError as err:
+            log_writer("An error occurred while proccessing {}.".format(err))
+
+
+def sync_missing_data(  # pylint: disable=too-many-arguments
+    formid,
+    ModelClass,
+    sync_func,
+    log_writer,
+    batch_sync_func=None,
+    batch_size=SYNC_BATCH_SIZE,
+):
     """
     Fetches missing data for a form
+
+    When batch_sync_func is provided records are saved batch_size records at
+    a time with it, a batch that fails is saved one record at a time with
+    sync_func. batch_sync_func is called with a list that it adds the celery
+    tasks of the batch to, they are run once the batch is committed.
     """
+
+    def _sync_batch(batch):
+        tasks = []
+        try:
+            with transaction.atomic():
+                batch_sync_func(batch, tasks)
+        except (IntegrityError, ValidationError):
+            _sync_records(batch, sync_func, log_writer)
+        else:
+            for task in tasks:
+                task()
+
     if not formid:
         log_writer("'formid' is required.")
         return None
-    old_data = (
-        ModelClass.objects.filter()
-        .order_by("-submission_id")
-        .values_list("submission_id", flat=True)
-    )
     raw_data = fetch_form_data(formid, dataids_only=True)
     if isinstance(raw_data, list):
         all_data = [rec["_id"] for rec in raw_data]
-        all_data.sort()
         if all_data is not None and isinstance(all_data, list):
-            new_data = sorted(list(set(all_data) - set(old_data)))
+            new_data = find_missing_ids(ModelClass, all_data)
             count = len(new_data)
             counter = 0
+            batch = []
             log_writer("Need to pull {} records from Ona.".format(count))
-            for dataid in new_data:
+            for rec in fetch_submissions(formid, new_data):
                 counter += 1
                 log_writer(
-                    "Pulling {} {} of {}".format(dataid, counter, count)
+                    "Pulling {} {} of {}".format(
+                        rec.get("_id"), counter, count
+                    )
                 )
-                rec = fetch_form_data(formid, dataid=dataid)
-                if isinstance(rec, dict):
-                    try:
-                        sync_func(rec)
-                    except IntegrityError:
-                        log_writer("Already saved {}".format(dataid))
-                        continue
-                    except ValidationError as err:
-                        log_writer(
-                            "An error occurred while proccessing {}.".format(
-                                err
-                            )
-                        )
-                        continue
+                if batch_sync_func is None:
+                    _sync_records([rec], sync_func, log_writer)
                 else:
-                    log_writer("Unable to process {} {}".format(dataid, rec))
+                    batch.append(rec)
+                    if len(batch) >= batch_size:
+                        _sync_batch(batch)
+                        batch = []
                 if counter % 100 == 0:
                     gc.collect()
+            if batch:
+                _sync_batch(batch)
+            if counter < count:
+                log_writer(
+                    "Unable to pull {} of {} records.".format(
+                        count - counter, count
+                    )
+                )
     else:
         log_writer("DATA not fetched: {}".format(raw_data))
 
 
-def remove_household_geom_duplicates(spray_area=None):
+def find_household_duplicates(spray_area=None, match="geom"):
+    """
+    Returns a list of (household, duplicates) tuples of duplicate Household
+    objects found with a single spatial self-join.
+
+    match - "geom" or "bgeom" for households with the same geom or bgeom,
+            "overlap" for households whose geom is within the bgeom of
+            another household.
+
+    Households are ranked by their earliest submission (or by primary key
+    when there are no submissions). For "geom" and "bgeom" households linked
+    by a match form a cluster, the first household by rank is kept and the
+    rest are duplicates. For "overlap" matches are not chained, households
+    are kept in rank order and the households within the bgeom of a kept
+    household are its duplicates.
+    """
+    sql = HOUSEHOLD_DUPLICATES_SQL[match]
+    params = []
+    if spray_area is not None:
+        sql += ' WHERE "a"."location_id" = %s'
+        params.append(getattr(spray_area, "pk", spray_area))
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        pairs = cursor.fetchall()
+
+    if not pairs:
+        return []
+
+    households = Household.objects.in_bulk(
+        list(set(pk for pair in pairs for pk in pair))
+    )
+    ranks = {}
+    submissions = (
+        SprayDay.objects.filter(
+            osmid__in=[household.hh_id for household in households.values()]
+        )
+        .order_by("spray_date", "submission_id")
+        .values_list("osmid", flat=True)
+    )
+    for rank, osmid in enumerate(submissions):
+        ranks.setdefault(osmid, rank)
+
+    def _rank(household):
+        return (ranks.get(household.hh_id, len(ranks)), household.pk)
+
+    if match == "overlap":
+        within = {}
+        for first, second in pairs:
+            within.setdefault(first, set()).add(second)
+        result = []
+        assigned = set()
+        for household in sorted(households.values(), key=_rank):
+            if household.pk in assigned:
+                continue
+            assigned.add(household.pk)
+            duplicates = sorted(
+                (
+                    households[pk]
+                    for pk in within.get(household.pk, ())
+                    if pk not in assigned
+                ),
+                key=_rank,
+            )
+            assigned.update(duplicate.pk for duplicate in duplicates)
+            if duplicates:
+                result.append((household, duplicates))
+
+        return result
+
+    parents = {}
+
+    def _find(pk):
+        while parents.setdefault(pk, pk) != pk:
+            parents[pk] = parents[parents[pk]]
+            pk = parents[pk]
+        return pk
+
+    for first, second in pairs:
+        first, second = _find(first), _find(second)
+        if first != second:
+            parents[first] = second
+
+    clusters = {}
+    for pk in sorted(parents):
+        clusters.setdefault(_find(pk), []).append(households[pk])
+
+    result = []
+    for members in clusters.values():
+        members.sort(key=_rank)
+        result.append((members[0], members[1:]))
+
+    return result
+
+
+def remove_household_duplicates(
+    spray_area=None,
+    match="geom",
+    dry_run=False,
+    batch_size=HOUSEHOLD_DEDUP_BATCH_SIZE,
+):
+    """
+    Removes duplicate Household objects found by find_household_duplicates.
+
+    Submissions and other records linked to a duplicate, by osmid or foreign
+    key, are moved to the household that is kept in bulk before duplicates
+    are deleted batch_size at a time. Nothing is changed when dry_run is
+    True.
+
+    Returns a report dict with the clusters found as (kept, duplicates) OSM
+    ID tuples, the ids of the locations of the households, the number of
+    households deleted and submissions moved.
+    """
+    duplicates = find_household_duplicates(spray_area, match)
+    report = {
+        "clusters": [
+            (household.hh_id, [dup.hh_id for dup in dups])
+            for household, dups in duplicates
+        ],
+        "locations": set(),
+        "deleted": 0,
+        "submissions": 0,
+    }
+    pairs = [
+        (dup, household) for household, dups in duplicates for dup in dups
+    ]
+    for dup, household in pairs:
+        report["locations"].update([dup.location_id, household.location_id])
+    if not pairs:
+        return report
+
+    osmids = [dup.hh_id for dup, _ in pairs]
+    if dry_run:
+        report["submissions"] = SprayDay.objects.filter(
+            osmid__in=osmids
+        ).count()
+        return report
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            REPOINT_SPRAYDAY_OSMID_SQL,
+            [osmids, [household.hh_id for _, household in pairs]],
+        )
+        report["submissions"] = cursor.rowcount
+        ids = [[dup.pk for dup, _ in pairs], [hh.pk for _, hh in pairs]]
+        for related in Household._meta.related_objects:
+            cursor.execute(
+                REPOINT_HOUSEHOLD_SQL.format(
+                    table=related.related_model._meta.db_table,
+                    column=related.field.column,
+                ),
+                ids,
+            )
+        for i in range(0, len(pairs), batch_size):
+            batch = pairs[i:i + batch_size]
+            cursor.execute(
+                'DELETE FROM "main_household" WHERE "id" = ANY(%s);',
+                [[dup.pk for dup, _ in batch]],
+            )
+            report["deleted"] += cursor.rowcount
+
+    SprayAreaIndicators.refresh(report["locations"])
+    invalidate_location_tiles(report["locations"])
+
+    return report
+
+
+def print_household_duplicates_report(report):
+    """Prints a remove_household_duplicates report to screen."""
+    for kept, deleted in report["clusters"]:
+        print("Kept OSM ID: {}\n".format(kept))
+        print("Deleted OSM IDs:\n")
+        for osmid in deleted:
+            print("{}\n".format(osmid))
+
+
+def remove_household_geom_duplicates(spray_area=None, dry_run=False):
     """
     Get all the Household objects that have duplicate geom fields in a spray
     area, and removes duplicates
@@ -1210,26 +2092,11 @@ def remove_household_geom_duplicates(spray_area=None):
     will be run from the command line
     """
     if spray_area:
-        dups = (
-            Household.objects.filter(location=spray_area)
-            .values("geom")
-            .annotate(count=Count("id"))
-            .values("geom")
-            .order_by()
-            .filter(count__gt=1)
-        )
         print("Processing Spray Area: {}\n".format(spray_area.name))
-    else:
-        dups = (
-            Household.objects.values("geom")
-            .annotate(count=Count("id"))
-            .values("geom")
-            .order_by()
-            .filter(count__gt=1)
-        )
-    for dup in dups:
-        hh_objects = Household.objects.filter(geom=dup["geom"])
-        clean_household_duplicates_queryset(hh_objects)
+    report = remove_household_duplicates(spray_area, "geom", dry_run)
+    print_household_duplicates_report(report)
+
+    return report
 
 
 def clean_household_duplicates_queryset(hh_objects):
@@ -1258,7 +2125,7 @@ def clean_household_duplicates_queryset(hh_objects):
         print("{}\n".format(x))
 
 
-def remove_household_overlapping_duplicates(spray_area=None):
+def remove_household_overlapping_duplicates(spray_area=None, dry_run=False):
     """
     Gets Household objects that have overlaping bgeom fields
     (These respresent duplicate structres that cannot be fond using the
@@ -1267,12 +2134,10 @@ def remove_household_overlapping_duplicates(spray_area=None):
     to the screen - the expectation is that this function will be run from
     the command line
     """
-    all_households = Household.objects.all()
-    for hh in all_households:
-        if hh.bgeom is not None:
-            dups = all_households.filter(geom__within=hh.bgeom)
-            if dups is not None and dups.count() > 1:
-                clean_household_duplicates_queryset(dups)
+    report = remove_household_duplicates(spray_area, "overlap", dry_run)
+    print_household_duplicates_report(report)
+
+    return report
 
 
 def find_mismatched_spraydays(was_sprayed=True):
@@ -1314,31 +2179,7 @@ def find_missing_performance_report_records():
     """
     Checks if all submitted data is stored in the performance report table
     """
-    # find sprayform ids on SprayDay table
-    sprayday_sprayformids = (
-        SprayDay.objects.annotate(
-            sprayformid=RawSQL("data->'sprayformid'", ())
-        )
-        .values_list("sprayformid", flat=True)
-        .order_by("spray_date")
-        .distinct()
-    )
-
-    performace_sprayformids = (
-        PerformanceReport.objects.values_list("sprayformid", flat=True)
-        .order_by("sprayformid")
-        .distinct()
-    )
-
-    return list(
-        set(
-            [
-                x
-                for x in sprayday_sprayformids
-                if x not in performace_sprayformids
-            ]
-        )
-    )
+    return find_missing_sprayformids()
 
 
 def get_spraydays_with_mismatched_locations():
@@ -1352,49 +2193,113 @@ def link_new_structures_to_existing(target_area: object, distance: int = 10):
     """
     Match new structures to existing households.
 
+    The nearest household within distance of every new structure in the
+    target area is found in a single KNN query, the submissions, households
+    and spray points are then updated in bulk in one transaction.
+
     :param target_area:  the target location in question
     :param distance:  the distance, in metres used to match nearby structures
+    :return: the number of new structures linked to an existing household
     """
-    sprays = SprayDay.objects.filter(location=target_area, household=None)
-    for sp in sprays:
-        sp.household = (
-            Household.objects.annotate(
-                spray_distance=Distance("geom", sp.geom)
-            )
-            .filter(
-                location=sp.location,
-                geom__distance_lte=(sp.geom, D(m=distance)),
+    now = timezone.now()
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            LINK_NEW_STRUCTURES_SQL,
+            {
+                "distance": distance,
+                "location_id": target_area.pk,
+                "now": now,
+                # the field that identifies the spray data as belonging to
+                # a new structure is renamed so that it can be recovered
+                "node_key": f"{settings.MSPRAY_UNIQUE_FIELD}:node:id",
+                "original_key": (
+                    f"original_{settings.MSPRAY_UNIQUE_FIELD}:node:id"
+                ),
+                "way_key": f"{settings.MSPRAY_UNIQUE_FIELD}:way:id",
+            },
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            return 0
+
+        ids = [row[0] for row in rows]
+        update_sprayday_data_fields(SprayDay.objects.filter(pk__in=ids))
+        cursor.execute(LINK_MATCHED_HOUSEHOLDS_SQL, [now, ids])
+
+        # finally create new spraypoints
+        SprayPoint.objects.filter(sprayday_id__in=ids).delete()
+        cursor.execute(
+            REBUILD_LINKED_SPRAYPOINTS_SQL,
+            {
+                "ids": ids,
+                "was_sprayed": WAS_SPRAYED_FIELD,
+                "new_was_sprayed": NEW_WAS_SPRAYED_FIELD,
+                "sprayed": WAS_SPRAYED_VALUE,
+            },
+        )
+
+    # the bulk updates bypass the SprayDay and Household post_save signals
+    SprayAreaIndicators.refresh([target_area.pk])
+    mark_locations_for_rollup(
+        set([target_area.pk]).union(*(row[1:] for row in rows))
+    )
+
+    return len(rows)
+
+
+def link_new_structures(location, distance=10, is_async=False):
+    """
+    Match new structures to existing households in the location, or in every
+    spray area of the location when it is a RHC or district.
+
+    Spray areas are processed in parallel celery tasks when is_async is True.
+    """
+    from mspray.apps.main.tasks import link_new_structures_to_existing_task
+
+    if location.level == TA_LEVEL:
+        target_areas = [location]
+    else:
+        target_areas = location.get_descendants().filter(level=TA_LEVEL)
+
+    linked = 0
+    for target_area in target_areas:
+        if is_async:
+            link_new_structures_to_existing_task.delay(
+                target_area.pk, distance
             )
-            .order_by("spray_distance")
-            .first()
+        else:
+            linked += link_new_structures_to_existing(target_area, distance)
+
+    return linked
+
+
+def update_sprayday_data_fields(queryset):
+    """
+    Set the promoted SprayDay columns of the submissions in queryset from
+    their data in a single UPDATE. Returns the number of submissions updated.
+    """
+    return queryset.update(**get_data_field_expressions())
+
+
+def backfill_sprayday_data_fields(batch_size=SPRAYDAY_DATA_FIELDS_BATCH_SIZE):
+    """
+    Set the promoted SprayDay columns of every submission, batch_size
+    submissions at a time in primary key ranges so that each UPDATE is a
+    short transaction. Returns the number of submissions updated.
+    """
+    updated = 0
+    start = 0
+    while True:
+        pks = list(
+            SprayDay.objects.filter(pk__gt=start)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
         )
-        if sp.household:
-            # match the structure geo fields with the spray day
-            sp.geom = sp.household.geom
-            sp.bgeom = sp.household.bgeom
-
-            # match the structure osmid with the sprayday
-            sp.osmid = sp.household.hh_id
-
-            # add osmid to sprayday data
-            sp.data[f"{settings.MSPRAY_UNIQUE_FIELD}:way:id"] = sp.osmid
-
-            # remove the field that identifies this  spray data as belonging
-            # to a new structure
-            if sp.data.get(f"{settings.MSPRAY_UNIQUE_FIELD}:node:id"):
-                # we rename it so that we can be able to recover it
-                sp.data[
-                    f"original_{settings.MSPRAY_UNIQUE_FIELD}:node:id"
-                ] = sp.data[f"{settings.MSPRAY_UNIQUE_FIELD}:node:id"]
-                # then we delete it
-                del sp.data[f"{settings.MSPRAY_UNIQUE_FIELD}:node:id"]
-
-            sp.save()
-            sp.household.visited = True
-            if not sp.household.sprayable:
-                sp.household.sprayable = sp.sprayable
-            sp.household.save()
-
-            # finally create new spraypoints
-            sp.spraypoint_set.all().delete()
-            add_unique_record(sp.pk, sp.location_id)
+        if not pks:
+            break
+        updated += update_sprayday_data_fields(
+            SprayDay.objects.filter(pk__gte=pks[0], pk__lte=pks[-1])
+        )
+        start = pks[-1]
+
+    return updated
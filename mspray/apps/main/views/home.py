@@ -13,6 +13,7 @@ from mspray.apps.main.definitions import DEFINITIONS
 from mspray.apps.main.exports import detailed_spray_area_data
 from mspray.apps.main.mixins import SiteNameMixin
 from mspray.apps.main.models import Location, WeeklyReport
+from mspray.apps.main.models.location import BBOX_SELECT
 from mspray.apps.main.query import get_location_qs
 from mspray.apps.main.serializers import DistrictSerializer
 from mspray.apps.main.serializers.target_area import (
@@ -21,6 +22,7 @@ from mspray.apps.main.serializers.target_area import (
     TargetAreaSerializer,
     count_duplicates,
     get_duplicates,
+    prefetch_spray_area_indicators,
 )
 from mspray.apps.main.utils import get_location_dict, parse_spray_date
 from mspray.apps.main.views.sprayday import get_not_targeted_within_geom
@@ -75,12 +77,7 @@ class DistrictView(SiteNameMixin, ListView):
         not_targeted = None
 
         queryset = (context["object_list"].extra(
-            select={
-                "xmin": 'ST_xMin("main_location"."geom")',
-                "ymin": 'ST_yMin("main_location"."geom")',
-                "xmax": 'ST_xMax("main_location"."geom")',
-                "ymax": 'ST_yMax("main_location"."geom")',
-            }).values(
+            select=BBOX_SELECT).values(
                 "pk",
                 "code",
                 "level",
@@ -224,7 +221,8 @@ class TargetAreaView(SiteNameMixin, DetailView):
                                         self.object.level),
                         many=True,
                         context={
-                            "request": self.request
+                            "request": self.request,
+                            "simplify": "high",
                         },
                     ).data)
             else:
@@ -239,8 +237,9 @@ class TargetAreaView(SiteNameMixin, DetailView):
                     spray_date=spray_date,
                     format="geojson",
                 )
-                response.render()
-                context["hh_geojson"] = response.content.decode()
+                context["hh_geojson"] = b"".join(
+                    response.streaming_content
+                ).decode()
                 sprayed_duplicates = list(
                     get_duplicates(loc, True, spray_date))
                 not_sprayed_duplicates = list(
@@ -281,12 +280,7 @@ class SprayAreaView(SiteNameMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super(SprayAreaView, self).get_context_data(**kwargs)
         queryset = (context["object_list"].extra(
-            select={
-                "xmin": 'ST_xMin("main_location"."geom")',
-                "ymin": 'ST_yMin("main_location"."geom")',
-                "xmax": 'ST_xMax("main_location"."geom")',
-                "ymax": 'ST_yMax("main_location"."geom")',
-            }).values(
+            select=BBOX_SELECT).values(
                 "pk",
                 "code",
                 "level",
@@ -350,6 +344,9 @@ class SprayAreaView(SiteNameMixin, ListView):
                 ]
                 previous_rhc = None
                 not_captured = getattr(settings, "NOT_CAPTURED", {})
+                prefetch_spray_area_indicators(
+                    context.get("qs").values_list("pk", flat=True), context
+                )
                 for value in context.get("qs").iterator():
                     district = TargetAreaSerializer(
                         value, context=context).data
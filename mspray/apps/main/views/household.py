@@ -1,6 +1,11 @@
 from django.shortcuts import get_object_or_404
 
 from rest_framework import viewsets
+
+from mspray.apps.main.geojson import (
+    get_geojson_precision,
+    streaming_geojson_response,
+)
 from mspray.apps.main.models.household import Household
 from mspray.apps.main.models.target_area import TargetArea
 from mspray.apps.main.serializers.household import HouseholdSerializer
@@ -21,3 +26,12 @@ class HouseholdViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(geom__coveredby=target.geom)
 
         return queryset
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'geojson':
+            # features are built by PostGIS and streamed in chunks
+            return streaming_geojson_response(
+                self.filter_queryset(self.get_queryset()),
+                precision=get_geojson_precision(request))
+
+        return super(HouseholdViewSet, self).list(request, *args, **kwargs)
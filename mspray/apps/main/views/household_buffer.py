@@ -2,9 +2,41 @@ from django.shortcuts import get_object_or_404
 
 from rest_framework import viewsets
 
+from mspray.apps.main.geojson import (
+    get_geojson_precision,
+    streaming_geojson_response,
+)
 from mspray.apps.main.models.households_buffer import HouseholdsBuffer
 from mspray.apps.main.models.target_area import TargetArea
-from mspray.apps.main.serializers.household import HouseholdsBufferSerializer
+from mspray.apps.main.serializers.household import (
+    HouseholdsBufferSerializer,
+    ZERO_COLOR,
+    _1_COLOR,
+    _33_COLOR,
+    _66_COLOR,
+    _100_COLOR,
+)
+
+# spray points covered by a buffer and the percentage of households sprayed,
+# as computed by HouseholdsBufferSerializer
+SPRAY_POINTS_LATERAL_SQL = (
+    ' CROSS JOIN LATERAL (SELECT COUNT(*) AS "spray_points" '
+    'FROM "main_sprayday" WHERE ST_CoveredBy("main_sprayday"."geom", '
+    '"main_householdsbuffer"."geom") AND (%s::date IS NULL OR '
+    '"main_sprayday"."spray_date" = %s::date)) AS "sprayed"'
+    ' CROSS JOIN LATERAL (SELECT CASE WHEN '
+    '"main_householdsbuffer"."num_households" = 0 THEN 0 ELSE '
+    'round("sprayed"."spray_points" * 100.0 / '
+    '"main_householdsbuffer"."num_households", 2) END AS "percentage") '
+    'AS "sprayed_percentage"'
+)
+STYLE_SQL = (
+    "json_build_object('fillColor', CASE "
+    'WHEN "sprayed_percentage"."percentage" > 99 THEN %s '
+    'WHEN "sprayed_percentage"."percentage" > 66 THEN %s '
+    'WHEN "sprayed_percentage"."percentage" > 33 THEN %s '
+    'WHEN "sprayed_percentage"."percentage" > 0 THEN %s ELSE %s END)'
+)
 
 
 class HouseholdBufferViewSet(viewsets.ReadOnlyModelViewSet):
@@ -23,3 +55,25 @@ class HouseholdBufferViewSet(viewsets.ReadOnlyModelViewSet):
             queryset = queryset.filter(target_area=target_area)
 
         return queryset
+
+    def list(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'geojson':
+            spray_date = request.query_params.get('spray_date') or None
+            # features are built by PostGIS and streamed in chunks
+            return streaming_geojson_response(
+                self.filter_queryset(self.get_queryset()),
+                precision=get_geojson_precision(request),
+                properties=(
+                    ('spray_points', '"sprayed"."spray_points"', []),
+                    ('percentage_sprayed',
+                     '"sprayed_percentage"."percentage"', []),
+                ),
+                members=(
+                    ('style', STYLE_SQL, [
+                        _100_COLOR, _66_COLOR, _33_COLOR, _1_COLOR, ZERO_COLOR
+                    ]),
+                ),
+                lateral=(SPRAY_POINTS_LATERAL_SQL, [spray_date, spray_date]))
+
+        return super(HouseholdBufferViewSet, self).list(
+            request, *args, **kwargs)
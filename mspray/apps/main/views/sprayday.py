@@ -2,6 +2,8 @@
 """
 SprayDay viewset module - viewset for IRS HH submissions.
 """
+from datetime import datetime
+
 from django.conf import settings
 from django.contrib.gis.db.backends.postgis.adapter import PostGISAdapter
 from django.core.exceptions import ValidationError
@@ -20,7 +22,7 @@ from rest_framework.response import Response
 
 from mspray.apps.main.definitions import DEFINITIONS
 from mspray.apps.main.mixins import SiteNameMixin
-from mspray.apps.main.models import Location, SprayPoint
+from mspray.apps.main.models import Location, SprayPoint, SubmissionIntake
 from mspray.apps.main.models.spray_day import (
     DATA_ID_FIELD,
     DATE_FIELD,
@@ -32,6 +34,7 @@ from mspray.apps.main.serializers.sprayday import (
     SprayDayShapeSerializer,
 )
 from mspray.apps.main.serializers.target_area import dictfetchall
+from mspray.apps.main.tasks import queue_submission_intake
 from mspray.apps.main.utils import (
     add_spray_data,
     delete_cached_target_area_keys,
@@ -52,10 +55,10 @@ FROM
 (
   SELECT
   SUM(CASE WHEN ("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = true) THEN 0 ELSE 1 END) AS "other",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'osmstructure:way:id' AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 1 ELSE 0 END) AS "not_sprayable",
+  SUM(CASE WHEN ("main_sprayday"."has_osm_way" AND "main_sprayday"."sprayable" = false AND "main_spraypoint"."id" IS NOT NULL) THEN 0 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "found",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "sprayed",
-  SUM(CASE WHEN ("main_sprayday"."data" ? 'newstructure/gps' AND "main_sprayday"."sprayable" = true) THEN 1 WHEN ("main_sprayday"."data" ? 'osmstructure:node:id' AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."data" ? 'osmstructure:node:id' AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "new_structures",
+  SUM(CASE WHEN ("main_sprayday"."has_new_structure_gps" AND "main_sprayday"."sprayable" = true) THEN 1 WHEN ("main_sprayday"."has_osm_node" AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL) THEN 1 WHEN ("main_sprayday"."has_osm_node" AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NULL AND "main_sprayday"."was_sprayed" = true) THEN 1 ELSE 0 END) AS "new_structures",
   SUM(CASE WHEN ("main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "not_sprayed",
   SUM(CASE WHEN ("main_sprayday"."data" @> '{"osmstructure:notsprayed_reASon": "refused"}' AND "main_sprayday"."sprayable" = true AND "main_spraypoint"."id" IS NOT NULL AND "main_sprayday"."was_sprayed" = false) THEN 1 ELSE 0 END) AS "refused"
   FROM "main_sprayday"
@@ -173,6 +176,9 @@ class SprayDayViewSet(viewsets.ModelViewSet):
             if isinstance(request.data, QueryDict):
                 request_data = request.data.dict()
 
+            if getattr(settings, "MSPRAY_ASYNC_INTAKE", False):
+                return self._stage(request_data, has_id, spray_date)
+
             try:
                 sprayday = add_spray_data(request_data)
             except ValidationError as error:
@@ -194,6 +200,37 @@ class SprayDayViewSet(viewsets.ModelViewSet):
 
         return Response(data, status=status_code)
 
+    def _stage(self, request_data, submission_id, spray_date):
+        """
+        Store the submission for processing by a celery worker.
+        """
+        try:
+            datetime.strptime(spray_date, "%Y-%m-%d")
+            int(submission_id)
+        except (TypeError, ValueError):
+            return Response(
+                {
+                    "error": _(
+                        "Not a valid submission: _id - %s, date - %s"
+                        % (submission_id, spray_date)
+                    )
+                },
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        SubmissionIntake.stage(request_data)
+        queue_submission_intake()
+
+        return Response(
+            {
+                "success": _(
+                    "Queued submission with submission id %(submission_id)s."
+                    % {"submission_id": submission_id}
+                )
+            },
+            status=status.HTTP_202_ACCEPTED,
+        )
+
     def list(self, request, *args, **kwargs):
         if request.query_params.get("dates_only") == "true":
             # pylint: disable=attribute-defined-outside-init
@@ -3,6 +3,10 @@ from rest_framework import viewsets
 from rest_framework import mixins
 from rest_framework.response import Response
 
+from mspray.apps.main.geojson import (
+    get_geojson_precision,
+    streaming_geojson_response,
+)
 from mspray.apps.main.models import Location
 from mspray.apps.main.models import Household
 from mspray.apps.main.models import SprayDay
@@ -39,6 +43,7 @@ class TargetAreaHouseholdsViewSet(mixins.RetrieveModelMixin,
     def retrieve(self, request, **kwargs):
         data = []
         location = self.get_object()
+        households = Household.objects.none()
         if location.geom is not None:
             tas = list(get_ta_in_location(location))
             households = Household.objects.filter(location__in=tas)
@@ -57,7 +62,15 @@ class TargetAreaHouseholdsViewSet(mixins.RetrieveModelMixin,
                     .values_list('pk', flat=True)
                 households = households.exclude(pk__in=exclude)
 
-            serializer = self.get_serializer(households, many=True)
-            data = serializer.data
+            if request.accepted_renderer.format != 'geojson':
+                serializer = self.get_serializer(households, many=True)
+                data = serializer.data
+
+        if request.accepted_renderer.format == 'geojson':
+            # features are built by PostGIS and streamed in chunks
+            return streaming_geojson_response(
+                households,
+                geo_field='bgeom' if self.kwargs.get('bgeom') else 'geom',
+                precision=get_geojson_precision(request))
 
         return Response(data)
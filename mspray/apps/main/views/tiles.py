@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Vector tiles view.
+"""
+from django.http import Http404, HttpResponse
+from django.views.generic import View
+
+from mspray.apps.main.tiles import TILE_LAYERS, get_tile, is_valid_tile
+from mspray.apps.main.utils import parse_spray_date
+
+MVT_CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+class TileView(View):
+    """
+    Returns the Mapbox Vector Tile /tiles/{layer}/{z}/{x}/{y}.mvt of the
+    households, spraydays or buffers layer.
+    """
+
+    def get(self, request, layer, z, x, y):  # pylint: disable=C0103
+        """Returns the tile, 404 for an unknown layer or tile."""
+        if not is_valid_tile(layer, z, x, y):
+            raise Http404("Tile not found.")
+
+        filters = {}
+        spray_date = parse_spray_date(request)
+        if spray_date and "spray_date" in TILE_LAYERS[layer].get(
+            "filters", {}
+        ):
+            filters["spray_date"] = spray_date
+
+        return HttpResponse(
+            get_tile(layer, z, x, y, filters), content_type=MVT_CONTENT_TYPE
+        )
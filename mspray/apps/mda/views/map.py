@@ -84,8 +84,9 @@ class MapView(SiteNameMixin, DetailView):
                     spray_date=spray_date,
                     format="geojson",
                 )
-                response.render()
-                context["hh_geojson"] = response.content.decode()
+                context["hh_geojson"] = b"".join(
+                    response.streaming_content
+                ).decode()
                 sprayed_duplicates = list(
                     get_duplicates(loc, True, spray_date)
                 )
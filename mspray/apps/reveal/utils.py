@@ -9,7 +9,8 @@ from django.db.models.functions import Coalesce
 
 from dateutil import parser
 
-from mspray.apps.main.models import Household, Location, SprayDay, SprayPoint
+from mspray.apps.main.models import Household, SprayDay, SprayPoint
+from mspray.apps.main.spatial import resolve_target_area
 from mspray.apps.reveal.common_tags import NOT_PROVIDED, POLYGON
 from mspray.libs.utils.geom_buffer import with_metric_buffer
 
@@ -75,14 +76,9 @@ def add_spray_data(data: dict):
 
         # get the location object
         if geometry.geom_type == POLYGON:
-            location = Location.objects.filter(
-                geom__contains=geometry.centroid,
-                level=settings.MSPRAY_TA_LEVEL
-            ).first()
+            location = resolve_target_area(geometry.centroid)
         else:
-            location = Location.objects.filter(
-                geom__contains=geometry, level=settings.MSPRAY_TA_LEVEL
-            ).first()
+            location = resolve_target_area(geometry)
 
         sprayday, _ = SprayDay.objects.get_or_create(
             submission_id=submission_id, spray_date=spray_date
@@ -11,16 +11,15 @@ from django.db.models.functions import Cast
 from django.shortcuts import get_object_or_404, render
 from django.views.generic import DetailView
 
+from mspray.apps.main.geojson import iter_geojson
 from mspray.apps.main.mixins import SiteNameMixin
 from mspray.apps.main.models import Location, Household
 from mspray.apps.main.query import get_location_qs
-from mspray.apps.main.serializers.household import HouseholdBSerializer
 from mspray.apps.main.serializers.target_area import (
     GeoTargetAreaSerializer, TargetAreaQuerySerializer, TargetAreaSerializer,
     count_duplicates, get_duplicates)
 from mspray.apps.main.utils import get_location_dict, parse_spray_date
-from mspray.apps.main.views.target_area import (TargetAreaHouseholdsViewSet,
-                                                TargetAreaViewSet)
+from mspray.apps.main.views.target_area import TargetAreaViewSet
 from mspray.apps.trials.models import Sample
 from mspray.apps.trials.serializers import GeoSamplesSerializer
 
@@ -235,7 +234,6 @@ class SiteMapView(SiteNameMixin, DetailView):  # pylint: disable=R0901
             response.render()
             context['not_sprayable_value'] = NOT_SPRAYABLE_VALUE
             context['ta_geojson'] = response.content
-            bgeom = settings.HH_BUFFER and settings.OSM_SUBMISSIONS
 
             if self.object.level in ['district', 'RHC']:
                 data = GeoTargetAreaSerializer(
@@ -248,23 +246,9 @@ class SiteMapView(SiteNameMixin, DetailView):  # pylint: disable=R0901
                 context['hh_geojson'] = json.dumps(data)
             else:
                 loc = context['object']
-                hhview = TargetAreaHouseholdsViewSet.as_view({
-                    'get': 'retrieve'
-                })
-                response = hhview(
-                    self.request,
-                    pk=loc.pk,
-                    bgeom=bgeom,
-                    spray_date=spray_date,
-                    format='geojson')
-                response.render()
-                hh_data = HouseholdBSerializer(
+                context['hh_geojson'] = ''.join(iter_geojson(
                     Household.objects.filter(location=loc),
-                    many=True,
-                    context={
-                        'request': self.request
-                    }).data
-                context['hh_geojson'] = json.dumps(hh_data)
+                    geo_field='bgeom'))
                 sprayed_duplicates = list(
                     get_duplicates(loc, True, spray_date))
                 not_sprayed_duplicates = list(
@@ -0,0 +1,23 @@
+# Generated by Django 2.1.3 on 2026-10-18 11:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('main', '0064_sprayareaindicators'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DruidStreamEvent',
+            fields=[
+                ('sprayday', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='main.SprayDay')),
+                ('queued_on', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -1,3 +1,16 @@
-from django.db import models  # noqa
+from django.db import models
 
-# Create your models here.
+
+class DruidStreamEvent(models.Model):
+    """
+    A SprayDay record waiting to be streamed to Tranquility in a batch.
+    """
+    sprayday = models.OneToOneField('main.SprayDay', primary_key=True,
+                                    on_delete=models.CASCADE)
+    queued_on = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        app_label = 'warehouse'
+
+    def __str__(self):
+        return str(self.sprayday_id)
@@ -1,20 +1,33 @@
 import operator
+from collections import OrderedDict
+from functools import reduce
+from types import SimpleNamespace
+
 from dateutil import parser
 import pytz
 
 from django.conf import settings
+from django.db.models import Q
 from django.urls import reverse
 
 from rest_framework import serializers
 from rest_framework_gis.serializers import GeoFeatureModelSerializer
-from rest_framework_gis.fields import GeometryField
 
-from mspray.apps.main.models import SprayDay, Location, Household
+from mspray.apps.main.models import (
+    SprayDay, Location, Household, SprayOperator, SprayPoint, TeamLeader,
+    TeamLeaderAssistant)
 from mspray.apps.main.serializers.sprayday import SprayBase
+from mspray.apps.main.serializers.target_area import SimplifiedGeometryField
+from mspray.apps.main.utils import queryset_chunks
 from mspray.apps.warehouse.druid import get_druid_data, druid_simple_groupby
 from mspray.apps.warehouse.utils import flatten
 
 REASON_FIELD = settings.MSPRAY_UNSPRAYED_REASON_FIELD
+SPRAYDAY_DRUID_VALUES = ('id', 'submission_id', 'spray_date', 'osmid', 'data',
+                         'geom', 'bgeom', 'location_id', 'spray_operator_id',
+                         'team_leader_id', 'team_leader_assistant_id')
+DRUID_LOCATION_VALUES = ('id', 'code', 'name', 'structures')
+DRUID_ACTOR_VALUES = ('id', 'code', 'name')
 
 
 class LocationMixin(object):
@@ -292,6 +305,168 @@ class SprayDayDruidSerializer(SprayBase, LocationMixin,
                 id=obj.id, spraypoint__isnull=True).exists()
 
 
+class DruidLocationLookup(object):
+    """
+    Resolves the target area, RHC and district of SprayDay locations the same
+    way LocationMixin does, loading only the RHCs and districts in the family
+    of the locations that are looked up.
+    """
+
+    def __init__(self):
+        self.locations = {}
+
+    @staticmethod
+    def _get_family_area(areas, location, level):
+        """
+        Returns the first area of level in the family (ancestors, itself and
+        descendants) of location in tree order, like get_family().first().
+        """
+        for area in areas:
+            if area['level'] != level or \
+                    area['tree_id'] != location['tree_id']:
+                continue
+            if area['lft'] <= location['lft'] and \
+                    area['rght'] >= location['rght']:
+                return area
+            if area['lft'] >= location['lft'] and \
+                    area['rght'] <= location['rght']:
+                return area
+
+    def load(self, location_ids):
+        """
+        Loads the locations in location_ids that have not been resolved yet.
+        """
+        missing = set(location_ids).difference(self.locations, [None])
+        if not missing:
+            return
+
+        locations = list(Location.objects.filter(pk__in=missing).values(
+            'tree_id', 'lft', 'rght', *DRUID_LOCATION_VALUES))
+        if not locations:
+            return
+
+        family = reduce(operator.or_, (
+            Q(tree_id=location['tree_id'], lft__lte=location['lft'],
+              rght__gte=location['rght']) |
+            Q(tree_id=location['tree_id'], lft__gte=location['lft'],
+              rght__lte=location['rght'])
+            for location in locations))
+        areas = list(
+            Location.objects.filter(family, level__in=['RHC', 'district'])
+            .order_by('tree_id', 'lft').values(
+                'level', 'tree_id', 'lft', 'rght', *DRUID_LOCATION_VALUES))
+        for location in locations:
+            self.locations[location['id']] = {
+                'target_area': location,
+                'rhc': self._get_family_area(areas, location, 'RHC'),
+                'district': self._get_family_area(
+                    areas, location, 'district'),
+            }
+
+    def get(self, location_id):
+        return self.locations.get(location_id)
+
+
+def load_druid_actors(model, lookup, ids):
+    """
+    Adds the id, code and name of model objects in ids missing from lookup.
+    """
+    missing = set(ids).difference(lookup, [None])
+    if missing:
+        queryset = model.objects.filter(pk__in=missing).values(
+            *DRUID_ACTOR_VALUES)
+        lookup.update((actor['id'], actor) for actor in queryset)
+
+
+def get_sprayday_druid_rows(queryset, chunksize=1000, on_error=None):
+    """
+    Yields the SprayDayDruidSerializer data of each SprayDay in the queryset.
+
+    Records are read with a single values() query per chunk, locations, spray
+    operators, team leaders and team leader assistants are resolved from
+    lookup tables shared by all chunks instead of per-record queries.
+
+    When on_error is given a record that fails to serialize is skipped and
+    on_error(sprayday_id, error) is called instead of raising the error.
+    """
+    serializer = SprayDayDruidSerializer()
+    fields = serializer.fields
+    locations = DruidLocationLookup()
+    actors = {
+        'spray_operator': (SprayOperator, {}),
+        'team_leader': (TeamLeader, {}),
+        'team_leader_assistant': (TeamLeaderAssistant, {}),
+    }
+
+    queryset = queryset.values(*SPRAYDAY_DRUID_VALUES)
+    for chunk in queryset_chunks(queryset, chunksize):
+        locations.load(row['location_id'] for row in chunk)
+        for name, (model, lookup) in actors.items():
+            load_druid_actors(
+                model, lookup, (row[name + '_id'] for row in chunk))
+        sprayed_points = set(SprayPoint.objects.filter(
+            sprayday_id__in=[row['id'] for row in chunk]).values_list(
+                'sprayday_id', flat=True))
+
+        for row in chunk:
+            try:
+                data = _get_sprayday_druid_row(
+                    row, serializer, fields, locations, actors,
+                    sprayed_points)
+            except Exception as error:  # pylint: disable=broad-except
+                if on_error is None:
+                    raise
+                on_error(row['id'], error)
+            else:
+                yield data
+
+
+def _get_sprayday_druid_row(row, serializer, fields, locations, actors,
+                            sprayed_points):
+    # pylint: disable=too-many-arguments
+    record = SimpleNamespace(**row)
+    data = {
+        'sprayed': serializer.get_sprayed(record),
+        'reason': serializer.get_reason(record),
+        'geom_lat': serializer.get_geom_lat(record),
+        'geom_lng': serializer.get_geom_lng(record),
+        'submission_time': serializer.get_submission_time(record),
+        'is_new': serializer.get_is_new(record),
+        'sprayable': serializer.get_sprayable(record),
+        'is_duplicate': row['id'] not in sprayed_points,
+        'is_refused': serializer.get_is_refused(record),
+        'irs_sticker_num': serializer.get_irs_sticker_num(record),
+        'bgeom_type': serializer.get_bgeom_type(record),
+        'bgeom_coordinates': serializer.get_bgeom_coordinates(record),
+        'bgeom_srid': serializer.get_bgeom_srid(record),
+        'timestamp': serializer.get_timestamp(record),
+    }
+    for name in ('submission_id', 'spray_date', 'osmid'):
+        value = row[name]
+        data[name] = None if value is None else \
+            fields[name].to_representation(value)
+
+    family = locations.get(row['location_id']) or {}
+    target_area = family.get('target_area') or {}
+    data['location_id'] = target_area.get('id')
+    data['location_name'] = target_area.get('name')
+    for prefix in ('target_area', 'rhc', 'district'):
+        area = family.get(prefix) or {}
+        for value in DRUID_LOCATION_VALUES:
+            data[prefix + '_' + value] = area.get(value)
+
+    for prefix, name in (('sprayoperator', 'spray_operator'),
+                         ('team_leader', 'team_leader'),
+                         ('team_leader_assistant', 'team_leader_assistant')):
+        actor = actors[name][1].get(row[name + '_id']) or {}
+        for value in DRUID_ACTOR_VALUES:
+            data[prefix + '_' + value] = actor.get(value)
+
+    return OrderedDict(
+        (field, data[field])
+        for field in SprayDayDruidSerializer.Meta.fields)
+
+
 class SprayDayDruidBase(object):
     """
     Adds Druid data to Target Area Serializer
@@ -470,7 +645,7 @@ class TargetAreaSerializer(SprayDayDruidBase, GeoFeatureModelSerializer):
     bounds = serializers.SerializerMethodField()
     url = serializers.SerializerMethodField()
     spray_dates = serializers.SerializerMethodField()
-    geom = GeometryField()
+    geom = SimplifiedGeometryField()
 
     class Meta:
         fields = ['targetid', 'district_name', 'found', 'url',
@@ -499,7 +674,7 @@ class TargetAreaSerializer(SprayDayDruidBase, GeoFeatureModelSerializer):
 
     def get_bounds(self, obj):
         if obj and obj.geom:
-            return list(obj.geom.boundary.extent)
+            return obj.bounds
 
     def get_spray_dates(self, obj):
         druid_result = druid_simple_groupby(dimensions=['spray_date'],
@@ -577,7 +752,7 @@ class AreaSerializer(AreaDruidBase, GeoFeatureModelSerializer):
     bounds = serializers.SerializerMethodField()
     spray_dates = serializers.SerializerMethodField()
     url = serializers.SerializerMethodField()
-    geom = GeometryField()
+    geom = SimplifiedGeometryField()
 
     class Meta:
         fields = ['targetid', 'found', 'structures', 'visited_total', 'url',
@@ -602,7 +777,7 @@ class AreaSerializer(AreaDruidBase, GeoFeatureModelSerializer):
 
     def get_bounds(self, obj):
         if obj and obj.geom:
-            return list(obj.geom.boundary.extent)
+            return obj.bounds
 
     def get_spray_dates(self, obj):
         return None
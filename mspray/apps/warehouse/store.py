@@ -1,3 +1,4 @@
+import gzip
 import os
 import time
 from datetime import timedelta
@@ -11,12 +12,14 @@ from django.utils import timezone
 from rest_framework.renderers import JSONRenderer
 
 from mspray.apps.main.models import SprayDay
-from mspray.apps.warehouse.serializers import SprayDayDruidSerializer
+from mspray.apps.warehouse.serializers import get_sprayday_druid_rows
 from mspray.apps.warehouse.ingest import ingest_sprayday
 
 
 sprayday_dir_path = getattr(settings, 'SPRAYDAY_DRUID_DATA_DIRECTORY',
                             'sprayday/')
+DRUID_EXPORT_CHUNK_SIZE = getattr(settings, 'DRUID_EXPORT_CHUNK_SIZE', 1000)
+DRUID_EXPORT_GZIP = getattr(settings, 'DRUID_EXPORT_GZIP', False)
 
 
 def get_druid_intervals(queryset, use_timestamp=False):
@@ -73,7 +76,7 @@ def get_data(minutes=settings.DRUID_BATCH_PROCESS_TIME_INTERVAL):
     returns filename
     """
     queryset = get_sprayday_queryset_from_x_minutes(minutes)
-    if queryset:
+    if queryset.exists():
         # get intervals
         first = queryset.first().data['_submission_time']
         last = queryset.last().data['_submission_time']
@@ -108,7 +111,7 @@ def get_historical_data(day=None, month=None, year=None):
         if year:
             queryset = queryset.filter(spray_date__year=year)
 
-        if queryset:
+        if queryset.exists():
             intervals = get_druid_intervals(queryset)
             path = create_sprayday_druid_json_file(queryset=queryset,
                                                    filename=filename)
@@ -116,33 +119,48 @@ def get_historical_data(day=None, month=None, year=None):
             return ingest_sprayday(url, intervals=intervals)
 
 
+def iter_sprayday_druid_lines(queryset, chunksize=DRUID_EXPORT_CHUNK_SIZE):
+    """
+    Yields a druid-ready JSON line for each SprayDay in the queryset, records
+    are read chunksize at a time.
+    """
+    renderer = JSONRenderer()
+    for row in get_sprayday_druid_rows(queryset, chunksize):
+        yield renderer.render(row)
+
+
 def create_sprayday_druid_json_file(queryset=None, filename=None,
-                                    path=sprayday_dir_path):
+                                    path=sprayday_dir_path,
+                                    compress=DRUID_EXPORT_GZIP):
     """
     Takes a queryset and creates a json file containing druid-ready data
     returns the filename
-    """
-    from mspray.apps.main.utils import queryset_iterator  # noqa
 
-    if not queryset:
-        queryset = SprayDay.objects.all().order_by('spray_date')
+    Lines are written to storage as they are serialized so memory use does
+    not grow with the size of the queryset. The file is gzip compressed and
+    given a .gz extension when compress is True.
+    """
+    if queryset is None:
+        queryset = SprayDay.objects.all()
 
     if filename is None:
         epoch = int(time.time())
         filename = "{path}sprayday_{epoch}.json".format(path=path, epoch=epoch)
 
+    if compress and not filename.endswith('.gz'):
+        filename = filename + '.gz'
+
     if isinstance(default_storage, FileSystemStorage):
         filename = os.path.join(default_storage.base_location, filename)
         os.makedirs(os.path.dirname(filename), exist_ok=True)
 
-    lines = []
-    for record in queryset_iterator(queryset, 1000):
-        data = SprayDayDruidSerializer(record).data
-        line = JSONRenderer().render(data)
-        lines.append(line)
+    with default_storage.open(filename, "wb") as file:
+        stream = gzip.GzipFile(fileobj=file, mode="wb") if compress else file
+        for index, line in enumerate(iter_sprayday_druid_lines(queryset)):
+            if index:
+                stream.write(b'\n')
+            stream.write(line)
+        if compress:
+            stream.close()
 
-    content = b'\n'.join(lines)
-    file = default_storage.open(filename, "wb")
-    file.write(content)
-    file.close()
     return filename
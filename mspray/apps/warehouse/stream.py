@@ -1,9 +1,28 @@
+import logging
+from json.decoder import JSONDecodeError
+
+import requests
+
 from rest_framework.renderers import JSONRenderer
 
 from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from mspray.apps.main.models import SprayDay
+from mspray.apps.warehouse.models import DruidStreamEvent
+from mspray.apps.warehouse.serializers import get_sprayday_druid_rows
+from mspray.apps.warehouse.utils import requests_retry_session, send_request
 
-from mspray.apps.warehouse.serializers import SprayDayDruidSerializer
-from mspray.apps.warehouse.utils import send_request
+logger = logging.getLogger(__name__)
+
+DRUID_STREAM_BATCH_SIZE = getattr(settings, 'DRUID_STREAM_BATCH_SIZE', 500)
+DRUID_STREAM_TIMEOUT = getattr(settings, 'DRUID_STREAM_TIMEOUT', 30)
+QUEUE_DRUID_STREAM_EVENTS_SQL = """
+INSERT INTO "warehouse_druidstreamevent" ("sprayday_id", "queued_on")
+SELECT "id", %s FROM "main_sprayday" WHERE "id" = ANY(%s)
+ON CONFLICT ("sprayday_id") DO NOTHING;
+"""  # noqa
 
 
 def get_mspray_stream_url():
@@ -13,6 +32,107 @@ def get_mspray_stream_url():
 
 
 def send_to_tranquility(sprayday_obj):
-    data = SprayDayDruidSerializer(sprayday_obj).data
+    data = next(get_sprayday_druid_rows(
+        SprayDay.objects.filter(pk=sprayday_obj.pk)))
     json_data = JSONRenderer().render(data)
     return send_request(json_data, get_mspray_stream_url())
+
+
+def get_stream_session():
+    """
+    Returns a retrying session for posting batches to Tranquility.
+    """
+    session = requests_retry_session()
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+
+def send_batch_to_tranquility(rows, session=None, url=None):
+    """
+    Posts a list of druid events to Tranquility in a single request.
+
+    Returns a (sent, failed) tuple, events Tranquility received but did not
+    send on to Druid, e.g. outside the window period, are counted as failed.
+    """
+    session = session or get_stream_session()
+    url = url or get_mspray_stream_url()
+    response = session.post(url, data=JSONRenderer().render(rows),
+                            timeout=DRUID_STREAM_TIMEOUT)
+    response.raise_for_status()
+    try:
+        sent = response.json()['result']['sent']
+    except (JSONDecodeError, KeyError, TypeError):
+        sent = len(rows)
+
+    return sent, len(rows) - sent
+
+
+def queue_druid_stream_events(sprayday_ids):
+    """
+    Adds SprayDay records to the queue of events to stream to Tranquility,
+    records already in the queue are only sent once. Returns the number of
+    records queued.
+    """
+    sprayday_ids = list(set(pk for pk in sprayday_ids if pk is not None))
+    if not sprayday_ids:
+        return 0
+
+    with connection.cursor() as cursor:
+        cursor.execute(QUEUE_DRUID_STREAM_EVENTS_SQL,
+                       [timezone.now(), sprayday_ids])
+        return cursor.rowcount
+
+
+def flush_druid_stream_events(batch_size=DRUID_STREAM_BATCH_SIZE):
+    """
+    Streams queued SprayDay records to Tranquility batch_size at a time.
+
+    A batch is claimed by removing it from the queue in a short transaction
+    and is posted outside of it, a failed post stops the flush and puts the
+    batch back in the queue for the next flush. Records that fail to
+    serialize are logged and dropped from the queue. Returns a list of
+    {'sent': x, 'failed': y} counts, one for each batch.
+    """
+    session = get_stream_session()
+    url = get_mspray_stream_url()
+    results = []
+
+    while True:
+        with transaction.atomic():
+            batch = list(
+                DruidStreamEvent.objects.select_for_update(skip_locked=True)
+                .order_by('queued_on', 'sprayday_id')
+                .values_list('sprayday_id', flat=True)[:batch_size])
+            DruidStreamEvent.objects.filter(sprayday_id__in=batch).delete()
+        if not batch:
+            break
+
+        dropped = []
+
+        def _log_error(sprayday_id, error):
+            logger.error('Druid stream event %s dropped: %s', sprayday_id,
+                         error)
+            dropped.append(sprayday_id)
+
+        rows = list(get_sprayday_druid_rows(
+            SprayDay.objects.filter(pk__in=batch), batch_size,
+            on_error=_log_error))
+        sent = failed = 0
+        if rows:
+            try:
+                sent, failed = send_batch_to_tranquility(rows, session, url)
+            except requests.exceptions.RequestException as error:
+                logger.error('Druid stream batch of %s events failed: %s',
+                             len(rows), error)
+                queue_druid_stream_events(set(batch).difference(dropped))
+                results.append({'sent': 0, 'failed': len(rows)})
+                break
+
+        failed += len(batch) - len(rows)
+        logger.info('Druid stream batch: %s sent, %s failed', sent, failed)
+        results.append({'sent': sent, 'failed': failed})
+
+        if len(batch) < batch_size:
+            break
+
+    return results
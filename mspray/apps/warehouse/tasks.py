@@ -1,19 +1,71 @@
 from datetime import timedelta
 
+from django.core.cache import cache
 from django.utils import timezone
 from django.conf import settings
 
 from mspray.celery import app
 from mspray.apps.main.models import SprayDay
-from mspray.apps.warehouse.stream import send_to_tranquility
+from mspray.apps.warehouse.models import DruidStreamEvent
+from mspray.apps.warehouse.stream import (
+    DRUID_STREAM_BATCH_SIZE, flush_druid_stream_events,
+    queue_druid_stream_events, send_to_tranquility)
 from mspray.apps.warehouse.store import get_data, get_historical_data
 
+DRUID_STREAM_BATCHING = getattr(settings, 'DRUID_STREAM_BATCHING', False)
+DRUID_STREAM_FLUSH_INTERVAL = getattr(
+    settings, 'DRUID_STREAM_FLUSH_INTERVAL', 30)  # seconds
+DRUID_STREAM_RETRY_DELAY = getattr(
+    settings, 'DRUID_STREAM_RETRY_DELAY', 300)  # seconds
+DRUID_STREAM_FLUSH_KEY = 'druid-stream-flush-scheduled'
+DRUID_STREAM_FLUSH_NOW_KEY = 'druid-stream-flush-now'
+
+
+def queue_stream_to_druid(spray_day_obj_ids):
+    """
+    Queues SprayDay objects for streaming to tranquility in batches.
+
+    A flush is scheduled DRUID_STREAM_FLUSH_INTERVAL seconds after the first
+    queued record, it is run straight away once DRUID_STREAM_BATCH_SIZE
+    records are waiting.
+    """
+    if not queue_druid_stream_events(spray_day_obj_ids):
+        return
+
+    if DruidStreamEvent.objects.count() >= DRUID_STREAM_BATCH_SIZE:
+        if cache.add(DRUID_STREAM_FLUSH_NOW_KEY, True,
+                     DRUID_STREAM_FLUSH_INTERVAL):
+            flush_druid_stream.delay()
+    elif cache.add(DRUID_STREAM_FLUSH_KEY, True, DRUID_STREAM_FLUSH_INTERVAL):
+        flush_druid_stream.apply_async(countdown=DRUID_STREAM_FLUSH_INTERVAL)
+
+
+@app.task
+def flush_druid_stream():
+    """
+    Sends queued SprayDay objects to tranquility in batches, returns the sent
+    and failed counts of each batch. Records left in the queue, e.g. after a
+    failed post, are sent DRUID_STREAM_RETRY_DELAY seconds later.
+    """
+    cache.delete_many([DRUID_STREAM_FLUSH_KEY, DRUID_STREAM_FLUSH_NOW_KEY])
+    results = flush_druid_stream_events()
+    # retry a failed post without waiting for the next queued record
+    if DruidStreamEvent.objects.exists() and cache.add(
+            DRUID_STREAM_FLUSH_KEY, True, DRUID_STREAM_RETRY_DELAY):
+        flush_druid_stream.apply_async(countdown=DRUID_STREAM_RETRY_DELAY)
+
+    return results
+
 
 @app.task
 def stream_to_druid(spray_day_obj_id):
     """
-    Sends a SprayDay object to tranquility for ingestion into Druid
+    Sends a SprayDay object to tranquility for ingestion into Druid, the
+    object is queued for a batched flush when DRUID_STREAM_BATCHING is set.
     """
+    if DRUID_STREAM_BATCHING:
+        queue_stream_to_druid([spray_day_obj_id])
+        return
 
     try:
         spray_day_obj = SprayDay.objects.get(pk=spray_day_obj_id)
@@ -6,6 +6,7 @@ from dateutil import parser
 from mspray.apps.main.tests.test_base import TestBase
 from mspray.apps.main.models import SprayDay
 from mspray.apps.warehouse.serializers import SprayDayDruidSerializer
+from mspray.apps.warehouse.serializers import get_sprayday_druid_rows
 
 REASON_FIELD = settings.MSPRAY_UNSPRAYED_REASON_FIELD
 WAS_SPRAYED_FIELD = settings.MSPRAY_WAS_SPRAYED_FIELD
@@ -142,3 +143,17 @@ class TestSerializers(TestBase):
         self.assertEqual(serialized['bgeom_type'], "Polygon")
         self.assertEqual(serialized['bgeom_srid'], sprayday.bgeom.srid)
         self.assertEqual(serialized['bgeom_coordinates'], sprayday.bgeom.tuple)
+
+    def test_get_sprayday_druid_rows(self):
+        """
+        Ensure that get_sprayday_druid_rows returns exactly the same data as
+        SprayDayDruidSerializer for every record
+        """
+        queryset = SprayDay.objects.order_by('pk')
+        rows = list(get_sprayday_druid_rows(queryset, chunksize=3))
+
+        self.assertEqual(len(rows), queryset.count())
+        for sprayday, row in zip(queryset, rows):
+            expected = SprayDayDruidSerializer(sprayday).data
+            self.assertEqual(list(row.keys()), list(expected.keys()))
+            self.assertEqual(dict(row), dict(expected))
@@ -1,3 +1,4 @@
+import gzip
 import os
 
 from unittest.mock import patch
@@ -234,3 +235,26 @@ class TestStore(TestBase):
             with open(result, "r") as f:
                 content = f.read()
             self.assertEqual(content.encode(), expected_content)
+
+    def test_create_sprayday_druid_json_file_gzip(self):
+        """
+        Test that create_sprayday_druid_json_file writes a gzip compressed
+        newline-delimited JSON file when compress is True
+        """
+        queryset = SprayDay.objects.all()
+        expected_content = b"\n".join(
+            JSONRenderer().render(SprayDayDruidSerializer(record).data)
+            for record in queryset.order_by("pk")
+        )
+
+        default_file_storage = "django.core.files.storage.FileSystemStorage"
+        with self.settings(
+            DEFAULT_FILE_STORAGE=default_file_storage, MEDIA_ROOT="/tmp/"
+        ):
+            result = create_sprayday_druid_json_file(
+                queryset=queryset, filename="somefile.json", compress=True
+            )
+            self.assertEqual(result, "/tmp/somefile.json.gz")
+            with gzip.open(result, "rb") as f:
+                content = f.read()
+            self.assertEqual(content, expected_content)
@@ -1,11 +1,16 @@
-from unittest.mock import patch
+import json
+from unittest.mock import MagicMock, patch
 
+import requests
 from rest_framework.renderers import JSONRenderer
 
 from mspray.apps.main.tests.test_base import TestBase
 from mspray.apps.main.models import SprayDay
+from mspray.apps.warehouse.models import DruidStreamEvent
 from mspray.apps.warehouse.stream import send_to_tranquility
 from mspray.apps.warehouse.stream import get_mspray_stream_url
+from mspray.apps.warehouse.stream import flush_druid_stream_events
+from mspray.apps.warehouse.stream import queue_druid_stream_events
 from mspray.apps.warehouse.serializers import SprayDayDruidSerializer
 
 
@@ -36,3 +41,82 @@ class TestStream(TestBase):
                            DRUID_SPRAYDAY_TRANQUILITY_PATH='/v1/post/mspray'):
             self.assertEqual(get_mspray_stream_url(),
                              'http://127.0.0.1:8200/v1/post/mspray')
+
+    @patch('mspray.apps.warehouse.stream.get_stream_session')
+    def test_flush_druid_stream_events(self, mock):
+        """
+        Test that queued events are posted to tranquility in batches and
+        removed from the queue
+        """
+        session = MagicMock()
+        session.post.return_value.json.side_effect = [
+            {'result': {'received': 2, 'sent': 2}},
+            {'result': {'received': 1, 'sent': 0}},
+        ]
+        mock.return_value = session
+        spraydays = list(SprayDay.objects.order_by('pk')[:3])
+        ids = [sprayday.pk for sprayday in spraydays]
+
+        self.assertEqual(queue_druid_stream_events(ids), 3)
+        # an already queued record is not queued twice
+        self.assertEqual(queue_druid_stream_events(ids[:1]), 0)
+
+        results = flush_druid_stream_events(batch_size=2)
+        self.assertEqual(results, [{'sent': 2, 'failed': 0},
+                                   {'sent': 0, 'failed': 1}])
+        self.assertEqual(session.post.call_count, 2)
+        args, kwargs = session.post.call_args_list[0]
+        self.assertEqual(args[0], get_mspray_stream_url())
+        self.assertEqual(
+            json.loads(kwargs['data'].decode('utf-8')),
+            json.loads(JSONRenderer().render(
+                [SprayDayDruidSerializer(sprayday).data
+                 for sprayday in spraydays[:2]]).decode('utf-8')))
+        self.assertFalse(DruidStreamEvent.objects.exists())
+
+    @patch('mspray.apps.warehouse.stream.get_stream_session')
+    def test_flush_druid_stream_events_failure(self, mock):
+        """
+        Test that a failed batch is put back in the queue
+        """
+        session = MagicMock()
+        session.post.side_effect = requests.exceptions.ConnectionError
+        mock.return_value = session
+        sprayday = SprayDay.objects.first()
+        queue_druid_stream_events([sprayday.pk])
+
+        results = flush_druid_stream_events()
+        self.assertEqual(results, [{'sent': 0, 'failed': 1}])
+        self.assertTrue(
+            DruidStreamEvent.objects.filter(sprayday=sprayday).exists())
+
+    @patch('mspray.apps.warehouse.stream.get_stream_session')
+    def test_flush_druid_stream_events_bad_record(self, mock):
+        """
+        Test that a record that fails to serialize is dropped without holding
+        back the rest of the batch
+        """
+        session = MagicMock()
+        session.post.return_value.json.return_value = {
+            'result': {'received': 1, 'sent': 1}}
+        mock.return_value = session
+        spraydays = list(SprayDay.objects.order_by('pk')[:2])
+        queue_druid_stream_events([sprayday.pk for sprayday in spraydays])
+        get_timestamp = SprayDayDruidSerializer.get_timestamp
+
+        def _get_timestamp(serializer, obj):
+            if obj.id == spraydays[0].pk:
+                raise ValueError('no end time')
+            return get_timestamp(serializer, obj)
+
+        with patch.object(SprayDayDruidSerializer, 'get_timestamp',
+                          _get_timestamp):
+            results = flush_druid_stream_events()
+
+        self.assertEqual(results, [{'sent': 1, 'failed': 1}])
+        args, kwargs = session.post.call_args
+        self.assertEqual(
+            [row['submission_id'] for row in
+             json.loads(kwargs['data'].decode('utf-8'))],
+            [spraydays[1].submission_id])
+        self.assertFalse(DruidStreamEvent.objects.exists())
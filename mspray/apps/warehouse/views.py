@@ -164,12 +164,15 @@ class RHCMap(SiteNameMixin, DetailView):
         data, totals = process_druid_data(druid_result)
         rhc_druid_data = process_location_data(self.object.__dict__, data)
 
-        rhc_data = AreaSerializer(self.object, druid_data=rhc_druid_data).data
+        serializer_context = {'request': self.request, 'simplify': 'high'}
+        rhc_data = AreaSerializer(self.object, druid_data=rhc_druid_data,
+                                  context=serializer_context).data
 
         ta_data = TargetAreaSerializer(
             self.object.get_children().filter(level='ta'),
             druid_data=data,
-            many=True).data
+            many=True,
+            context=serializer_context).data
 
         context['rhc_data'] = JSONRenderer().render(rhc_data)
         context['hh_geojson'] = JSONRenderer().render(ta_data)
@@ -195,8 +198,10 @@ class DistrictMap(SiteNameMixin, DetailView):
 
         district_druid_data = process_location_data(self.object.__dict__, data)
 
+        serializer_context = {'request': self.request, 'simplify': 'high'}
         district_data = AreaSerializer(self.object,
-                                       druid_data=district_druid_data).data
+                                       druid_data=district_druid_data,
+                                       context=serializer_context).data
 
         rhc_druid_data_list = []
         rhc_list = Location.objects.filter(level='RHC', parent=self.object)
@@ -208,7 +213,8 @@ class DistrictMap(SiteNameMixin, DetailView):
 
         rhc_geojson_data = AreaSerializer(rhc_list,
                                           druid_data=rhc_druid_data_list,
-                                          many=True).data
+                                          many=True,
+                                          context=serializer_context).data
         context['district_data'] = JSONRenderer().render(district_data)
         context['hh_geojson'] = JSONRenderer().render(rhc_geojson_data)
         return context
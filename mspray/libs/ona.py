@@ -3,16 +3,66 @@
 Ona API access util functions
 """
 import json
+import logging
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from urllib.parse import urljoin
 
 from django.conf import settings
 
 import requests
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPDigestAuth
+from urllib3.util.retry import Retry
 
 ATTACHMENTS_KEY = "_attachments"
 ONA_URI = getattr(settings, "ONA_URI", "https://api.ona.io")
 ONA_TOKEN = getattr(settings, "ONA_API_TOKEN", "")
+ONA_PAGE_SIZE = getattr(settings, "ONA_PAGE_SIZE", 1000)
+ONA_FETCH_CHUNK_SIZE = getattr(settings, "ONA_FETCH_CHUNK_SIZE", 200)
+ONA_FETCH_WORKERS = getattr(settings, "ONA_FETCH_WORKERS", 4)
+ONA_TIMEOUT = getattr(settings, "ONA_TIMEOUT", 60)
+
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def get_session():
+    """Return a keep-alive requests session shared by Ona API calls.
+
+    The connection pool is sized for ONA_FETCH_WORKERS concurrent requests,
+    failed connections and 5xx responses are retried.
+    """
+    global _SESSION  # pylint: disable=global-statement
+
+    with _SESSION_LOCK:
+        if _SESSION is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=ONA_FETCH_WORKERS,
+                pool_maxsize=ONA_FETCH_WORKERS,
+                max_retries=Retry(
+                    total=3,
+                    backoff_factor=0.3,
+                    status_forcelist=(500, 502, 503, 504),
+                ),
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _SESSION = session
+
+    return _SESSION
+
+
+def _get(url, **kwargs):
+    kwargs.setdefault("timeout", ONA_TIMEOUT)
+    kwargs.setdefault(
+        "headers", {"Authorization": "Token {}".format(ONA_TOKEN)}
+    )
+
+    return get_session().get(url, **kwargs)
 
 
 def fetch_osm_xml_data(data, xform_id=None):
@@ -24,8 +74,7 @@ def fetch_osm_xml_data(data, xform_id=None):
         _xform_id = data.get("_xform_id", 141279)
 
     url = urljoin(ONA_URI, "/api/v1/data/%s/%s.osm" % (_xform_id, data_id))
-    headers = {"Authorization": "Token {}".format(ONA_TOKEN)}
-    response = requests.get(url, headers=headers)
+    response = _get(url)
     if response.status_code == 200:
         return response.content
 
@@ -57,7 +106,7 @@ def fetch_osm_xml(data, osm_filename=None):
             )
             if is_osm_file:
                 url = urljoin(ONA_URI, attachment.get("download_url"))
-                response = requests.get(url)
+                response = _get(url, headers=None)
                 if response.status_code == 200:
                     xml = response.content
                     break
@@ -106,19 +155,156 @@ def fetch_form_data(  # pylint: disable=too-many-arguments
         )
     else:
         url = urljoin(ONA_URI, "/api/v1/data/{}.json".format(formid))
-    headers = {"Authorization": "Token {}".format(ONA_TOKEN)}
-    response = requests.get(url, headers=headers, params=query_params)
+    response = _get(url, params=query_params)
 
     return response.json() if response.status_code == 200 else None
 
 
+def iter_form_data(  # pylint: disable=too-many-arguments
+    formid,  # pylint: disable=bad-continuation
+    query=None,  # pylint: disable=bad-continuation
+    fields=None,  # pylint: disable=bad-continuation
+    page_size=ONA_PAGE_SIZE,  # pylint: disable=bad-continuation
+    strict=False,  # pylint: disable=bad-continuation
+):
+    """Yield submissions of a form, fetching page_size records at a time.
+
+    Keyword arguments:
+    query -- apply a specific query when fetching records.
+    fields -- fetch only the listed fields.
+    page_size -- number of records per request.
+    strict -- raise requests.HTTPError when a page fails instead of stopping.
+    """
+    url = urljoin(ONA_URI, "/api/v1/data/{}.json".format(formid))
+    params = {"page_size": page_size, "sort": '{"_id":1}'}
+    if query:
+        params["query"] = json.dumps(query)
+    if fields:
+        params["fields"] = json.dumps(fields)
+
+    page = 1
+    while True:
+        params["page"] = page
+        response = _get(url, params=params)
+        # pages past the last page are a 404 on Ona
+        if strict and not (page > 1 and response.status_code == 404):
+            response.raise_for_status()
+        records = response.json() if response.status_code == 200 else None
+        if not records:
+            break
+        for record in records:
+            yield record
+        if len(records) < page_size:
+            break
+        page += 1
+
+
+def iter_form_changes(
+    formid,  # pylint: disable=bad-continuation
+    last_edited=None,  # pylint: disable=bad-continuation
+    last_id=None,  # pylint: disable=bad-continuation
+    page_size=ONA_PAGE_SIZE,  # pylint: disable=bad-continuation
+):
+    """Yield the edited and the new submissions of a form.
+
+    Only submissions last edited at or after last_edited are requested when
+    it is given. When last_id is given the submissions with an _id greater
+    than last_id are yielded as well, a submission may then be yielded twice.
+    A failed page raises requests.HTTPError so that callers do not record a
+    partial sync as complete.
+    """
+    query = {"_edited": "true"}
+    if last_edited:
+        query["_last_edited"] = {"$gte": last_edited}
+
+    yield from iter_form_data(
+        formid, query=query, page_size=page_size, strict=True
+    )
+    if last_id is not None:
+        yield from iter_form_data(
+            formid,
+            query={"_id": {"$gt": last_id}},
+            page_size=page_size,
+            strict=True,
+        )
+
+
+def _fetch_chunk(formid, dataids):
+    """Returns the submissions of a form with the given dataids.
+
+    A chunk that fails is logged with its id range and skipped.
+    """
+    url = urljoin(ONA_URI, "/api/v1/data/{}.json".format(formid))
+    params = {"query": json.dumps({"_id": {"$in": dataids}})}
+    try:
+        response = _get(url, params=params)
+    except requests.exceptions.RequestException as error:
+        logger.error(
+            "Fetching submissions %s to %s of form %s failed: %s",
+            dataids[0],
+            dataids[-1],
+            formid,
+            error,
+        )
+        return []
+    if response.status_code != 200:
+        logger.error(
+            "Fetching submissions %s to %s of form %s failed with status %s",
+            dataids[0],
+            dataids[-1],
+            formid,
+            response.status_code,
+        )
+        return []
+
+    return response.json() or []
+
+
+def fetch_submissions(
+    formid,
+    dataids,
+    chunk_size=ONA_FETCH_CHUNK_SIZE,
+    workers=ONA_FETCH_WORKERS,
+):
+    """Yield the submissions of a form with the given dataids.
+
+    Submissions are requested chunk_size ids at a time with an
+    {"_id": {"$in": [...]}} query. With more than one worker the chunks are
+    fetched concurrently on a thread pool of at most workers threads and
+    yielded as they arrive, so callers should not rely on ordering. At most
+    workers * 2 chunks are requested ahead of the records yielded so that
+    memory does not grow with the number of dataids.
+    """
+    dataids = sorted(dataids)
+    chunks = (
+        dataids[i:i + chunk_size] for i in range(0, len(dataids), chunk_size)
+    )
+    if workers <= 1 or len(dataids) <= chunk_size:
+        for chunk in chunks:
+            yield from _fetch_chunk(formid, chunk)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(_fetch_chunk, formid, chunk))
+            if len(pending) < workers * 2:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
 def fetch_form(formid):
     """
     Fetch Ona Form.
     """
-    headers = {"Authorization": "Token {}".format(ONA_TOKEN)}
     url = urljoin(ONA_URI, "/api/v1/forms/{}.json".format(formid))
-    response = requests.get(url, headers=headers)
+    response = _get(url)
 
     return response.json() if response.status_code == 200 else None
 
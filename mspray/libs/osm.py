@@ -18,73 +18,82 @@ def _get_xml_obj(xml):
             return _get_xml_obj(xml)
 
 
-def _get_node(ref, root):
-    point = None
-    nodes = root.xpath('//node[@id="{}"]'.format(ref))
-    if nodes:
-        node = nodes[0]
-        x, y = float(node.get("lon")), float(node.get("lat"))
-        point = Point(x, y)
+def _get_node_coords(node):
+    return float(node.get("lon")), float(node.get("lat"))
 
-    return point
 
+def get_node_index(root):
+    """Returns a node id to (lon, lat) index of all nodes in the XML root.
 
-def parse_osm_ways(osm_xml, include_osm_id=False):
-    """Converts an OSM XMl to a list of GEOSGeometry objects """
-    items = []
+    The first node is kept when a node id appears more than once.
+    """
+    index = {}
+    for node in root.iterfind("node"):
+        index.setdefault(node.get("id"), _get_node_coords(node))
 
-    root = _get_xml_obj(osm_xml)
+    return index
 
-    for way in root.findall("way"):
-        geom = None
-        points = []
-        for nd in way.findall("nd"):
-            points.append(_get_node(nd.get("ref"), root))
+
+def _parse_way(way, node_index, include_osm_id=False):
+    """Returns the item dict of a way element, None if it has no geometry."""
+    geom = None
+    points = [node_index.get(nd.get("ref")) for nd in way.iterfind("nd")]
+    try:
+        geom = Polygon(points, srid=4326)
+    except Exception:
         try:
-            geom = Polygon(points)
-        except Exception:
-            try:
-                geom = LineString(points)
-            except Exception as e:
-                print(way.values(), e)
-                pass
-
-        if geom:
-            tags = parse_osm_tags(way, include_osm_id)
-            items.append(
-                {
-                    "osm_id": way.get("id"),
-                    "geom": geom,
-                    "tags": tags,
-                    "osm_type": "way",
-                }
-            )
+            geom = LineString(points, srid=4326)
+        except Exception as e:
+            print(way.values(), e)
 
-    return items
+    if geom:
+        return {
+            "osm_id": way.get("id"),
+            "geom": geom,
+            "tags": parse_osm_tags(way, include_osm_id),
+            "osm_type": "way",
+        }
 
+    return None
 
-def parse_osm_nodes(osm_xml, include_osm_id=False):
-    """Converts an OSM XMl to a list of GEOSGeometry objects """
-    items = []
 
-    root = _get_xml_obj(osm_xml)
+def _parse_node(node, include_osm_id=False):
+    return {
+        "osm_id": node.get("id"),
+        "geom": Point(*_get_node_coords(node), srid=4326),
+        "tags": parse_osm_tags(node, include_osm_id),
+        "osm_type": "node",
+    }
 
-    for node in root.findall("node"):
-        x, y = float(node.get("lon")), float(node.get("lat"))
-        point = Point(x, y)
-        tags = parse_osm_tags(node, include_osm_id)
-        items.append(
-            {
-                "osm_id": node.get("id"),
-                "geom": point,
-                "tags": tags,
-                "osm_type": "node",
-            }
-        )
+
+def _parse_ways(root, include_osm_id=False, node_index=None):
+    if node_index is None:
+        node_index = get_node_index(root)
+    items = []
+    for way in root.iterfind("way"):
+        item = _parse_way(way, node_index, include_osm_id)
+        if item:
+            items.append(item)
 
     return items
 
 
+def _parse_nodes(root, include_osm_id=False):
+    return [
+        _parse_node(node, include_osm_id) for node in root.iterfind("node")
+    ]
+
+
+def parse_osm_ways(osm_xml, include_osm_id=False):
+    """Converts an OSM XMl to a list of GEOSGeometry objects """
+    return _parse_ways(_get_xml_obj(osm_xml), include_osm_id)
+
+
+def parse_osm_nodes(osm_xml, include_osm_id=False):
+    """Converts an OSM XMl to a list of GEOSGeometry objects """
+    return _parse_nodes(_get_xml_obj(osm_xml), include_osm_id)
+
+
 def parse_osm_tags(node, include_osm_id=False):
     """Retrieves all the tags from a osm xml node"""
     tags = {} if not include_osm_id else {node.tag + ":id": node.get("id")}
@@ -98,15 +107,47 @@ def parse_osm_tags(node, include_osm_id=False):
 
 
 def parse_osm(osm_xml, include_osm_id=False):
-    result = []
-    ways = parse_osm_ways(osm_xml, include_osm_id)
-    result.extend(ways)
-    nodes = parse_osm_nodes(osm_xml, include_osm_id)
-    result.extend(nodes)
+    """Converts an OSM XML to a list of ways followed by a list of nodes.
+
+    The XML is parsed once and way node references are resolved from a node
+    index.
+    """
+    root = _get_xml_obj(osm_xml)
+    result = _parse_ways(root, include_osm_id)
+    result.extend(_parse_nodes(root, include_osm_id))
 
     return result
 
 
+def iter_osm(source, include_osm_id=False, osm_type=None):
+    """Yields the ways and nodes of an OSM XML file in document order.
+
+    source is a file path or file object, elements are parsed with iterparse
+    and released once processed so memory use is limited to the node
+    coordinate index. Way node references are resolved against nodes that
+    appear before the way, as they do in OSM extracts. Set osm_type to "way"
+    or "node" to only yield items of that type.
+    """
+    node_index = {}
+    for _event, element in etree.iterparse(
+        source, events=("end",), tag=("node", "way")
+    ):
+        if element.tag == "node":
+            node_index.setdefault(
+                element.get("id"), _get_node_coords(element)
+            )
+            if osm_type in (None, "node"):
+                yield _parse_node(element, include_osm_id)
+        elif osm_type in (None, "way"):
+            item = _parse_way(element, node_index, include_osm_id)
+            if item:
+                yield item
+
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+
 def clean_osm_file_with_db(osm_file, output_file):
     """
     Goes through the provided XML and removes any structures
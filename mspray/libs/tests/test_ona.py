@@ -3,12 +3,22 @@
 Test ona module
 """
 import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest.mock import call, patch
+from urllib.parse import parse_qs, urlparse
 
 import requests
 from django.test import TestCase
 from httmock import HTTMock, urlmatch
 
-from mspray.libs.ona import fetch_form_data, fetch_osm_xml
+from mspray.libs.ona import (
+    fetch_form_data,
+    fetch_osm_xml,
+    fetch_submissions,
+    iter_form_changes,
+    iter_form_data,
+)
 
 # pylint: disable=line-too-long
 OSMXML = """<?xml version='1.0' encoding='UTF-8' ?><osm version="0.6" generator="OpenMapKit 0.7" user="theoutpost"><node id="-1943" lat="-11.202901601" lon="28.883830387" /><node id="-1946" lat="-11.202926082" lon="28.883944473" /><node id="-1945" lat="-11.202845645" lon="28.88396943" /><node id="-1944" lat="-11.202821164" lon="28.883858908" /><node id="-1943" lat="-11.202901601" lon="28.883830387" /><way id="-1942" action="modify"><nd ref="-1943" /><nd ref="-1946" /><nd ref="-1945" /><nd ref="-1944" /><nd ref="-1943" /><tag k="Shape_Area" v="0.00000000969" /><tag k="district_1" v="Mansa" /><tag k="manual_c_1" v="Targeted" /><tag k="OBJECTID" v="79621" /><tag k="rank_1" v="300.000000" /><tag k="province_1" v="Luapula" /><tag k="Shape_Leng" v="0.00039944548" /><tag k="psa_id_1" v="300 / 450" /><tag k="y" v="-11.20287380280" /><tag k="x3" v="28.88390064920" /><tag k="structur_1" v="450.000000" /><tag k="id" v="300 / 450_Mansa" /><tag k="spray_status" v="yes" /></way></osm>"""  # noqa
@@ -57,6 +67,40 @@ def onaio_json_mock(url, request):  # pylint: disable=unused-argument
     return response
 
 
+STUB_SUBMISSIONS = [{"_id": i, "name": "record %d" % i} for i in range(1, 26)]
+
+
+class OnaStubHandler(BaseHTTPRequestHandler):
+    """
+    Stub Ona API data endpoint, supports page, page_size and _id $in queries.
+    """
+
+    requests = []
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Respond with submissions matching the query parameters."""
+        params = parse_qs(urlparse(self.path).query)
+        self.requests.append(params)
+        records = STUB_SUBMISSIONS
+        if "query" in params:
+            dataids = json.loads(params["query"][0])["_id"]["$in"]
+            records = [r for r in records if r["_id"] in dataids]
+        if "page" in params:
+            page = int(params["page"][0])
+            page_size = int(params["page_size"][0])
+            records = records[(page - 1) * page_size:page * page_size]
+
+        content = json.dumps(records).encode()
+        self.send_response(200 if records else 404)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
 class TestOna(TestCase):
     """
     Test ona util functions.
@@ -82,3 +126,157 @@ class TestOna(TestCase):
 
             data = fetch_form_data(3563261, 3563260)
             self.assertEqual(SUBMISSION_DATA[0], data[0])
+
+
+class TestOnaClient(TestCase):
+    """
+    Test the Ona client against a local stub HTTP server.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestOnaClient, cls).setUpClass()
+        cls.server = HTTPServer(("127.0.0.1", 0), OnaStubHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.ona_uri = "http://127.0.0.1:{}".format(cls.server.server_port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(TestOnaClient, cls).tearDownClass()
+
+    def setUp(self):
+        OnaStubHandler.requests = []
+
+    def test_fetch_submissions(self):
+        """
+        Test fetch_submissions() fetches records in chunks of ids.
+        """
+        dataids = [1, 3, 5, 7, 9, 11, 30]
+        with patch("mspray.libs.ona.ONA_URI", self.ona_uri):
+            records = list(fetch_submissions(1, dataids, chunk_size=3))
+
+        self.assertEqual(
+            sorted(record["_id"] for record in records), [1, 3, 5, 7, 9, 11]
+        )
+        self.assertEqual(len(OnaStubHandler.requests), 3)
+
+        with patch("mspray.libs.ona.ONA_URI", self.ona_uri):
+            records = list(
+                fetch_submissions(1, dataids, chunk_size=3, workers=1)
+            )
+        self.assertEqual(
+            [record["_id"] for record in records], [1, 3, 5, 7, 9, 11]
+        )
+
+    @patch("mspray.libs.ona._get")
+    def test_fetch_submissions_failure(self, get_mock):
+        """
+        Test fetch_submissions() logs the ids of chunks that fail.
+        """
+        get_mock.return_value.status_code = 500
+        with self.assertLogs("mspray.libs.ona", level="ERROR") as logs:
+            records = list(fetch_submissions(1, [5, 1, 3], workers=1))
+        self.assertEqual(records, [])
+        self.assertIn(
+            "Fetching submissions 1 to 5 of form 1 failed with status 500",
+            logs.output[0],
+        )
+
+        get_mock.side_effect = requests.exceptions.Timeout("timed out")
+        with self.assertLogs("mspray.libs.ona", level="ERROR") as logs:
+            records = list(fetch_submissions(1, [5, 1, 3], workers=1))
+        self.assertEqual(records, [])
+        self.assertIn("timed out", logs.output[0])
+
+    @patch("mspray.libs.ona._fetch_chunk")
+    def test_fetch_submissions_bounded(self, fetch_chunk_mock):
+        """
+        Test fetch_submissions() requests at most workers * 2 chunks ahead of
+        the records yielded.
+        """
+        fetch_chunk_mock.side_effect = lambda formid, dataids: [
+            {"_id": dataid} for dataid in dataids
+        ]
+        records = fetch_submissions(1, range(20), chunk_size=1, workers=2)
+        first = next(records)
+        self.assertLessEqual(fetch_chunk_mock.call_count, 4)
+
+        self.assertEqual(
+            sorted([first["_id"]] + [record["_id"] for record in records]),
+            list(range(20)),
+        )
+        self.assertEqual(fetch_chunk_mock.call_count, 20)
+
+    def test_iter_form_data(self):
+        """
+        Test iter_form_data() pages through all records.
+        """
+        with patch("mspray.libs.ona.ONA_URI", self.ona_uri):
+            records = list(iter_form_data(1, page_size=10))
+
+        self.assertEqual(records, STUB_SUBMISSIONS)
+        self.assertEqual(
+            [params["page"] for params in OnaStubHandler.requests],
+            [["1"], ["2"], ["3"]],
+        )
+
+    def test_iter_form_data_strict(self):
+        """
+        Test iter_form_data() raises on failed pages when strict is True.
+        """
+        with patch("mspray.libs.ona.ONA_URI", self.ona_uri):
+            # a 404 past the last page ends the iteration
+            records = list(iter_form_data(1, page_size=5, strict=True))
+            self.assertEqual(records, STUB_SUBMISSIONS)
+
+            with self.assertRaises(requests.HTTPError):
+                list(
+                    iter_form_data(
+                        1, query={"_id": {"$in": [100]}}, strict=True
+                    )
+                )
+
+    @patch("mspray.libs.ona.iter_form_data")
+    def test_iter_form_changes(self, iter_form_data_mock):
+        """
+        Test iter_form_changes() queries records edited since last_edited and
+        records submitted after last_id.
+        """
+        iter_form_data_mock.return_value = [{"_id": 1}]
+        self.assertEqual(
+            list(iter_form_changes(1, page_size=10)), [{"_id": 1}]
+        )
+        iter_form_data_mock.assert_called_once_with(
+            1, query={"_edited": "true"}, page_size=10, strict=True
+        )
+
+        iter_form_data_mock.reset_mock()
+        iter_form_data_mock.side_effect = [[{"_id": 1}], [{"_id": 5}]]
+        self.assertEqual(
+            list(
+                iter_form_changes(
+                    1, "2018-11-28T10:31:17", last_id=4, page_size=10
+                )
+            ),
+            [{"_id": 1}, {"_id": 5}],
+        )
+        iter_form_data_mock.assert_has_calls(
+            [
+                call(
+                    1,
+                    query={
+                        "_edited": "true",
+                        "_last_edited": {"$gte": "2018-11-28T10:31:17"},
+                    },
+                    page_size=10,
+                    strict=True,
+                ),
+                call(
+                    1, query={"_id": {"$gt": 4}}, page_size=10, strict=True
+                ),
+            ]
+        )
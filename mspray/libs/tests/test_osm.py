@@ -2,10 +2,13 @@
 """
 Test osm module.
 """
+from io import BytesIO
+
 from django.contrib.gis.geos import Point, Polygon
 from django.test import TestCase
 
-from mspray.libs.osm import parse_osm_nodes, parse_osm_ways
+from mspray.libs.osm import iter_osm, parse_osm, parse_osm_nodes
+from mspray.libs.osm import parse_osm_ways
 
 OSMWAY = """
 <?xml version="1.0" encoding="UTF-8"?>
@@ -65,3 +68,33 @@ class TestOsm(TestCase):
         self.assertTrue(len(nodes) > 0)
         node = nodes[0]
         self.assertIsInstance(node["geom"], Point)
+
+    def test_parse_osm(self):
+        """Test parse_osm() returns ways followed by nodes"""
+        items = parse_osm(OSMWAY.strip(), include_osm_id=True)
+        self.assertEqual(
+            [item["osm_type"] for item in items], ["way"] + ["node"] * 5
+        )
+        way = items[0]
+        self.assertEqual(way["osm_id"], "-1942")
+        self.assertEqual(way["tags"]["way:id"], "-1942")
+        self.assertEqual(
+            way["geom"].coords[0],
+            ((28.883830387, -11.202901601), (28.883944473, -11.202926082),
+             (28.88396943, -11.202845645), (28.883858908, -11.202821164),
+             (28.883830387, -11.202901601))
+        )
+
+    def test_iter_osm(self):
+        """Test iter_osm() yields the same items as parse_osm()"""
+        xml = OSMWAY.strip().replace(' action="modify"', "").encode()
+        expected = parse_osm(xml)
+        items = list(iter_osm(BytesIO(xml)))
+
+        self.assertEqual(len(items), len(expected))
+        # nodes come before ways in document order
+        self.assertEqual(items[-1]["osm_type"], "way")
+        self.assertEqual(items[-1]["geom"], expected[0]["geom"])
+        self.assertEqual(items[-1]["tags"], expected[0]["tags"])
+        ways = list(iter_osm(BytesIO(xml), osm_type="way"))
+        self.assertEqual([way["osm_id"] for way in ways], ["-1942"])
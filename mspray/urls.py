@@ -23,6 +23,7 @@ from mspray.apps.main.views import (
     spray_operator_daily,
     sprayday,
     target_area,
+    tiles,
     user,
 )
 from mspray.apps.main.views.decision import DecisionView
@@ -97,6 +98,11 @@ urlpatterns = [  # pylint: disable=C0103
         name="target_area",
     ),
     path("sprayareas", home.SprayAreaView.as_view(), name="sprayareas"),
+    path(
+        "tiles/<str:layer>/<int:z>/<int:x>/<int:y>.mvt",
+        tiles.TileView.as_view(),
+        name="tiles",
+    ),
     path(
         "detailed-sprayareas/",
         home.DetailedCSVView.as_view(),